@@ -0,0 +1,95 @@
+"""
+Benchmark multi-threaded Chatbot.prompt() throughput against a local mock
+server, with 1, 2, 4, ... threads up to --threads, and report the scaling
+efficiency of each thread count: its throughput divided by the single-thread
+throughput times the number of threads.
+
+On free-threaded CPython (python3.13t and later, with the GIL disabled) the
+client threads run in parallel, and throughput should scale nearly linearly
+until the cores or the mock server are saturated. With the GIL the client
+threads serialize, and this measures contention only. The mock server is a
+smarter.testing.FakeServer in --server-processes processes that share one
+port, so that it is not the bottleneck.
+
+With --fresh each prompt goes to a new Chatbot restored from a snapshot, the
+way Chatbots.get() serves cache hits, which exercises the lazy initialization
+of its properties in every thread.
+
+usage: python -m benchmarks.free_threading [--threads 16] [--prompts 2000] [--server-processes 4] [--fresh]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from smarter.common.const import PROJECT_ROOT
+from smarter.resources import Chatbot
+from smarter.resources.models.chatbot import ChatbotModel
+from smarter.resources.snapshot import ChatbotSnapshot
+from smarter.testing import FakeServer
+
+
+API_KEY = "0123456789abcdef0123456789abcdef0123456789abcdef0123456789abcdef"
+
+
+def run(threads: int, prompts: int, base_url: str, snapshot: ChatbotSnapshot, fresh: bool) -> float:
+    """Send prompts prompts from threads threads and return the prompts per second."""
+    shared = Chatbot(api_key=API_KEY, snapshot=snapshot, base_url=base_url)
+    per_thread = prompts // threads
+    barrier = threading.Barrier(threads + 1)
+    errors = []
+
+    def work():
+        barrier.wait()
+        try:
+            for _ in range(per_thread):
+                chatbot = Chatbot(api_key=API_KEY, snapshot=snapshot, base_url=base_url) if fresh else shared
+                chatbot.prompt("hello")
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            errors.append(e)
+
+    workers = [threading.Thread(target=work, daemon=True) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--prompts", type=int, default=2000)
+    parser.add_argument("--server-processes", type=int, default=4)
+    parser.add_argument("--fresh", action="store_true")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with open(os.path.join(PROJECT_ROOT, "resources/data/chatbot.json"), encoding="utf-8") as f:
+        snapshot = ChatbotSnapshot.from_model(ChatbotModel(**json.load(f)))
+    with FakeServer.subprocess(processes=args.server_processes) as server:
+        base_url = server.url
+        run(1, 100, base_url, snapshot, args.fresh)
+        gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+        print(f"python {sys.version.split()[0]}, gil {'enabled' if gil else 'disabled'}, {os.cpu_count()} cpus")
+        print(f"{'threads':>8} {'prompts/s':>10} {'efficiency':>11}")
+        baseline = None
+        threads = 1
+        while threads <= args.threads:
+            throughput = run(threads, args.prompts, base_url, snapshot, args.fresh)
+            baseline = baseline or throughput
+            print(f"{threads:>8} {throughput:>10.0f} {throughput / (baseline * threads):>11.0%}")
+            threads *= 2
+
+
+if __name__ == "__main__":
+    main()
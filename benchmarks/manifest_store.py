@@ -0,0 +1,84 @@
+"""
+Benchmark ManifestStore against a plain dict of ChatbotModel manifests by loading
+a synthetic chatbot fleet. Each manifest is parsed from its own json document,
+the way that describe api responses arrive, so that nothing is shared by accident.
+
+usage: python -m benchmarks.manifest_store [--size 10000] [--configs 25]
+"""
+
+import argparse
+import copy
+import json
+import os
+import time
+import tracemalloc
+
+from smarter.common.const import PROJECT_ROOT
+from smarter.resources.models.chatbot import ChatbotModel
+from smarter.resources.store import ManifestStore
+
+
+MODELS = ["gpt-4o", "gpt-4o-mini", "o3-mini", "gpt-4.1", "gpt-4.1-mini"]
+
+
+def synthetic_fleet(size: int, configs: int) -> list:
+    """Return size json documents for chatbots that share configs distinct config blocks."""
+    with open(os.path.join(PROJECT_ROOT, "resources/data/chatbot.json"), encoding="utf-8") as f:
+        template = json.load(f)
+    documents = []
+    for i in range(size):
+        data = copy.deepcopy(template)
+        name = f"chatbot-{i:05d}"
+        data["data"]["metadata"]["name"] = name
+        config = data["data"]["spec"]["config"]
+        variant = i % configs
+        config["defaultModel"] = MODELS[variant % len(MODELS)]
+        config["defaultSystemRole"] = f"You are support chatbot persona #{variant}. " + config["defaultSystemRole"]
+        status = data["data"]["status"]
+        for key in ["defaultHost", "hostname", "url", "urlChatapp"]:
+            status[key] = status[key].replace("netec-demo.", f"{name}.")
+        for key in ["sandboxHost", "sandboxUrl", "urlChatbot"]:
+            status[key] = status[key].replace("/chatbots/36/", f"/chatbots/{i + 100}/")
+        documents.append(json.dumps(data))
+    return documents
+
+
+def measure(load) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--configs", type=int, default=25)
+    args = parser.parse_args()
+
+    documents = synthetic_fleet(args.size, args.configs)
+
+    def load_plain():
+        return {m.data.metadata.name: m for m in (ChatbotModel(**json.loads(doc)) for doc in documents)}
+
+    def load_store():
+        store = ManifestStore()
+        for doc in documents:
+            store.add(json.loads(doc))
+        return store
+
+    plain, plain_time, plain_bytes = measure(load_plain)
+    store, store_time, store_bytes = measure(load_store)
+    assert len(plain) == len(store) == args.size
+
+    print(f"{'':<14} {'load s':>8} {'traced MB':>10} {'bytes/chatbot':>14}")
+    for label, elapsed, nbytes in [("dict", plain_time, plain_bytes), ("ManifestStore", store_time, store_bytes)]:
+        print(f"{label:<14} {elapsed:>8.2f} {nbytes / 2**20:>10.1f} {nbytes // args.size:>14}")
+    print(json.dumps(store.stats(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark the SmarterValidator batch helpers against the per-item loop that
+bulk imports used previously: re.match() with a raw pattern string, one call
+per value, and a try/except around each validation.
+
+usage: python -m benchmarks.validators [--size 10000] [--repeat 5]
+"""
+
+import argparse
+import random
+import re
+import timeit
+
+from smarter.common.exceptions import SmarterValueError
+from smarter.common.validators import SmarterValidator
+
+
+def legacy_validate_account_number(account_number: str) -> None:
+    if not re.match(SmarterValidator.VALID_ACCOUNT_NUMBER_PATTERN, account_number):
+        raise SmarterValueError(f"Invalid account number {account_number}")
+
+
+def legacy_validate_session_key(session_key: str) -> None:
+    if not re.match(SmarterValidator.VALID_SESSION_KEY, session_key):
+        raise SmarterValueError(f"Invalid session key {session_key}")
+
+
+def legacy_validate_hostname(hostname: str) -> None:
+    if ":" in hostname:
+        hostname, port = hostname.split(":")
+        if not port.isdigit() or not 0 <= int(port) <= 65535:
+            raise SmarterValueError(f"Invalid port {port}")
+    if len(hostname) > 255:
+        raise SmarterValueError(f"Invalid hostname {hostname}")
+    if hostname[-1] == ".":
+        hostname = hostname[:-1]
+    allowed = re.compile(SmarterValidator.VALID_HOSTNAME_PATTERN, re.IGNORECASE)
+    if all(allowed.match(x) for x in hostname.split(".")):
+        return
+    raise SmarterValueError(f"Invalid hostname {hostname}")
+
+
+def legacy_loop(values, validator) -> list:
+    """Collect all failures the only way the previous api allowed: one try/except per value."""
+    failures = []
+    for i, value in enumerate(values):
+        try:
+            validator(value)
+        except SmarterValueError:
+            failures.append((i, value))
+    return failures
+
+
+def make_dataset(size: int, error_rate: float = 0.01) -> dict:
+    rnd = random.Random(42)
+    account_numbers = ["-".join(f"{rnd.randint(0, 9999):04d}" for _ in range(3)) for _ in range(size)]
+    session_keys = ["".join(rnd.choice("0123456789abcdef") for _ in range(64)) for _ in range(size)]
+    # bulk imports see the same handful of domains over and over again.
+    domains = [f"bot-{rnd.randint(0, 50)}.3141-5926-5359.api.smarter.sh" for _ in range(size)]
+    for values in (account_numbers, session_keys, domains):
+        for i in rnd.sample(range(size), int(size * error_rate)):
+            values[i] = "not valid!"
+    return {"account_numbers": account_numbers, "session_keys": session_keys, "domains": domains}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = make_dataset(args.size)
+    cases = [
+        (
+            "account numbers",
+            data["account_numbers"],
+            legacy_validate_account_number,
+            SmarterValidator.batch_validate_account_numbers,
+        ),
+        (
+            "session keys",
+            data["session_keys"],
+            legacy_validate_session_key,
+            SmarterValidator.batch_validate_session_keys,
+        ),
+        ("domains", data["domains"], legacy_validate_hostname, SmarterValidator.batch_validate_domains),
+    ]
+    print(f"{'case':<16} {'values':>8} {'loop ms':>10} {'batch ms':>10} {'speedup':>8}")
+    for name, values, legacy, batch in cases:
+        assert legacy_loop(values, legacy) == batch(values)
+        loop_time = min(timeit.repeat(lambda: legacy_loop(values, legacy), number=1, repeat=args.repeat))
+        batch_time = min(timeit.repeat(lambda: batch(values), number=1, repeat=args.repeat))
+        print(
+            f"{name:<16} {len(values):>8} {loop_time * 1000:>10.2f} {batch_time * 1000:>10.2f} "
+            f"{loop_time / batch_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
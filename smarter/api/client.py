@@ -3,19 +3,53 @@ smarter-api Client.
 """
 
 import logging
-from functools import cached_property
-
-from cachetools import LRUCache
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Tuple
 
+from smarter.cache.backends import CacheBackend
+from smarter.cache.prompt import PromptCache
+from smarter.common import forking
 from smarter.common.classes import ApiBase
 from smarter.common.conf import settings as smarter_settings
+from smarter.common.const import (
+    SMARTER_DEFAULT_MAX_CONCURRENCY,
+    SMARTER_DEFAULT_PAGE_SIZE,
+)
+from smarter.common.exceptions import SmarterValueError
 from smarter.common.mixins import SmarterHelperMixin
+from smarter.common.models.whoami import WhoAmIModel
+from smarter.common.sync import LockedLRUCache, lazy_property
 from smarter.resources import Chatbot
+from smarter.resources.models.chatbot import (
+    ChatbotListItemModel,
+    ChatbotListModel,
+    ChatbotModel,
+)
+from smarter.resources.snapshot import ChatbotSnapshot
+from smarter.traffic.concurrency import ConcurrencyLimiter
+from smarter.traffic.hedging import Hedger
+from smarter.traffic.keys import ApiKeyPool
+from smarter.traffic.ratelimit import RateLimiter
+from smarter.traffic.scheduler import RequestScheduler
+from smarter.traffic.timeouts import AdaptiveTimeouts
+from smarter.usage.ledger import UsageLedger
+
+from .state import (
+    STATE_FORMAT_VERSION,
+    ClientStateModel,
+    api_key_fingerprint,
+    read_state,
+    resolved_settings,
+    write_state,
+)
 
 
 logger = logging.getLogger(__name__)
 
-RESOURCE_CACHE = LRUCache(maxsize=smarter_settings.smarter_max_cache_size)
+RESOURCE_CACHE = LockedLRUCache(maxsize=smarter_settings.smarter_max_cache_size)
 
 
 class ResourceBaseClass(SmarterHelperMixin):
@@ -23,34 +57,150 @@ class ResourceBaseClass(SmarterHelperMixin):
 
     _api_key: str = None
     _timeout: int = None
+    _prompt_cache: PromptCache = None
+    _rate_limiter: RateLimiter = None
+    _concurrency_limiter: ConcurrencyLimiter = None
+    _scheduler: RequestScheduler = None
+    _key_pool: ApiKeyPool = None
+    _hedger: Hedger = None
+    _adaptive_timeouts: AdaptiveTimeouts = None
+    _shared_cache: CacheBackend = None
+    _usage_ledger: UsageLedger = None
+    _base_url: str = None
 
-    def __init__(self, api_key: str = None, timeout: int = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        timeout: int = None,
+        prompt_cache: PromptCache = None,
+        rate_limiter: RateLimiter = None,
+        concurrency_limiter: ConcurrencyLimiter = None,
+        scheduler: RequestScheduler = None,
+        key_pool: ApiKeyPool = None,
+        hedger: Hedger = None,
+        adaptive_timeouts: AdaptiveTimeouts = None,
+        shared_cache: CacheBackend = None,
+        usage_ledger: UsageLedger = None,
+        base_url: str = None,
+    ):
         super().__init__()
+        self._lock = threading.Lock()
+        forking.register(self)
         self._api_key = api_key
         self._timeout = timeout
+        self._prompt_cache = prompt_cache
+        self._rate_limiter = rate_limiter
+        self._concurrency_limiter = concurrency_limiter
+        self._scheduler = scheduler
+        self._key_pool = key_pool
+        self._hedger = hedger
+        self._adaptive_timeouts = adaptive_timeouts
+        self._shared_cache = shared_cache
+        self._usage_ledger = usage_ledger
+        self._base_url = base_url
 
-    @cached_property
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    @lazy_property
     def api_key(self) -> str:
-        return self._api_key
+        return self._api_key or smarter_settings.smarter_api_key.get_secret_value()
 
-    @cached_property
+    @lazy_property
     def timeout(self) -> int:
         return self._timeout
 
+    @lazy_property
+    def prompt_cache(self) -> PromptCache:
+        return self._prompt_cache
+
+    @lazy_property
+    def rate_limiter(self) -> RateLimiter:
+        return self._rate_limiter
+
+    @lazy_property
+    def concurrency_limiter(self) -> ConcurrencyLimiter:
+        return self._concurrency_limiter
+
+    @lazy_property
+    def scheduler(self) -> RequestScheduler:
+        return self._scheduler
+
+    @lazy_property
+    def key_pool(self) -> ApiKeyPool:
+        return self._key_pool
+
+    @lazy_property
+    def hedger(self) -> Hedger:
+        return self._hedger
+
+    @lazy_property
+    def adaptive_timeouts(self) -> AdaptiveTimeouts:
+        return self._adaptive_timeouts
+
+    @lazy_property
+    def shared_cache(self) -> CacheBackend:
+        return self._shared_cache
+
+    @lazy_property
+    def usage_ledger(self) -> UsageLedger:
+        return self._usage_ledger
+
+    @lazy_property
+    def base_url(self) -> str:
+        return self._base_url
+
     def get_from_cache(self, cache_key: str) -> any:
         """
-        Get a resource from the cache.
+        Get a resource from the cache, or from the shared cache backend, if there is one.
         """
-        if cache_key in RESOURCE_CACHE:
+        resource = RESOURCE_CACHE.get(cache_key)
+        if resource is not None:
             logger.debug("Cache hit for %s", cache_key)
-            return RESOURCE_CACHE[cache_key]
+            return resource
+        if self.shared_cache is not None:
+            snapshot = self.shared_cache.get(cache_key)
+            if snapshot is not None:
+                logger.debug("Shared cache hit for %s", cache_key)
+                RESOURCE_CACHE[cache_key] = snapshot
+                return snapshot
         return None
 
+    def get_many_from_cache(self, cache_keys: Iterable[str]) -> Dict[str, any]:
+        """
+        Get many resources from the cache. The misses are looked up in the shared
+        cache backend, if there is one, in a single batch.
+        """
+        found = {cache_key: RESOURCE_CACHE.get(cache_key) for cache_key in cache_keys}
+        found = {cache_key: resource for cache_key, resource in found.items() if resource is not None}
+        misses = [cache_key for cache_key in cache_keys if cache_key not in found]
+        if misses and self.shared_cache is not None:
+            shared = self.shared_cache.get_many(misses)
+            for cache_key, resource in shared.items():
+                RESOURCE_CACHE[cache_key] = resource
+            found.update(shared)
+        return found
+
     def save_to_cache(self, cache_key: str, resource: any) -> None:
         """
-        Save a resource to the cache.
+        Save a resource to the cache. Chatbot snapshots and models are also saved
+        to the shared cache backend, if there is one.
         """
         RESOURCE_CACHE[cache_key] = resource
+        if self.shared_cache is not None and isinstance(resource, (ChatbotSnapshot, ChatbotModel)):
+            self.shared_cache.set(cache_key, resource)
+
+
+@dataclass
+class ChatbotsResult:
+    """Results of a bulk Chatbots.get_many() call, keyed by chatbot name."""
+
+    chatbots: Dict[str, Chatbot] = field(default_factory=dict)
+    errors: Dict[str, Exception] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
 
 
 class Chatbots(ResourceBaseClass):
@@ -60,18 +210,165 @@ class Chatbots(ResourceBaseClass):
 
     def get(self, chatbot_id: int = None, name: str = None) -> Chatbot:
         """
-        Gets a chatbot by id.
+        Gets a chatbot by id. The resource cache holds compact ChatbotSnapshot
+        objects rather than live Chatbot instances, so cache hits are rebuilt
+        from the snapshot without making any api requests.
         """
         cache_key = self.cache_key(chatbot_id or name)
-        chatbot = self.get_from_cache(cache_key)
-        if chatbot:
-            return chatbot
-        chatbot = Chatbot(api_key=self.api_key, chatbot_id=chatbot_id, name=name, timeout=self.timeout)
-        self.save_to_cache(cache_key, chatbot)
+        snapshot = self.get_from_cache(cache_key)
+        if snapshot:
+            return self.chatbot(snapshot=snapshot)
+        if self.shared_cache is not None:
+            # backends that are shared between processes let only one of them describe the chatbot.
+            fetched = []
+
+            def fetch() -> ChatbotSnapshot:
+                fetched.append(self.chatbot(chatbot_id=chatbot_id, name=name))
+                return fetched[0].snapshot
+
+            snapshot = self.shared_cache.refresh(cache_key, fetch)
+            RESOURCE_CACHE[cache_key] = snapshot
+            return fetched[0] if fetched else self.chatbot(snapshot=snapshot)
+        chatbot = self.chatbot(chatbot_id=chatbot_id, name=name)
+        self.save_to_cache(cache_key, chatbot.snapshot)
         return chatbot
 
+    def chatbot(self, **kwargs) -> Chatbot:
+        """
+        Creates a Chatbot that shares this resource's api key, timeout and prompt cache.
+        """
+        return Chatbot(
+            api_key=self.api_key,
+            timeout=self.timeout,
+            prompt_cache=self.prompt_cache,
+            rate_limiter=self.rate_limiter,
+            concurrency_limiter=self.concurrency_limiter,
+            scheduler=self.scheduler,
+            key_pool=self.key_pool,
+            hedger=self.hedger,
+            adaptive_timeouts=self.adaptive_timeouts,
+            usage_ledger=self.usage_ledger,
+            base_url=self.base_url,
+            **kwargs,
+        )
+
+    def get_many(self, names: Iterable[str], max_concurrency: int = SMARTER_DEFAULT_MAX_CONCURRENCY) -> ChatbotsResult:
+        """
+        Gets many chatbots by name. Cache hits are served immediately, duplicate
+        names are only fetched once, and the cache misses are described concurrently
+        over the shared connection pool. Errors are collected per name rather
+        than raised, so one bad name doesn't prevent the rest from being fetched.
+        """
+        names = list(dict.fromkeys(names))
+        result = ChatbotsResult()
+        misses = []
+        cached = self.get_many_from_cache([self.cache_key(name) for name in names])
+        for name in names:
+            snapshot = cached.get(self.cache_key(name))
+            if snapshot:
+                result.chatbots[name] = self.chatbot(snapshot=snapshot)
+            else:
+                misses.append(name)
+
+        if misses:
+            max_workers = max(1, min(max_concurrency, len(misses)))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smarter-chatbots-get") as executor:
+                futures = {executor.submit(self.get, name=name): name for name in misses}
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        result.chatbots[name] = future.result()
+                    # pylint: disable=broad-exception-caught
+                    except Exception as e:
+                        logger.warning("%s.get_many() %s: %s", self.formatted_class_name, name, e)
+                        result.errors[name] = e
+
+        # return the chatbots in the order in which they were requested.
+        result.chatbots = {name: result.chatbots[name] for name in names if name in result.chatbots}
+        logger.debug(
+            "%s.get_many() names=%s cache_hits=%s errors=%s",
+            self.formatted_class_name,
+            len(names),
+            len(names) - len(misses),
+            len(result.errors),
+        )
+        return result
+
+    def list_page(self, page: int = 1, page_size: int = SMARTER_DEFAULT_PAGE_SIZE) -> List[ChatbotListItemModel]:
+        """
+        Gets one page of chatbot summaries from the list endpoint.
+        """
+        url_endpoint = f"cli/get/chatbot/?page={page}&page_size={page_size}"
+        response = ApiBase(
+            api_key=self.api_key,
+            url_endpoint=url_endpoint,
+            model_class=ChatbotListModel,
+            timeout=self.timeout,
+            hedger=self.hedger,
+            adaptive_timeouts=self.adaptive_timeouts,
+            base_url=self.base_url,
+        )
+        return response.model.data.items
+
+    def list(
+        self,
+        page_size: int = SMARTER_DEFAULT_PAGE_SIZE,
+        prefetch: bool = True,
+        errors: Dict[str, Exception] = None,
+    ) -> Iterator[Chatbot]:
+        """
+        Lazily iterates over all chatbots, page by page. While the caller works
+        through the current page the next page is fetched, and its chatbots are
+        described with get_many(), in the background. The resource cache is
+        filled as the iteration goes and cached chatbots are not described again.
+
+        Iteration ends at the first short page, or at the first page that adds no
+        new chatbots, so that it also ends if the server ignores the page parameters.
+
+        A chatbot that can't be described is logged and skipped, rather than ending
+        the iteration, and its error is added to errors, if a dict is passed in.
+        """
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smarter-chatbots-list") if prefetch else None
+        try:
+            seen = set()
+            page = 1
+            future: Future = executor.submit(self.list_chatbots_page, page, page_size) if prefetch else None
+            while True:
+                items, result = future.result() if future is not None else self.list_chatbots_page(page, page_size)
+                names = [name for name in dict.fromkeys(item.name for item in items) if name not in seen]
+                more = bool(names) and len(items) >= page_size
+                future = executor.submit(self.list_chatbots_page, page + 1, page_size) if more and prefetch else None
+                logger.debug(
+                    "%s.list() page=%s items=%s new=%s", self.formatted_class_name, page, len(items), len(names)
+                )
+                for name in names:
+                    seen.add(name)
+                    if name in result.errors:
+                        # get_many() has already logged the error.
+                        if errors is not None:
+                            errors[name] = result.errors[name]
+                        continue
+                    yield result.chatbots[name]
+                if not more:
+                    break
+                page += 1
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def list_chatbots_page(self, page: int, page_size: int) -> Tuple[List[ChatbotListItemModel], ChatbotsResult]:
+        """
+        Gets one page of chatbot summaries, and the chatbots on the page.
+        """
+        items = self.list_page(page, page_size)
+        return items, self.get_many([item.name for item in items])
+
     def cache_key(self, key_data) -> str:
-        return f"Chatbot_{key_data}"
+        """
+        Cache keys are scoped to the api key, so that a chatbot that was described
+        with one api key is never served from the cache to a client using another.
+        """
+        return f"Chatbot_{api_key_fingerprint(self.api_key)}_{key_data}"
 
 
 class Resources(ResourceBaseClass):
@@ -79,14 +376,55 @@ class Resources(ResourceBaseClass):
 
     _chatbots: Chatbots = None
 
-    def __init__(self, api_key: str = None, timeout: int = None):
-        super().__init__(api_key=api_key, timeout=timeout)
+    def __init__(
+        self,
+        api_key: str = None,
+        timeout: int = None,
+        prompt_cache: PromptCache = None,
+        rate_limiter: RateLimiter = None,
+        concurrency_limiter: ConcurrencyLimiter = None,
+        scheduler: RequestScheduler = None,
+        key_pool: ApiKeyPool = None,
+        hedger: Hedger = None,
+        adaptive_timeouts: AdaptiveTimeouts = None,
+        shared_cache: CacheBackend = None,
+        usage_ledger: UsageLedger = None,
+        base_url: str = None,
+    ):
+        super().__init__(
+            api_key=api_key,
+            timeout=timeout,
+            prompt_cache=prompt_cache,
+            rate_limiter=rate_limiter,
+            concurrency_limiter=concurrency_limiter,
+            scheduler=scheduler,
+            key_pool=key_pool,
+            hedger=hedger,
+            adaptive_timeouts=adaptive_timeouts,
+            shared_cache=shared_cache,
+            usage_ledger=usage_ledger,
+            base_url=base_url,
+        )
         self._chatbots: Chatbots = None
 
-    @cached_property
+    @lazy_property
     def chatbots(self) -> Chatbots:
-        if not self._chatbots:
-            self._chatbots = Chatbots(api_key=self.api_key, timeout=self.timeout)
+        with self._lock:
+            if not self._chatbots:
+                self._chatbots = Chatbots(
+                    api_key=self.api_key,
+                    timeout=self.timeout,
+                    prompt_cache=self.prompt_cache,
+                    rate_limiter=self.rate_limiter,
+                    concurrency_limiter=self.concurrency_limiter,
+                    scheduler=self.scheduler,
+                    key_pool=self.key_pool,
+                    hedger=self.hedger,
+                    adaptive_timeouts=self.adaptive_timeouts,
+                    shared_cache=self.shared_cache,
+                    usage_ledger=self.usage_ledger,
+                    base_url=self.base_url,
+                )
         return self._chatbots
 
 
@@ -94,13 +432,111 @@ class Smarter(ApiBase):
     """A class for working with the Smarter Api."""
 
     _resources: Resources = None
+    _prompt_cache: PromptCache = None
+    _rate_limiter: RateLimiter = None
+    _concurrency_limiter: ConcurrencyLimiter = None
+    _scheduler: RequestScheduler = None
+    _key_pool: ApiKeyPool = None
+    _shared_cache: CacheBackend = None
+    _usage_ledger: UsageLedger = None
 
-    def __init__(self, api_key: str = None, timeout: int = None):
-        super().__init__(api_key=api_key, timeout=timeout)
+    def __init__(
+        self,
+        api_key: str = None,
+        timeout: int = None,
+        model: WhoAmIModel = None,
+        prompt_cache: PromptCache = None,
+        rate_limiter: RateLimiter = None,
+        concurrency_limiter: ConcurrencyLimiter = None,
+        scheduler: RequestScheduler = None,
+        key_pool: ApiKeyPool = None,
+        hedger: Hedger = None,
+        adaptive_timeouts: AdaptiveTimeouts = None,
+        shared_cache: CacheBackend = None,
+        usage_ledger: UsageLedger = None,
+        base_url: str = None,
+    ):
+        api_key = api_key or (key_pool.primary if key_pool is not None else None)
+        super().__init__(
+            api_key=api_key,
+            timeout=timeout,
+            model=model,
+            hedger=hedger,
+            adaptive_timeouts=adaptive_timeouts,
+            base_url=base_url,
+        )
         self._resources: Resources = None
+        self._prompt_cache = prompt_cache
+        self._rate_limiter = rate_limiter
+        self._concurrency_limiter = concurrency_limiter
+        self._scheduler = scheduler
+        self._key_pool = key_pool
+        self._shared_cache = shared_cache
+        self._usage_ledger = usage_ledger
 
-    @cached_property
+    @lazy_property
     def resources(self) -> Resources:
-        if self._resources is None:
-            self._resources = Resources(api_key=self.api_key, timeout=self.timeout)
+        with self._lock:
+            if self._resources is None:
+                self._resources = Resources(
+                    api_key=self.api_key,
+                    timeout=self.timeout,
+                    prompt_cache=self._prompt_cache,
+                    rate_limiter=self._rate_limiter,
+                    concurrency_limiter=self._concurrency_limiter,
+                    scheduler=self._scheduler,
+                    key_pool=self._key_pool,
+                    hedger=self._hedger,
+                    adaptive_timeouts=self._adaptive_timeouts,
+                    shared_cache=self._shared_cache,
+                    usage_ledger=self._usage_ledger,
+                    base_url=self._base_url,
+                )
         return self._resources
+
+    def save_state(self, path: str) -> None:
+        """
+        Export the warm state of this client to a compact file: the resolved
+        settings, the whoami model and the chatbot snapshots that were cached
+        for this client's api key.
+        """
+        fingerprint = api_key_fingerprint(self.api_key)
+        prefix = self.resources.chatbots.cache_key("")
+        chatbots = {
+            cache_key: snapshot.to_dict()
+            for cache_key, snapshot in list(RESOURCE_CACHE.items())
+            if isinstance(snapshot, ChatbotSnapshot) and cache_key.startswith(prefix)
+        }
+        state = ClientStateModel(
+            format_version=STATE_FORMAT_VERSION,
+            created_at=time.time(),
+            api_key_fingerprint=fingerprint,
+            settings=resolved_settings(),
+            whoami=self.model.model_dump(),
+            chatbots=chatbots,
+        )
+        write_state(path, state)
+
+    @classmethod
+    def from_state(
+        cls, path: str, api_key: str = None, timeout: int = None, max_age: int = None, **kwargs
+    ) -> "Smarter":
+        """
+        Create a client from a warm state file written by save_state(). The cached
+        chatbot snapshots are restored into the resource cache so that no metadata
+        round trips are needed. Falls back to a regular cold start if the state
+        file is missing, stale, or was saved for a different api key or environment.
+        """
+        api_key = api_key or smarter_settings.smarter_api_key.get_secret_value()
+        try:
+            state = read_state(path, api_key=api_key, max_age=max_age)
+        except SmarterValueError as e:
+            logger.info("Smarter.from_state() cold start: %s", e)
+            return cls(api_key=api_key, timeout=timeout, **kwargs)
+
+        client = cls(api_key=api_key, timeout=timeout, model=WhoAmIModel(**state.whoami), **kwargs)
+        chatbots = client.resources.chatbots
+        for cache_key, snapshot in state.chatbots.items():
+            chatbots.save_to_cache(cache_key, ChatbotSnapshot.from_dict(snapshot))
+        logger.debug("Smarter.from_state() restored %s chatbots, age=%.1fs", len(state.chatbots), state.age)
+        return client
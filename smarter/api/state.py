@@ -0,0 +1,114 @@
+"""
+smarter-api warm client state.
+
+Exports the warm state of a Smarter client (the resolved settings, the whoami
+model and the cached chatbot snapshots) to a compact gzipped json file, and
+reads it back with a freshness check. A freshly started Lambda function or
+Kubernetes pod can restore this state and answer its first prompt without
+making any metadata round trips to the api.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from pydantic import BaseModel, ValidationError
+
+from smarter.common.conf import settings as smarter_settings
+from smarter.common.exceptions import SmarterValueError
+
+
+logger = logging.getLogger(__name__)
+
+STATE_FORMAT_VERSION = 3
+
+# the resolved settings that the warm state depends on. If any of these differ
+# between the process that saved the state and the process that restores it
+# then the saved state is not trustworthy and is discarded.
+RESOLVED_SETTINGS_KEYS = [
+    "environment",
+    "root_domain",
+    "environment_api_url",
+    "version",
+    "llm_default_provider",
+    "llm_default_model",
+    "llm_default_temperature",
+    "llm_default_max_tokens",
+    "smarter_default_http_timeout",
+    "smarter_default_cache_timeout",
+    "smarter_max_cache_size",
+]
+FINGERPRINT_SETTINGS_KEYS = ["environment", "root_domain", "environment_api_url", "version"]
+
+
+class ClientStateModel(BaseModel):
+    """
+    Serializable warm state of a Smarter client. Note that the api key itself
+    is never written to disk, only a fingerprint of it.
+    """
+
+    format_version: int
+    created_at: float
+    api_key_fingerprint: str
+    settings: dict
+    whoami: dict
+    chatbots: Dict[str, dict] = {}
+
+    @property
+    def age(self) -> float:
+        """Age of the saved state in seconds."""
+        return time.time() - self.created_at
+
+
+def api_key_fingerprint(api_key: str) -> str:
+    """Return a non-reversible fingerprint of an api key."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def resolved_settings() -> dict:
+    """Return the subset of the resolved Settings that the warm state depends on."""
+    return {key: getattr(smarter_settings, key) for key in RESOLVED_SETTINGS_KEYS}
+
+
+def write_state(path: str, state: ClientStateModel) -> None:
+    """
+    Write the warm state to a gzipped json file. The file is written to a
+    temporary file first and then renamed so that concurrently starting
+    workers never read a partially written file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    payload = json.dumps(state.model_dump(), separators=(",", ":")).encode("utf-8")
+    with gzip.open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    logger.debug("write_state() path=%s chatbots=%s bytes=%s", path, len(state.chatbots), os.path.getsize(path))
+
+
+def read_state(path: str, api_key: str, max_age: Optional[int] = None) -> ClientStateModel:
+    """
+    Read the warm state from a gzipped json file and verify that it is still
+    fresh and that it was saved for this api key and environment. Raises
+    SmarterValueError if the state cannot be used.
+    """
+    max_age = smarter_settings.smarter_default_cache_timeout if max_age is None else max_age
+    try:
+        with gzip.open(path, "rb") as f:
+            state = ClientStateModel(**json.loads(f.read()))
+    except (OSError, ValueError, ValidationError) as e:
+        raise SmarterValueError(f"Unable to read client state {path}: {e}") from e
+
+    if state.format_version != STATE_FORMAT_VERSION:
+        raise SmarterValueError(f"Unsupported client state format version {state.format_version}")
+    if state.age > max_age:
+        raise SmarterValueError(f"Client state is stale: {int(state.age)} seconds old, max_age is {max_age}")
+    if state.api_key_fingerprint != api_key_fingerprint(api_key):
+        raise SmarterValueError("Client state was saved for a different api key")
+    current = resolved_settings()
+    for key in FINGERPRINT_SETTINGS_KEYS:
+        if state.settings.get(key) != current[key]:
+            raise SmarterValueError(f"Client state was saved with a different {key}: {state.settings.get(key)}")
+    return state
@@ -0,0 +1,5 @@
+# pylint: disable=missing-module-docstring
+from .pipeline import BatchPipeline, BatchStats, Checkpoint
+
+
+__all__ = ["BatchPipeline", "BatchStats", "Checkpoint"]
@@ -0,0 +1,401 @@
+"""
+smarter-api batch pipeline.
+
+Streams prompts from a jsonl file through Chatbot.prompt() with bounded
+concurrency, and streams the results to a jsonl file, in input order, with
+bounded memory: at most max_in_flight records are read ahead of the last one
+written, however large the input is.
+
+Each input line is a json object with a prompt, and optionally an id and the
+name of a chatbot; any other fields are copied to the result. Each output line
+holds the record's id and index in the input, the chatbot, the response text,
+the model, the token usage and the latency, or the error if the prompt failed.
+
+    pipeline = BatchPipeline("prompts.jsonl", "results.jsonl", chatbots=client.resources.chatbots)
+    stats = pipeline.run()
+
+Progress is checkpointed to a small json file next to the output, atomically,
+every checkpoint_every records. The output file itself is the record of what is
+done: since results are written in input order, its complete lines are always
+the results of a prefix of the input. An interrupted run resumes after the last
+complete result, even one written after the last checkpoint, and truncates any
+half-written line, so that no finished prompt is sent again. Only the prompts
+that were in flight when the run stopped are repeated.
+
+Results whose error is transient, such as a 429, a 5xx, a timeout or a missed
+deadline, are marked retryable. A run with retry_errors=True first prompts
+those records again and rewrites their results in place, and then carries on
+where the batch stopped:
+
+    stats = BatchPipeline("prompts.jsonl", "results.jsonl", chatbot=chatbot, retry_errors=True).run()
+"""
+
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import httpx
+
+from smarter.common.const import SMARTER_DEFAULT_MAX_CONCURRENCY
+from smarter.common.exceptions import (
+    SmarterConfigurationError,
+    SmarterDeadlineExceededError,
+    SmarterQueueTimeoutError,
+    SmarterValueError,
+)
+from smarter.traffic.concurrency import is_overload
+
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+USAGE_FIELDS = ["prompt_tokens", "completion_tokens", "total_tokens"]
+
+
+@dataclass
+class BatchStats:
+    """The progress of a batch, since its first run."""
+
+    records: int = 0
+    errors: int = 0
+    retryable: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    resumed_at: int = 0
+    elapsed: float = 0.0
+
+    def add(self, result: dict) -> None:
+        self.records += 1
+        if result.get("error"):
+            self.errors += 1
+        if result.get("retryable"):
+            self.retryable += 1
+        usage = result.get("usage") or {}
+        for name in USAGE_FIELDS:
+            setattr(self, name, getattr(self, name) + usage.get(name, 0))
+
+
+@dataclass
+class Checkpoint:
+    """Where a batch stopped: the byte offsets of the next input record and of the end of the output."""
+
+    input_offset: int = 0
+    output_offset: int = 0
+    complete: bool = False
+    stats: BatchStats = field(default_factory=BatchStats)
+
+    def save(self, path: str) -> None:
+        data = {"version": CHECKPOINT_VERSION, **asdict(self)}
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.pop("version", None) != CHECKPOINT_VERSION:
+            raise SmarterValueError(f"{path} is not a version {CHECKPOINT_VERSION} batch checkpoint")
+        return cls(stats=BatchStats(**data.pop("stats")), **data)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Return True if a prompt that failed with error may well succeed if it is sent again."""
+    return is_overload(error) or isinstance(
+        error, (httpx.TransportError, SmarterQueueTimeoutError, SmarterDeadlineExceededError)
+    )
+
+
+def dumps(result: dict) -> bytes:
+    return json.dumps(result, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def parse_response(response: dict) -> Tuple[str, Optional[str], dict]:
+    """The assistant's text, the model and the token usage of a verbose prompt response."""
+    body = response["data"]["response"]["data"]["body"]
+    text = None
+    for message in body["smarter"]["messages"]:
+        if message["role"] == "assistant":
+            text = message["content"]
+    if text is None:
+        raise ValueError("No assistant message found in the prompt_response response.")
+    usage = body.get("usage") or {}
+    summary = {name: usage.get(name, 0) for name in USAGE_FIELDS}
+    summary["cached_tokens"] = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    summary["reasoning_tokens"] = (usage.get("completion_tokens_details") or {}).get("reasoning_tokens", 0)
+    return text, body.get("model"), summary
+
+
+class BatchPipeline:
+    """
+    Prompts a chatbot with every record of input_path and writes the results to
+    output_path. Records name their chatbot, which is looked up in chatbots, a
+    Chatbots resource, or else they all go to chatbot. With retry_errors, the
+    records whose results are retryable errors are prompted again before the
+    batch carries on. See the module docstring.
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        chatbot=None,
+        chatbots=None,
+        concurrency: int = SMARTER_DEFAULT_MAX_CONCURRENCY,
+        max_in_flight: int = None,
+        checkpoint_path: str = None,
+        checkpoint_every: int = 100,
+        deadline: float = None,
+        retry_errors: bool = False,
+    ):
+        if chatbot is None and chatbots is None:
+            raise SmarterConfigurationError("BatchPipeline needs a chatbot or a Chatbots resource")
+        self.input_path = input_path
+        self.output_path = output_path
+        self.chatbot = chatbot
+        self.chatbots = chatbots
+        self.concurrency = max(1, concurrency)
+        self.max_in_flight = max(self.concurrency, max_in_flight or 4 * self.concurrency)
+        self.checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.deadline = deadline
+        self.retry_errors = retry_errors
+        self._chatbots: Dict[str, Any] = {}
+
+    def records(self, offset: int) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+        """Yield (offset after it, record, error) for each non-blank input line from offset."""
+        with open(self.input_path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                offset += len(raw)
+                if not raw.strip():
+                    continue
+                try:
+                    record = json.loads(raw)
+                    if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+                        raise ValueError("a record must be a json object with a prompt")
+                except ValueError as e:
+                    yield offset, None, f"{type(e).__name__}: {e}"
+                    continue
+                yield offset, record, None
+
+    def resolve(self, name: Optional[str]):
+        if name is None or self.chatbots is None:
+            if self.chatbot is None:
+                raise SmarterValueError("the record does not name a chatbot, and there is no default chatbot")
+            return self.chatbot
+        chatbot = self._chatbots.get(name)
+        if chatbot is None:
+            chatbot = self._chatbots.setdefault(name, self.chatbots.get(name=name))
+        return chatbot
+
+    def execute(self, record: dict) -> dict:
+        """Prompt the record's chatbot and return the fields of its result."""
+        start = time.perf_counter()
+        result = {
+            "chatbot": record.get("chatbot"),
+            "response": None,
+            "model": None,
+            "usage": None,
+            "error": None,
+            "retryable": False,
+        }
+        try:
+            chatbot = self.resolve(record.get("chatbot"))
+            result["chatbot"] = getattr(chatbot, "name", result["chatbot"])
+            response = chatbot.prompt(record["prompt"], verbose=True, deadline=self.deadline)
+            result["response"], result["model"], result["usage"] = parse_response(response)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            result["error"] = f"{type(e).__name__}: {e}"
+            result["retryable"] = is_retryable(e)
+        result["elapsed"] = round(time.perf_counter() - start, 6)
+        return result
+
+    def recover(self) -> Checkpoint:
+        """
+        Load the checkpoint, and move it past any results written after it was
+        saved. A half-written last line is truncated.
+        """
+        checkpoint = Checkpoint.load(self.checkpoint_path)
+        if not os.path.exists(self.output_path):
+            if checkpoint.output_offset:
+                raise SmarterValueError(f"{self.output_path} is missing, but {self.checkpoint_path} is not")
+            return checkpoint
+        with open(self.output_path, "r+b") as f:
+            f.seek(checkpoint.output_offset)
+            results = []
+            end = checkpoint.output_offset
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                results.append(json.loads(raw))
+                end += len(raw)
+            f.truncate(end)
+        if results:
+            records = self.records(checkpoint.input_offset)
+            for result in results:
+                following = next(records, None)
+                if following is None:
+                    raise SmarterValueError(f"{self.output_path} has more results than {self.input_path} has records")
+                checkpoint.input_offset = following[0]
+                checkpoint.stats.add(result)
+            records.close()
+            checkpoint.output_offset = end
+        return checkpoint
+
+    def run(self) -> BatchStats:
+        """Run the batch to the end, or resume it, and return its stats."""
+        checkpoint = self.recover()
+        if self.retry_errors and checkpoint.stats.retryable:
+            self.retry(checkpoint)
+        stats = checkpoint.stats
+        if checkpoint.complete:
+            logger.info("BatchPipeline.run() %s is already complete", self.output_path)
+            return stats
+        stats.resumed_at = stats.records
+        if stats.records:
+            logger.info("BatchPipeline.run() resuming %s after %s records", self.input_path, stats.records)
+        elapsed = stats.elapsed
+        start = time.perf_counter()
+        since_checkpoint = 0
+
+        with (
+            open(self.output_path, "ab") as output,
+            ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="smarter-batch") as executor,
+        ):
+
+            def write(offset: int, result: dict) -> None:
+                nonlocal since_checkpoint
+                output.write(dumps(result))
+                checkpoint.input_offset = offset
+                stats.add(result)
+                since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_every:
+                    self.save(checkpoint, output, elapsed + time.perf_counter() - start)
+                    since_checkpoint = 0
+
+            records = enumerate(self.records(checkpoint.input_offset), start=stats.records + 1)
+            jobs = (
+                (offset, *self.submit(executor, index, record, error)) for index, (offset, record, error) in records
+            )
+            try:
+                self.stream(jobs, write)
+                checkpoint.complete = True
+            finally:
+                self.save(checkpoint, output, elapsed + time.perf_counter() - start)
+        return stats
+
+    def stream(self, jobs: Iterator[Tuple[int, dict, Future]], write: Callable[[int, dict], None]) -> None:
+        """
+        Write the results of jobs, which are (input offset, fields, future of the
+        rest of the fields), in order, with at most max_in_flight of them pending.
+        """
+        pending: deque = deque()
+
+        def complete() -> None:
+            # the oldest record stays pending until its result is written.
+            offset, fields, future = pending[0]
+            fields.update(future.result())
+            pending.popleft()
+            write(offset, fields)
+
+        try:
+            for job in jobs:
+                pending.append(job)
+                # write the finished prefix, and wait for the oldest record when the window is full.
+                while pending and (pending[0][2].done() or len(pending) >= self.max_in_flight):
+                    complete()
+            while pending:
+                complete()
+        finally:
+            # on an interruption, queued prompts are dropped, but the ones in flight are
+            # finished and written, so that no tokens are spent on them again.
+            for _, _, future in pending:
+                future.cancel()
+            while pending and not pending[0][2].cancelled():
+                complete()
+
+    def retry(self, checkpoint: Checkpoint) -> None:
+        """
+        Prompt again the records whose results are retryable errors, and rewrite the
+        output with their new results. The output is replaced only once every
+        result has been rewritten, so an interrupted retry leaves it as it was.
+        """
+        tmp = f"{self.output_path}.retry"
+        stats = BatchStats(elapsed=checkpoint.stats.elapsed)
+        retrying = checkpoint.stats.retryable
+        logger.info("BatchPipeline.retry() prompting %s records of %s again", retrying, self.input_path)
+        try:
+            with (
+                open(self.output_path, "rb") as output,
+                open(tmp, "wb") as rewritten,
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="smarter-batch") as executor,
+            ):
+
+                def write(offset: int, result: dict) -> None:  # pylint: disable=unused-argument
+                    rewritten.write(dumps(result))
+                    stats.add(result)
+
+                self.stream(self.retry_jobs(executor, output), write)
+                rewritten.flush()
+                os.fsync(rewritten.fileno())
+        except BaseException:
+            with suppress(OSError):
+                os.remove(tmp)
+            raise
+        # until the new checkpoint is saved, a resumed run recovers from the start of the output.
+        Checkpoint().save(self.checkpoint_path)
+        os.replace(tmp, self.output_path)
+        checkpoint.output_offset = os.path.getsize(self.output_path)
+        checkpoint.stats = stats
+        checkpoint.save(self.checkpoint_path)
+        logger.info("BatchPipeline.retry() %s of %s records still failed", stats.retryable, retrying)
+
+    def retry_jobs(self, executor: ThreadPoolExecutor, output) -> Iterator[Tuple[int, dict, Future]]:
+        """The results of output, with the records of the retryable ones submitted again."""
+        records = self.records(0)
+        for raw in output:
+            result = json.loads(raw)
+            offset, record, _ = next(records)
+            if result.get("retryable") and record is not None:
+                yield offset, result, executor.submit(self.execute, record)
+            else:
+                yield offset, result, done_future()
+
+    def submit(self, executor: ThreadPoolExecutor, index: int, record: Optional[dict], error: Optional[str]):
+        """Start a record, and return the fields of its result and the future of the rest."""
+        if record is None:
+            fields = {"id": str(index), "index": index, "response": None, "usage": None, "error": error}
+            fields["retryable"] = False
+            return fields, done_future()
+        fields = {key: value for key, value in record.items() if key != "prompt"}
+        fields.setdefault("id", str(index))
+        fields["index"] = index
+        return fields, executor.submit(self.execute, record)
+
+    def save(self, checkpoint: Checkpoint, output, elapsed: float) -> None:
+        """Flush the output to disk, then checkpoint it."""
+        output.flush()
+        os.fsync(output.fileno())
+        checkpoint.output_offset = output.tell()
+        checkpoint.stats.elapsed = elapsed
+        checkpoint.save(self.checkpoint_path)
+        logger.debug("BatchPipeline.save() %s records", checkpoint.stats.records)
+
+
+def done_future(result: dict = None) -> Future:
+    future = Future()
+    future.set_result(result or {})
+    return future
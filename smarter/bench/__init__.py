@@ -0,0 +1,5 @@
+# pylint: disable=missing-module-docstring
+from .runner import BenchConfig, BenchResult, error_kind, run
+
+
+__all__ = ["BenchConfig", "BenchResult", "error_kind", "run"]
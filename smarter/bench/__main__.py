@@ -0,0 +1,8 @@
+"""
+smarter-api load generator entry point: python -m smarter.bench --help
+"""
+
+from smarter.bench.runner import main
+
+
+main()
@@ -0,0 +1,312 @@
+"""
+smarter-api load generator.
+
+Drives Chatbot.prompt() traffic and measures what the client sees: throughput,
+latency percentiles, errors by kind, and the client CPU time per request.
+
+Traffic is either closed loop, where each of concurrency workers sends its next
+prompt as soon as the last one returns, or open loop, where prompts arrive on a
+schedule (a Poisson process, or a constant rate) whether or not earlier ones
+have returned. Open-loop latency is measured from each prompt's scheduled
+arrival, so that a client that falls behind is charged for the queueing delay
+instead of hiding it (coordinated omission). Prompts are sent from the calling
+thread (sync) or from a pool of concurrency threads.
+
+    chatbot = Smarter(api_key=..., base_url=server.url).resources.chatbots.get(name="faq-bot")
+    result = run(BenchConfig(mode="poisson", rate=200, requests=5000), chatbot)
+    print(result.format())
+
+python -m smarter.bench runs it from the command line, against a local FakeServer
+in subprocesses (so that the server's CPU isn't counted as the client's), the
+real platform, or any other url, and with --json writes the result for comparing
+runs:
+
+    python -m smarter.bench --mode poisson --rate 200 --requests 5000 --json run.json
+    python -m smarter.bench --target platform --chatbot my-bot --mode closed --concurrency 4
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from smarter.api.client import Smarter
+from smarter.common.const import SMARTER_DEFAULT_MAX_CONCURRENCY
+from smarter.common.exceptions import SmarterValueError
+from smarter.testing import FakeServer, FakeServerConfig, Latency
+
+
+logger = logging.getLogger(__name__)
+
+MODES = ["closed", "poisson", "constant"]
+EXECUTIONS = ["sync", "threads"]
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99, "p999": 0.999}
+
+
+@dataclass
+class BenchConfig:
+    """
+    The shape of a benchmark run. rate is the arrivals per second of the open-loop
+    modes, and concurrency the number of threads; the sync execution sends from
+    the calling thread only. warmup prompts are sent before measuring, one at a
+    time, to fill caches and the connection pool.
+    """
+
+    mode: str = "closed"
+    rate: float = 50.0
+    concurrency: int = SMARTER_DEFAULT_MAX_CONCURRENCY
+    requests: int = 1000
+    warmup: int = 10
+    execution: str = "threads"
+    prompt: str = "What are your opening hours?"
+    seed: Optional[int] = None
+
+    def __post_init__(self):
+        if self.mode not in MODES:
+            raise SmarterValueError(f"mode must be one of {', '.join(MODES)}, not {self.mode}")
+        if self.execution not in EXECUTIONS:
+            raise SmarterValueError(f"execution must be one of {', '.join(EXECUTIONS)}, not {self.execution}")
+        if self.requests < 1 or self.concurrency < 1 or self.warmup < 0:
+            raise SmarterValueError("requests and concurrency must be positive, and warmup not negative")
+        if self.mode != "closed" and self.rate <= 0:
+            raise SmarterValueError(f"rate must be positive in {self.mode} mode")
+
+    def arrivals(self) -> List[float]:
+        """The open-loop arrival offsets of the requests, in seconds from the start."""
+        rng = random.Random(self.seed)
+        offsets = []
+        offset = 0.0
+        for _ in range(self.requests):
+            offsets.append(offset)
+            offset += rng.expovariate(self.rate) if self.mode == "poisson" else 1.0 / self.rate
+        return offsets
+
+
+@dataclass
+class BenchResult:
+    """The measurements of a benchmark run. latencies are in seconds, in the order in which requests were sent."""
+
+    config: BenchConfig
+    target: str
+    elapsed: float
+    cpu: float
+    latencies: array
+    errors: Counter = field(default_factory=Counter)
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def throughput(self) -> float:
+        """Completed requests per second, including errors."""
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def goodput(self) -> float:
+        """Successful requests per second."""
+        return (self.requests - sum(self.errors.values())) / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def cpu_per_request(self) -> float:
+        """Client CPU seconds, of all threads, per request."""
+        return self.cpu / self.requests if self.requests else 0.0
+
+    def percentiles(self) -> Dict[str, float]:
+        """Nearest-rank latency percentiles, in seconds."""
+        values = sorted(self.latencies)
+        if not values:
+            return {name: 0.0 for name in PERCENTILES}
+        return {name: values[max(0, math.ceil(q * len(values)) - 1)] for name, q in PERCENTILES.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            "config": asdict(self.config),
+            "target": self.target,
+            "requests": self.requests,
+            "errors": dict(self.errors),
+            "elapsed": round(self.elapsed, 6),
+            "throughput": round(self.throughput, 3),
+            "goodput": round(self.goodput, 3),
+            "latency": {name: round(value, 6) for name, value in self.percentiles().items()},
+            "latency_mean": round(sum(self.latencies) / self.requests, 6) if self.requests else 0.0,
+            "cpu_per_request": round(self.cpu_per_request, 9),
+        }
+
+    def format(self) -> str:
+        config = self.config
+        shape = f"{config.mode} loop" if config.mode == "closed" else f"{config.mode} arrivals at {config.rate:g}/s"
+        workers = "1 thread" if config.execution == "sync" else f"{config.concurrency} threads"
+        lines = [
+            f"target      {self.target}",
+            f"traffic     {shape}, {workers}, {self.requests} requests in {self.elapsed:.2f}s",
+            f"throughput  {self.throughput:.1f}/s ({self.goodput:.1f}/s ok)",
+            "latency     " + "  ".join(f"{name} {value * 1000:.1f}ms" for name, value in self.percentiles().items()),
+            f"client cpu  {self.cpu_per_request * 1e6:.0f}us/request",
+        ]
+        errors = ", ".join(f"{kind} {count}" for kind, count in self.errors.most_common())
+        lines.append(f"errors      {errors or 'none'}")
+        return "\n".join(lines)
+
+
+def error_kind(error: Exception) -> str:
+    """The kind of an error, for the error breakdown: http_<status> for error responses, else its class name."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code}"
+    return type(error).__name__
+
+
+def run(
+    config: BenchConfig,
+    chatbot,
+    target: str = "",
+    clock: Callable[[], float] = time.perf_counter,
+    sleep: Callable[[float], None] = time.sleep,
+) -> BenchResult:
+    """Send config.requests prompts to chatbot, anything with a prompt() method, and measure them."""
+    for _ in range(config.warmup):
+        try:
+            chatbot.prompt(config.prompt)
+        except Exception:  # pylint: disable=broad-exception-caught
+            pass
+
+    # preallocated, and written by index from every thread, so that recording a latency takes no lock.
+    latencies = array("d", bytes(8 * config.requests))
+    errors = Counter()
+    lock = threading.Lock()
+
+    def send(index: int, started: float) -> None:
+        try:
+            chatbot.prompt(config.prompt)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            with lock:
+                errors[error_kind(e)] += 1
+        latencies[index] = clock() - started
+
+    cpu = time.process_time()
+    start = clock()
+    if config.mode == "closed":
+        run_closed(config, send, clock)
+    else:
+        run_open(config, send, start, clock, sleep)
+    elapsed = clock() - start
+    cpu = time.process_time() - cpu
+    logger.debug("run() sent %s requests in %.3fs", config.requests, elapsed)
+    return BenchResult(config=config, target=target, elapsed=elapsed, cpu=cpu, latencies=latencies, errors=errors)
+
+
+def run_closed(config: BenchConfig, send: Callable[[int, float], None], clock: Callable[[], float]) -> None:
+    if config.execution == "sync":
+        for index in range(config.requests):
+            send(index, clock())
+        return
+
+    def work(worker: int) -> None:
+        for index in range(worker, config.requests, config.concurrency):
+            send(index, clock())
+
+    threads = [threading.Thread(target=work, args=(worker,), daemon=True) for worker in range(config.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open(
+    config: BenchConfig,
+    send: Callable[[int, float], None],
+    start: float,
+    clock: Callable[[], float],
+    sleep: Callable[[float], None],
+) -> None:
+    executor = None
+    if config.execution == "threads":
+        executor = ThreadPoolExecutor(max_workers=config.concurrency, thread_name_prefix="smarter-bench")
+    try:
+        for index, offset in enumerate(config.arrivals()):
+            arrival = start + offset
+            delay = arrival - clock()
+            if delay > 0:
+                sleep(delay)
+            if executor is None:
+                send(index, arrival)
+            else:
+                executor.submit(send, index, arrival)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m smarter.bench", description="Benchmark Chatbot.prompt() traffic.")
+    parser.add_argument("--mode", choices=MODES, default="closed")
+    parser.add_argument("--rate", type=float, default=50.0, help="arrivals per second, in the open-loop modes")
+    parser.add_argument("--concurrency", type=int, default=SMARTER_DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--execution", choices=EXECUTIONS, default="threads")
+    parser.add_argument("--prompt", default="What are your opening hours?")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--target", default="fake", help="fake, platform, or the api url of another server")
+    parser.add_argument("--chatbot", default="faq-bot")
+    parser.add_argument("--api-key", default=None, help="defaults to the SMARTER_API_KEY setting")
+    parser.add_argument("--server-processes", type=int, default=2, help="fake target only")
+    parser.add_argument("--chat-latency", type=Latency.parse, default=Latency(), help="fake target only")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake target only")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fake target only")
+    parser.add_argument(
+        "--json", metavar="PATH", default=None, help="write the result as json to PATH, or - for stdout"
+    )
+    args = parser.parse_args(argv)
+    config = BenchConfig(
+        mode=args.mode,
+        rate=args.rate,
+        concurrency=args.concurrency,
+        requests=args.requests,
+        warmup=args.warmup,
+        execution=args.execution,
+        prompt=args.prompt,
+        seed=args.seed,
+    )
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server = None
+    if args.target == "fake":
+        server_config = FakeServerConfig(
+            chat_latency=args.chat_latency,
+            error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate,
+            seed=args.seed,
+        )
+        server = FakeServer.subprocess(server_config, processes=args.server_processes)
+        base_url, api_key, target = server.url, args.api_key or "0" * 64, f"fake {server.url}"
+    elif args.target == "platform":
+        base_url, api_key, target = None, args.api_key, "platform"
+    else:
+        base_url, api_key, target = args.target, args.api_key, args.target
+    try:
+        chatbot = Smarter(api_key=api_key, base_url=base_url).resources.chatbots.get(name=args.chatbot)
+        result = run(config, chatbot, target=target)
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.json == "-":
+        json.dump(result.to_dict(), sys.stdout, indent=2)
+        print()
+        return
+    print(result.format())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result.to_dict(), f, indent=2)
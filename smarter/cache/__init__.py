@@ -0,0 +1,21 @@
+# pylint: disable=missing-module-docstring
+from .backends import (
+    CacheBackend,
+    DiskCacheBackend,
+    MemoryCacheBackend,
+    RedisCacheBackend,
+)
+from .prompt import PromptCache
+from .shared import SharedManifestCache
+from .similarity import SimilarPromptCache
+
+
+__all__ = [
+    "CacheBackend",
+    "DiskCacheBackend",
+    "MemoryCacheBackend",
+    "PromptCache",
+    "RedisCacheBackend",
+    "SharedManifestCache",
+    "SimilarPromptCache",
+]
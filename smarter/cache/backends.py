@@ -0,0 +1,310 @@
+"""
+smarter-api cache backends.
+
+The resource cache keeps chatbots in process memory. A CacheBackend is a
+second tier behind ResourceBaseClass.get_from_cache() and save_to_cache(), and
+behind PromptCache, that can be shared between processes and hosts:
+
+- MemoryCacheBackend, a TTL cache in process memory, mostly for tests,
+- DiskCacheBackend, one file per entry in a directory, which can be on a shared volume,
+- SharedManifestCache, a SQLite database shared by the processes of a host,
+- RedisCacheBackend, any Redis-compatible server, shared by every pod of a deployment.
+
+A backend implements get(), set(), delete() and clear(). get_many() and
+refresh() have default implementations that backends may improve on, with a
+pipelined multi-get and a single-writer refresh respectively.
+
+Values are serialized with dumps() and loads(): ChatbotSnapshot and ChatbotModel
+objects are tagged with their type, anything else is stored as JSON.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from cachetools import TTLCache
+
+from smarter.common import forking
+from smarter.common.conf import settings as smarter_settings
+from smarter.common.exceptions import SmarterConfigurationError, SmarterValueError
+
+
+logger = logging.getLogger(__name__)
+
+# the first byte of a serialized value is its type tag.
+SNAPSHOT_TAG = b"s"
+MODEL_TAG = b"m"
+JSON_TAG = b"j"
+# a disk entry is its expiry time followed by the serialized value.
+DISK_HEADER = struct.Struct("<d")
+
+
+def dumps(value: Any) -> bytes:
+    """Serialize a cache value to compact bytes."""
+    # smarter.resources imports the prompt cache, which imports this module.
+    from smarter.resources.models.chatbot import (  # pylint: disable=import-outside-toplevel
+        ChatbotModel,
+    )
+    from smarter.resources.snapshot import (  # pylint: disable=import-outside-toplevel
+        ChatbotSnapshot,
+    )
+
+    if isinstance(value, ChatbotSnapshot):
+        tag, data = SNAPSHOT_TAG, value.to_dict()
+    elif isinstance(value, ChatbotModel):
+        tag, data = MODEL_TAG, value.model_dump(mode="json")
+    else:
+        tag, data = JSON_TAG, value
+    return tag + json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """Deserialize a cache value that was serialized with dumps()."""
+    from smarter.resources.models.chatbot import (  # pylint: disable=import-outside-toplevel
+        ChatbotModel,
+    )
+    from smarter.resources.snapshot import (  # pylint: disable=import-outside-toplevel
+        ChatbotSnapshot,
+    )
+
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    tag, value = data[:1], json.loads(data[1:])
+    if tag == SNAPSHOT_TAG:
+        return ChatbotSnapshot.from_dict(value)
+    if tag == MODEL_TAG:
+        return ChatbotModel.model_validate(value)
+    if tag == JSON_TAG:
+        return value
+    raise SmarterValueError(f"unknown cache value type {tag!r}")
+
+
+class CacheBackend:
+    """
+    The cache backend protocol. ttl is in seconds; None means the backend's
+    default ttl.
+    """
+
+    ttl: int = None
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: int = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Return the cached values of keys, omitting the misses."""
+        values = {key: self.get(key) for key in keys}
+        return {key: value for key, value in values.items() if value is not None}
+
+    def refresh(self, key: str, fetch: Callable[[], Any]) -> Any:
+        """Return the cached value of key, fetching and caching it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            self.set(key, value)
+        return value
+
+
+class MemoryCacheBackend(CacheBackend):
+    """A TTL cache in process memory. Values are stored as they are, without serialization."""
+
+    def __init__(self, maxsize: int = None, ttl: int = None):
+        self.ttl = ttl or smarter_settings.smarter_default_cache_timeout
+        self._cache = TTLCache(maxsize=maxsize or smarter_settings.smarter_max_cache_size, ttl=self.ttl)
+        self._lock = threading.Lock()
+        forking.register(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key: str, value: Any, ttl: int = None) -> None:
+        # TTLCache has one ttl for every entry.
+        with self._lock:
+            self._cache[key] = value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._cache)
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    One file per entry in directory, named for the sha256 of its key. Files are
+    written to a temporary file and renamed into place, so that readers in other
+    processes never see a partial entry.
+    """
+
+    def __init__(self, directory: str, ttl: int = None, clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.ttl = ttl or smarter_settings.smarter_default_cache_timeout
+        self.clock = clock
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.bin")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) <= DISK_HEADER.size:
+            return None
+        (expires,) = DISK_HEADER.unpack_from(data)
+        if expires <= self.clock():
+            self.delete(key)
+            return None
+        header = DISK_HEADER.size
+        return loads(data[header:])
+
+    def set(self, key: str, value: Any, ttl: int = None) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(DISK_HEADER.pack(self.clock() + (ttl or self.ttl)) + dumps(value))
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        """Remove every entry. Only files that match the layout of the backend are removed."""
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if filename.endswith(".bin") and len(filename) == 68:
+                    os.remove(os.path.join(root, filename))
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    A Redis-compatible server, through a client with the interface of redis-py's
+    Redis class: get(), set(ex, px, nx), delete(), eval(), pipeline() and
+    scan_iter(). Keys are namespaced with prefix. get_many() fetches every key
+    in one pipelined round trip, and refresh() lets only one client refresh a
+    key, with a lease that is taken with SET NX and a token of its own. The
+    lease is released with a compare-and-delete script, so that a holder whose
+    lease has expired can't release the lease that another client has since taken.
+    """
+
+    RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+    def __init__(
+        self,
+        client,
+        prefix: str = "smarter:",
+        ttl: int = None,
+        lease: float = 30.0,
+        lease_wait: float = 5.0,
+        poll: float = 0.05,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl or smarter_settings.smarter_default_cache_timeout
+        self.lease = lease
+        self.lease_wait = lease_wait
+        self.poll = poll
+        self.sleep = sleep
+        self.clock = clock
+        self.owner = uuid.uuid4().hex
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisCacheBackend":
+        """Connect to a Redis-compatible server with redis-py, which is an optional dependency."""
+        try:
+            import redis  # pylint: disable=import-outside-toplevel
+        except ImportError as e:
+            raise SmarterConfigurationError("RedisCacheBackend.from_url() requires redis: pip install redis") from e
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def get(self, key: str) -> Optional[Any]:
+        data = self.client.get(self._key(key))
+        return loads(data) if data is not None else None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.get(self._key(key))
+        return {key: loads(data) for key, data in zip(keys, pipeline.execute()) if data is not None}
+
+    def set(self, key: str, value: Any, ttl: int = None) -> None:
+        self.client.set(self._key(key), dumps(value), ex=int(ttl or self.ttl))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self._key(key))
+
+    def clear(self) -> None:
+        """Remove every key with this backend's prefix."""
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def refresh(self, key: str, fetch: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+        lease_key = self._key(f"lease:{key}")
+        give_up = self.clock() + self.lease_wait
+        token = f"{self.owner}:{uuid.uuid4().hex}"
+        while True:
+            if self.client.set(lease_key, token, px=int(self.lease * 1000), nx=True):
+                try:
+                    value = fetch()
+                    self.set(key, value)
+                finally:
+                    self.client.eval(self.RELEASE_SCRIPT, 1, lease_key, token)
+                return value
+            self.sleep(self.poll)
+            value = self.get(key)
+            if value is not None:
+                return value
+            if self.clock() >= give_up:
+                logger.debug("RedisCacheBackend.refresh() gave up waiting for the lease of %s", key)
+                value = fetch()
+                self.set(key, value)
+                return value
@@ -0,0 +1,223 @@
+"""
+smarter-api prompt response cache.
+
+An opt-in, client-side cache of Chatbot.prompt() responses for chatbot
+configurations that the user declares to be deterministic, for example FAQ
+bots, test suites and regression runs. Cache keys are derived from the
+chatbot identity, the manifest version and modified timestamp, the model and
+temperature of the chatbot config, and the prompt text, so that any change to
+the chatbot invalidates its cached responses.
+
+Responses are cached in memory and, optionally, on disk so that they survive
+restarts. Each tier has its own time-to-live. A CacheBackend, such as a
+RedisCacheBackend, can be added as a third tier that is shared by every
+process and host.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any, Callable, Iterable, Optional
+
+from cachetools import TTLCache
+
+from smarter.cache.backends import CacheBackend
+from smarter.common import forking
+from smarter.common.conf import settings as smarter_settings
+
+
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHE_KEY_VERSION = 1
+# the layout of the disk tier: <first two hex digits of the key>/<key>.json
+DISK_ENTRY_PATTERN = re.compile(r"^(?P<prefix>[0-9a-f]{2})/(?P=prefix)[0-9a-f]{62}\.json$")
+
+
+def temperature_is_zero(config: Mapping) -> bool:
+    """The default declaration of a deterministic chatbot configuration."""
+    return config.get("defaultTemperature") == 0
+
+
+class PromptCache:
+    """
+    Two-tier (memory and disk) cache of prompt responses, with an optional
+    shared backend tier.
+
+    deterministic is called with the chatbot config and declares whether the
+    chatbot's responses can be cached. Chatbots named in chatbots are always
+    treated as deterministic.
+    """
+
+    def __init__(
+        self,
+        ttl: int = None,
+        maxsize: int = None,
+        directory: str = None,
+        disk_ttl: int = None,
+        deterministic: Callable[[Mapping], bool] = temperature_is_zero,
+        chatbots: Iterable[str] = None,
+        backend: CacheBackend = None,
+    ):
+        self.ttl = ttl or smarter_settings.smarter_default_cache_timeout
+        self.maxsize = maxsize or smarter_settings.smarter_max_cache_size
+        self.directory = directory
+        self.disk_ttl = disk_ttl or self.ttl
+        self.deterministic = deterministic
+        self.chatbots = set(chatbots or [])
+        self.backend = backend
+        self._memory = TTLCache(maxsize=self.maxsize, ttl=self.ttl)
+        self._lock = threading.Lock()
+        forking.register(self)
+        self.hits = 0
+        self.disk_hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def is_cacheable(self, chatbot) -> bool:
+        """Return True if the user declared this chatbot's configuration to be deterministic."""
+        if chatbot.name in self.chatbots or self.deterministic(chatbot.config):
+            return True
+        with self._lock:
+            self.bypassed += 1
+        return False
+
+    @staticmethod
+    def scope(chatbot, verbose: bool = False) -> str:
+        """
+        Return a digest of everything that a cached response depends on other
+        than the prompt text: the chatbot identity, manifest version and
+        modified timestamp, and the model and temperature of the chatbot config.
+        """
+        snapshot = chatbot.snapshot
+        parts = [
+            PROMPT_CACHE_KEY_VERSION,
+            chatbot.base_url,
+            snapshot.name,
+            snapshot.chatbot_id,
+            snapshot.version,
+            snapshot.modified,
+            snapshot.config.get("defaultModel"),
+            snapshot.config.get("defaultTemperature"),
+            verbose,
+        ]
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def key(chatbot, message: str, verbose: bool = False) -> str:
+        """Return the cache key for a prompt to a chatbot."""
+        scope = PromptCache.scope(chatbot, verbose=verbose)
+        return hashlib.sha256(f"{scope}:{message}".encode("utf-8")).hexdigest()
+
+    def lookup(self, chatbot, message: str, verbose: bool = False) -> Optional[Any]:
+        """Return the cached response to a prompt, or None."""
+        return self.get(self.key(chatbot, message, verbose=verbose))
+
+    def store(self, chatbot, message: str, response: Any, verbose: bool = False) -> None:
+        """Cache the response to a prompt."""
+        self.set(self.key(chatbot, message, verbose=verbose), response)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached response for a key, or None."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self.hits += 1
+                return copy.deepcopy(value) if isinstance(value, dict) else value
+        value = self._read_disk(key)
+        tier = "disk_hits"
+        if value is None and self.backend is not None:
+            value = self.backend.get(key)
+            tier = "backend_hits"
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            setattr(self, tier, getattr(self, tier) + 1)
+            self._memory[key] = copy.deepcopy(value) if isinstance(value, dict) else value
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Cache a response in memory and, if configured, on disk and in the backend."""
+        with self._lock:
+            self._memory[key] = copy.deepcopy(value) if isinstance(value, dict) else value
+        self._write_disk(key, value)
+        if self.backend is not None:
+            self.backend.set(key, value, ttl=self.disk_ttl)
+
+    def clear(self) -> None:
+        """
+        Remove all cached responses from both tiers. Only files that match the
+        layout of the disk tier are removed from the cache directory.
+        """
+        with self._lock:
+            self._memory.clear()
+        if self.directory:
+            for root, _, files in os.walk(self.directory):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    if DISK_ENTRY_PATTERN.match(os.path.relpath(path, self.directory).replace(os.sep, "/")):
+                        os.remove(path)
+
+    def _after_fork(self) -> None:
+        # the cached responses stay warm in the child, only the lock is replaced.
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "backend_hits": self.backend_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Any]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires", 0) < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get("value")
+
+    def _write_disk(self, key: str, value: Any) -> None:
+        if not self.directory:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires": time.time() + self.disk_ttl, "value": value}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            logger.warning("PromptCache() unable to write %s: %s", path, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
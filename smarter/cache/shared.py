@@ -0,0 +1,209 @@
+"""
+smarter-api host-local shared manifest cache.
+
+Every worker process keeps its own RESOURCE_CACHE, so a host that runs 32
+workers describes the same chatbots 32 times. SharedManifestCache is a
+CacheBackend that keeps chatbot snapshots in a SQLite database in WAL mode,
+which every process on the host can read concurrently while one process
+writes.
+
+Entries expire after ttl seconds. When an entry is missing or expired, only
+one process refreshes it: the first one to take the key's refresh lease. The
+others poll for its result, and only fetch the chatbot themselves if the
+lease holder does not store it within the lease wait. Leases expire, so a
+process that dies while it refreshes cannot block a key for long.
+
+    cache = SharedManifestCache("/var/run/smarter/manifests.db")
+    client = Smarter(shared_cache=cache)
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from smarter.cache.backends import CacheBackend, dumps, loads
+from smarter.common import forking
+from smarter.common.conf import settings as smarter_settings
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifests (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+"""
+
+
+class SharedManifestCache(CacheBackend):
+    """
+    A cross-process cache of ChatbotSnapshots, keyed by resource cache key, in a
+    SQLite database at path. Each thread of each process has its own connection.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: int = None,
+        lease: float = 30.0,
+        lease_wait: float = 5.0,
+        poll: float = 0.05,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.path = path
+        self.ttl = ttl or smarter_settings.smarter_default_cache_timeout
+        self.lease = lease
+        self.lease_wait = lease_wait
+        self.poll = poll
+        self.clock = clock
+        self.sleep = sleep
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.waits = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection.executescript(SCHEMA)
+        forking.register(self)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection to the database, opened on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # autocommit, with explicit transactions where several statements must be atomic.
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _after_fork(self) -> None:
+        # sqlite connections must not be used across a fork, so the child opens its own.
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def owner(self) -> str:
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self.connection.execute(
+            "SELECT value FROM manifests WHERE key = ? AND expires > ?", (key, self.clock())
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return loads(row[0])
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        rows = self.connection.execute(
+            f"SELECT key, value FROM manifests WHERE key IN ({placeholders}) AND expires > ?",
+            (*keys, self.clock()),
+        ).fetchall()
+        with self._lock:
+            self.hits += len(rows)
+            self.misses += len(keys) - len(rows)
+        return {key: loads(value) for key, value in rows}
+
+    def set(self, key: str, value: Any, ttl: int = None) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO manifests (key, value, expires) VALUES (?, ?, ?)",
+            (key, dumps(value), self.clock() + (ttl or self.ttl)),
+        )
+
+    def delete(self, key: str) -> None:
+        self.connection.execute("DELETE FROM manifests WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self.connection.executescript("DELETE FROM manifests; DELETE FROM leases;")
+
+    def purge(self) -> int:
+        """Delete the expired entries and leases. Returns the number of entries deleted."""
+        now = self.clock()
+        deleted = self.connection.execute("DELETE FROM manifests WHERE expires <= ?", (now,)).rowcount
+        self.connection.execute("DELETE FROM leases WHERE expires <= ?", (now,))
+        return deleted
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM manifests WHERE expires > ?", (self.clock(),)).fetchone()[
+            0
+        ]
+
+    def acquire_lease(self, key: str) -> bool:
+        """Take the refresh lease of a key, unless another process or thread holds it."""
+        now = self.clock()
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT owner FROM leases WHERE key = ? AND expires > ?", (key, now)).fetchone()
+            if row is not None and row[0] != self.owner:
+                connection.execute("COMMIT")
+                return False
+            connection.execute(
+                "INSERT OR REPLACE INTO leases (key, owner, expires) VALUES (?, ?, ?)",
+                (key, self.owner, now + self.lease),
+            )
+            connection.execute("COMMIT")
+            return True
+        except BaseException:
+            # sqlite rolls back by itself after some errors, and a second ROLLBACK would hide them.
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+
+    def release_lease(self, key: str) -> None:
+        self.connection.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def refresh(self, key: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Return the entry for key. If it is missing or expired, either fetch and store
+        it, if this process takes the refresh lease, or wait for the process that
+        holds the lease to store it.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        give_up = self.clock() + self.lease_wait
+        while True:
+            if self.acquire_lease(key):
+                try:
+                    value = fetch()
+                    self.set(key, value)
+                finally:
+                    self.release_lease(key)
+                with self._lock:
+                    self.refreshes += 1
+                return value
+            with self._lock:
+                self.waits += 1
+            self.sleep(self.poll)
+            value = self.get(key)
+            if value is not None:
+                return value
+            if self.clock() >= give_up:
+                logger.debug("SharedManifestCache.refresh() gave up waiting for the lease of %s", key)
+                value = fetch()
+                self.set(key, value)
+                return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self),
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "waits": self.waits,
+            }
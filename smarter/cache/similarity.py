@@ -0,0 +1,257 @@
+"""
+smarter-api near-duplicate prompt cache.
+
+Support chatbots receive large numbers of near-identical questions that only
+differ in whitespace, casing or a word or two. This cache answers such prompts
+from a previously cached response when they are similar enough, entirely
+offline and without an embedding service:
+
+1. prompts are normalized (unicode, casing, punctuation and whitespace),
+2. a MinHash signature is computed from the word shingles of the normalized
+   prompt,
+3. signatures are indexed in a banded locality sensitive hashing (LSH) table
+   so that candidate matches are found without comparing against every entry,
+4. candidates are scored by the Jaccard similarity of their words and the
+   best one is used if it meets the similarity threshold.
+
+At the default threshold of 0.8, a prompt of ten or so words matches one that
+differs from it by a changed word, or by a word or two added or left out.
+
+Entries are only ever matched against prompts to the same chatbot scope (see
+PromptCache.scope()), and are evicted by age and by least recent use. A
+PromptCache can be chained in front of the index, so that exact repeats are
+also served from its disk and shared tiers.
+"""
+
+import copy
+import logging
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from smarter.cache.prompt import PromptCache, temperature_is_zero
+from smarter.common import forking
+from smarter.common.conf import settings as smarter_settings
+from smarter.common.exceptions import SmarterValueError
+
+
+logger = logging.getLogger(__name__)
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+NON_WORD_PATTERN = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize unicode, casing, punctuation and whitespace."""
+    prompt = unicodedata.normalize("NFKC", prompt).casefold()
+    return NON_WORD_PATTERN.sub(" ", prompt).strip()
+
+
+def shingles(text: str, size: int = 1) -> Set[int]:
+    """Return the hashed shingles of size words of a normalized prompt."""
+    words = text.split()
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    grams = zip(*(words[offset:] for offset in range(size)))
+    return {zlib.crc32(" ".join(gram).encode("utf-8")) for gram in grams}
+
+
+def jaccard(first: Set[int], second: Set[int]) -> float:
+    return len(first & second) / len(first | second)
+
+
+class MinHasher:
+    """Computes MinHash signatures with num_perm universal hash functions."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rnd = random.Random(seed)
+        self.num_perm = num_perm
+        self.permutations = [
+            (rnd.randint(1, MERSENNE_PRIME - 1), rnd.randint(0, MERSENNE_PRIME - 1)) for _ in range(num_perm)
+        ]
+
+    def signature(self, hashes: Set[int]) -> Tuple[int, ...]:
+        return tuple(min(((a * x + b) % MERSENNE_PRIME) & MAX_HASH for x in hashes) for a, b in self.permutations)
+
+    @staticmethod
+    def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        """Estimate the Jaccard similarity of the two shingle sets."""
+        return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+
+class SimilarPromptCache:
+    """
+    In-memory near-duplicate prompt cache using MinHash signatures and LSH.
+    Like PromptCache, only chatbots that are declared deterministic are cached.
+
+    exact is an optional PromptCache that is looked up first, and that every
+    response is stored to as well.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        bands: int = 32,
+        maxsize: int = None,
+        ttl: int = None,
+        deterministic: Callable[[Mapping], bool] = temperature_is_zero,
+        chatbots: Iterable[str] = None,
+        exact: PromptCache = None,
+    ):
+        if num_perm % bands != 0:
+            raise SmarterValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.maxsize = maxsize or smarter_settings.smarter_max_cache_size
+        self.ttl = ttl or smarter_settings.smarter_default_cache_timeout
+        self.deterministic = deterministic
+        self.chatbots = set(chatbots or [])
+        self.exact = exact
+        self.hasher = MinHasher(num_perm=num_perm)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # entry ids in order of expiry. every entry has the same ttl, so this is insertion order.
+        self._expiries: "OrderedDict[int, float]" = OrderedDict()
+        self._buckets: Dict[tuple, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        forking.register(self)
+        self.lookups = 0
+        self.hits = 0
+        self.exact_hits = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.candidates = 0
+        self._hit_similarity_total = 0.0
+        self._hit_similarity_min = 1.0
+
+    def is_cacheable(self, chatbot) -> bool:
+        """Return True if the user declared this chatbot's configuration to be deterministic."""
+        if chatbot.name in self.chatbots or self.deterministic(chatbot.config):
+            return True
+        with self._lock:
+            self.bypassed += 1
+        return False
+
+    def _band_keys(self, scope: str, signature: Tuple[int, ...]) -> List[tuple]:
+        bounds = range(0, len(signature) + 1, self.rows)
+        return [(scope, band, signature[start:stop]) for band, (start, stop) in enumerate(zip(bounds, bounds[1:]))]
+
+    def lookup(self, chatbot, message: str, verbose: bool = False) -> Optional[Any]:
+        """Return the cached response of the most similar prompt above the threshold, or None."""
+        if self.exact is not None:
+            response = self.exact.lookup(chatbot, message, verbose=verbose)
+            if response is not None:
+                with self._lock:
+                    self.lookups += 1
+                    self.hits += 1
+                    self.exact_hits += 1
+                    self._hit_similarity_total += 1.0
+                # the response may come from another process, through a disk or shared tier.
+                self.store(chatbot, message, response, verbose=verbose, exact=False)
+                return response
+        scope = PromptCache.scope(chatbot, verbose=verbose)
+        normalized = normalize_prompt(message)
+        hashes = shingles(normalized)
+        signature = self.hasher.signature(hashes)
+        now = time.monotonic()
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for band_key in self._band_keys(scope, signature):
+                candidates.update(self._buckets.get(band_key, ()))
+            self.candidates += len(candidates)
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                _, _, entry_hashes, entry_normalized, _, expires = self._entries[entry_id]
+                if expires < now:
+                    continue
+                similarity = 1.0 if entry_normalized == normalized else jaccard(hashes, entry_hashes)
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None or best_similarity < self.threshold:
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            self.exact_hits += 1 if best_similarity == 1.0 else 0
+            self._hit_similarity_total += best_similarity
+            self._hit_similarity_min = min(self._hit_similarity_min, best_similarity)
+            response = self._entries[best_id][4]
+        logger.debug("SimilarPromptCache.lookup() hit similarity=%.3f", best_similarity)
+        return copy.deepcopy(response) if isinstance(response, dict) else response
+
+    def store(self, chatbot, message: str, response: Any, verbose: bool = False, exact: bool = True) -> None:
+        """Cache the response to a prompt, and store it to the exact cache too, unless exact is False."""
+        if exact and self.exact is not None:
+            self.exact.store(chatbot, message, response, verbose=verbose)
+        scope = PromptCache.scope(chatbot, verbose=verbose)
+        normalized = normalize_prompt(message)
+        hashes = frozenset(shingles(normalized))
+        signature = self.hasher.signature(hashes)
+        response = copy.deepcopy(response) if isinstance(response, dict) else response
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            expires = time.monotonic() + self.ttl
+            self._entries[entry_id] = (scope, signature, hashes, normalized, response, expires)
+            self._expiries[entry_id] = expires
+            for band_key in self._band_keys(scope, signature):
+                self._buckets.setdefault(band_key, set()).add(entry_id)
+            self._evict()
+
+    def _evict(self) -> None:
+        """
+        Remove expired entries, then the least recently used entries beyond maxsize.
+        Only the entries that are actually removed are visited.
+        """
+        now = time.monotonic()
+        while self._expiries and next(iter(self._expiries.values())) < now:
+            self._remove(next(iter(self._expiries)))
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id: int) -> None:
+        scope, signature, _, _, _, _ = self._entries.pop(entry_id)
+        del self._expiries[entry_id]
+        for band_key in self._band_keys(scope, signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band_key]
+        self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._expiries.clear()
+            self._buckets.clear()
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        """Hit rate and hit quality metrics."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "exact_hits": self.exact_hits,
+                "near_hits": self.hits - self.exact_hits,
+                "misses": self.lookups - self.hits,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "mean_hit_similarity": round(self._hit_similarity_total / self.hits, 4) if self.hits else None,
+                "min_hit_similarity": round(self._hit_similarity_min, 4) if self.hits else None,
+                "mean_candidates": round(self.candidates / self.lookups, 2) if self.lookups else 0.0,
+            }
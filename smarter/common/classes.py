@@ -2,16 +2,26 @@
 
 import json
 import logging
-from functools import cached_property
-from urllib.parse import urljoin
+import threading
+import time
+from collections.abc import Mapping
+from urllib.parse import urljoin, urlparse
 
-from cachetools import LRUCache
+import httpx
 from httpx import Client as httpx_Client
 from httpx import Response as httpx_Response  # copying openai api use of httpx for now.
 
+from smarter.common import forking
 from smarter.common.conf import settings as smarter_settings
+from smarter.common.exceptions import SmarterDeadlineExceededError
 from smarter.common.mixins import SmarterHelperMixin
+from smarter.common.models.base import ModelView
 from smarter.common.models.whoami import SmarterApiBaseModel, WhoAmIModel
+from smarter.common.pool import get_http_client
+from smarter.common.sync import LockedLRUCache, lazy_property
+from smarter.traffic.deadlines import NO_DEADLINE, current_deadline, remaining
+from smarter.traffic.hedging import Hedger
+from smarter.traffic.timeouts import AdaptiveTimeouts
 
 
 logger = logging.getLogger(__name__)
@@ -20,7 +30,7 @@ logger = logging.getLogger(__name__)
 # persistent cache for the API responses. need to consider the trade-offs of
 # using a disk-based cache and how this might affect installations on different
 # operating systems, Kubernetes and other containerized environments, etc.
-SMARTER_HELPER_MIXIN_CACHE = LRUCache(maxsize=smarter_settings.smarter_max_cache_size)
+SMARTER_HELPER_MIXIN_CACHE = LockedLRUCache(maxsize=smarter_settings.smarter_max_cache_size)
 DEFAULT_API_ENDPOINT = "cli/whoami/"
 
 
@@ -29,11 +39,13 @@ class ApiBase(SmarterHelperMixin):
 
     _api_key: str
     _timeout: int
-    _client: httpx_Client
     _url_endpoint: str
-    _httpx_response: httpx_Response
+    _httpx_response: httpx_Response = None
     _model_class: SmarterApiBaseModel = WhoAmIModel
     _model: SmarterApiBaseModel = None
+    _hedger: Hedger = None
+    _adaptive_timeouts: AdaptiveTimeouts = None
+    _base_url: str = None
 
     def __init__(
         self,
@@ -41,24 +53,46 @@ class ApiBase(SmarterHelperMixin):
         url_endpoint: str = DEFAULT_API_ENDPOINT,
         model_class: SmarterApiBaseModel = None,
         timeout: int = None,
+        model: SmarterApiBaseModel = None,
+        lazy: bool = False,
+        hedger: Hedger = None,
+        adaptive_timeouts: AdaptiveTimeouts = None,
+        base_url: str = None,
     ):
         """
         Initializes the class with the api key, url endpoint, and Pydantic model.
         We default to the WhoAmIModel if no model is provided so that Smarter()
         can be initialized without any arguments. The validate() method is probably
         no longer needed since we are using Pydantic models, but it doesn't hurt to keep it.
+
+        An already-parsed model instance can be passed in, for example when restoring
+        a warm client state from disk, in which case the initial api request is skipped.
+        With lazy=True the initial api request is deferred until the model is first needed.
+        The initial api request is idempotent, so it is hedged if a Hedger is passed in.
+        With adaptive_timeouts the read timeout of each request is learned from the
+        observed latency of its endpoint. base_url overrides the api url of the
+        configured environment, for example to target a local server.
         """
         super().__init__()
+        # guards the lazy initial api request, so that concurrent threads make it only once.
+        self._lock = threading.RLock()
+        forking.register(self)
 
         self._model_class: SmarterApiBaseModel = model_class or WhoAmIModel
         self._api_key = api_key or smarter_settings.smarter_api_key.get_secret_value()
         if not self.api_key:
             raise ValueError("api_key is required")
         self._timeout = timeout or smarter_settings.smarter_default_http_timeout
-        self._client = httpx_Client(timeout=self.timeout)
         self._url_endpoint = url_endpoint
-        self._httpx_response = self.post(url=self.url)
-        self.validate()
+        self._hedger = hedger
+        self._adaptive_timeouts = adaptive_timeouts
+        self._base_url = base_url.rstrip("/") + "/" if base_url else None
+        if model is not None:
+            self._model = model
+            self.validate()
+        elif not lazy:
+            self._httpx_response = self.fetch()
+            self.validate()
 
         logger.debug("%s.__init__() base_url=%s", self.formatted_class_name, self.base_url)
 
@@ -72,15 +106,23 @@ class ApiBase(SmarterHelperMixin):
     @property
     def model(self) -> SmarterApiBaseModel:
         """
-        Returns the Pydantic model instance.
+        Returns the Pydantic model instance, parsing it on first use.
         """
-        if not self._model:
-            if not self.httpx_response:
-                raise ValueError("http response did not return any data.")
-            self._model = self.model_class(**self.httpx_response.json())
-        return self._model
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    if not self.httpx_response:
+                        raise ValueError("http response did not return any data.")
+                    self._model = self.model_class(**self.httpx_response.json())
+                model = self._model
+        return model
+
+    def _after_fork(self) -> None:
+        # a thread of the parent may have been in the middle of the initial api request.
+        self._lock = threading.RLock()
 
-    @cached_property
+    @lazy_property
     def url(self) -> str:
         """
         Returns the full url for the smarter api.
@@ -88,7 +130,7 @@ class ApiBase(SmarterHelperMixin):
         """
         return urljoin(self.base_url, self.url_endpoint)
 
-    @cached_property
+    @lazy_property
     def url_endpoint(self) -> str:
         """
         Returns the url endpoint for the smarter api.
@@ -102,38 +144,96 @@ class ApiBase(SmarterHelperMixin):
         """
         return self.client.get(url)
 
-    def post(self, url: str, data: dict = None, headers=None) -> httpx_Response:
+    def post(self, url: str, data: dict = None, headers=None, api_key: str = None) -> httpx_Response:
         """
-        Makes a post request to the smarter api
+        Makes a post request to the smarter api, with this object's api key unless another key is given.
+        The request is bounded by the current call deadline, if there is one.
         """
         headers = headers or {}
-        headers["Authorization"] = f"Token {self.api_key}"
+        headers["Authorization"] = f"Token {api_key or self.api_key}"
         logger.debug(
             "%s.post() url=%s headers=%s data=%s", self.formatted_class_name, url, json.dumps(headers, indent=4), data
         )
-        response = self.client.post(url, json=data, headers=headers)
+        endpoint = urlparse(url).path
+        start = time.monotonic()
+        try:
+            response = self.client.post(url, json=data, headers=headers, timeout=self.request_timeout(endpoint))
+        except httpx.TimeoutException as e:
+            if current_deadline().expired:
+                raise SmarterDeadlineExceededError(f"{self.formatted_class_name}.post() {endpoint} timed out") from e
+            raise
+        if self.adaptive_timeouts is not None:
+            self.adaptive_timeouts.observe(endpoint, time.monotonic() - start)
         response.raise_for_status()
         return response
 
+    def request_timeout(self, endpoint: str):
+        """
+        Returns the httpx timeouts for a request to an endpoint: the client's per-phase
+        timeouts, with the adaptive read timeout of the endpoint, each cut short to the
+        time that remains until the current call deadline.
+        """
+        deadline = current_deadline()
+        if self.adaptive_timeouts is None and deadline == NO_DEADLINE:
+            return httpx.USE_CLIENT_DEFAULT
+        deadline.check(f"{self.formatted_class_name}.post() {endpoint}")
+        timeout: httpx.Timeout = self.client.timeout
+        read = timeout.read
+        if self.adaptive_timeouts is not None:
+            adaptive = self.adaptive_timeouts.read_timeout(endpoint)
+            read = adaptive if read is None else min(read, adaptive)
+        return httpx.Timeout(
+            connect=remaining(timeout.connect),
+            read=remaining(read),
+            write=remaining(timeout.write),
+            pool=remaining(timeout.pool),
+        )
+
+    def fetch(self) -> httpx_Response:
+        """
+        Makes the initial api request for this object's model, hedged if a Hedger was passed in.
+        """
+        if self.hedger is None:
+            return self.post(url=self.url)
+        endpoint = urlparse(self.url_endpoint).path
+        return self.hedger.call(endpoint, lambda: self.post(url=self.url))
+
+    @property
+    def hedger(self) -> Hedger:
+        return self._hedger
+
+    @property
+    def adaptive_timeouts(self) -> AdaptiveTimeouts:
+        return self._adaptive_timeouts
+
     def validate(self):
         """
         Validates the current client. We probably no longer need this since we are using pydantic models.
         """
-        if not self.httpx_response:
+        if self._model is None and not self.httpx_response:
             raise ValueError("http response did not return any data")
         json_data = self.to_json()
         if not json_data:
             raise ValueError("http response did not return any json data")
 
-    @cached_property
+    @property
     def httpx_response(self) -> httpx_Response:
+        """
+        Returns the http response of the initial api request, making the request
+        first if it was deferred. None if the model was passed in at initialization.
+        """
+        if self._httpx_response is None and self._model is None:
+            with self._lock:
+                if self._httpx_response is None and self._model is None:
+                    self._httpx_response = self.fetch()
+                    self.validate()
         return self._httpx_response
 
     def to_json(self) -> dict:
         # return self.httpx_response.json()
         return self.model.model_dump()
 
-    @cached_property
+    @lazy_property
     def data(self) -> dict:
         """
         Returns the data from the Pydantic model. The structure of the data will depend on the model.
@@ -141,7 +241,7 @@ class ApiBase(SmarterHelperMixin):
         """
         return self.model.data
 
-    @cached_property
+    @lazy_property
     def api(self) -> str:
         """
         Returns the api from the Py
@@ -149,7 +249,7 @@ class ApiBase(SmarterHelperMixin):
         """
         return self.model.api
 
-    @cached_property
+    @lazy_property
     def thing(self) -> str:
         """
         Returns the thing from the Pydantic model. A 'kind' of manifest.
@@ -157,15 +257,15 @@ class ApiBase(SmarterHelperMixin):
         """
         return self.model.thing
 
-    @cached_property
-    def metadata(self) -> str:
+    @lazy_property
+    def metadata(self) -> Mapping:
         """
-        Returns the metadata from the Pydantic model.
+        Returns a read-only view of the metadata from the Pydantic model.
         example: {"key": "314f94d110391787b282f7791fc810ac8ec852f748c074e8b7299506ebfd9bbc"}
         """
-        return self.model.metadata.model_dump()
+        return ModelView(self.model.metadata)
 
-    @cached_property
+    @lazy_property
     def message(self) -> str:
         """
         Returns the message from the Pydantic model. Usually this a human readable message
@@ -173,7 +273,7 @@ class ApiBase(SmarterHelperMixin):
         """
         return self.model.message
 
-    @cached_property
+    @lazy_property
     def status(self) -> any:
         """
         Returns the status from the Pydantic model. This is a dict who's keys
@@ -181,14 +281,17 @@ class ApiBase(SmarterHelperMixin):
         """
         return self.model.status
 
-    @cached_property
+    @property
     def client(self) -> httpx_Client:
         """
-        Returns the httpx client for managing http requests.
+        Returns the httpx client for managing http requests. This is the process-wide
+        shared client for our timeout, so that connections are pooled across all
+        instances, and objects that never make a request don't hold any connections.
+        It is not cached on the instance, so that a forked child uses its own client.
         """
-        return self._client
+        return get_http_client(self.timeout)
 
-    @cached_property
+    @lazy_property
     def api_key(self) -> str:
         """
         Returns the api key for the Smarter API. This is required for all requests
@@ -196,23 +299,20 @@ class ApiBase(SmarterHelperMixin):
         """
         return self._api_key
 
-    @cached_property
+    @lazy_property
     def timeout(self) -> int:
         """
         Returns the timeout for the httpx client.
         """
         return self._timeout
 
-    @cached_property
+    @lazy_property
     def base_url(self) -> str:
         """
         Returns the base url for the Smarter API. This is the root url for the API.
         example: https://platform.smarter.sh/api/v1/
         """
-        return smarter_settings.environment_api_url
-
-    def __del__(self):
-        self.client.close()
+        return self._base_url or smarter_settings.environment_api_url
 
     def __str__(self):
         api_key = self.api_key[-4:] if self.api_key and len(self.api_key) >= 4 else None
@@ -36,7 +36,11 @@ from pydantic_settings import BaseSettings
 from .const import (
     SMARTER_API_VERSION,
     SMARTER_DEFAULT_CACHE_TIMEOUT,
+    SMARTER_DEFAULT_CONNECT_TIMEOUT,
     SMARTER_DEFAULT_HTTP_TIMEOUT,
+    SMARTER_DEFAULT_POOL_TIMEOUT,
+    SMARTER_DEFAULT_READ_TIMEOUT,
+    SMARTER_DEFAULT_WRITE_TIMEOUT,
     SMARTER_MAX_CACHE_SIZE,
     SMARTER_PLATFORM_SUBDOMAIN,
     VERSION,
@@ -120,6 +124,10 @@ class SettingsDefaults:
     SMARTER_ENVIRONMENT = os.environ.get("SMARTER_ENVIRONMENT", SmarterEnvironments.PROD)
     SMARTER_API_KEY = os.environ.get("SMARTER_API_KEY", "")
     SMARTER_DEFAULT_HTTP_TIMEOUT = SMARTER_DEFAULT_HTTP_TIMEOUT
+    SMARTER_CONNECT_TIMEOUT = SMARTER_DEFAULT_CONNECT_TIMEOUT
+    SMARTER_READ_TIMEOUT = SMARTER_DEFAULT_READ_TIMEOUT
+    SMARTER_WRITE_TIMEOUT = SMARTER_DEFAULT_WRITE_TIMEOUT
+    SMARTER_POOL_TIMEOUT = SMARTER_DEFAULT_POOL_TIMEOUT
     SMARTER_DEFAULT_CACHE_TIMEOUT = SMARTER_DEFAULT_CACHE_TIMEOUT
     SMARTER_MAX_CACHE_SIZE = SMARTER_MAX_CACHE_SIZE
 
@@ -227,6 +235,12 @@ class Settings(BaseSettings):
     smarter_default_http_timeout: Optional[int] = Field(
         SettingsDefaults.SMARTER_DEFAULT_HTTP_TIMEOUT, env="SMARTER_DEFAULT_HTTP_TIMEOUT"
     )
+    smarter_connect_timeout: Optional[float] = Field(
+        SettingsDefaults.SMARTER_CONNECT_TIMEOUT, env="SMARTER_CONNECT_TIMEOUT"
+    )
+    smarter_read_timeout: Optional[float] = Field(SettingsDefaults.SMARTER_READ_TIMEOUT, env="SMARTER_READ_TIMEOUT")
+    smarter_write_timeout: Optional[float] = Field(SettingsDefaults.SMARTER_WRITE_TIMEOUT, env="SMARTER_WRITE_TIMEOUT")
+    smarter_pool_timeout: Optional[float] = Field(SettingsDefaults.SMARTER_POOL_TIMEOUT, env="SMARTER_POOL_TIMEOUT")
 
     @cached_property
     def environment_domain(self) -> str:
@@ -490,6 +504,17 @@ class Settings(BaseSettings):
             raise ValueError("HTTP timeout must be greater than or equal to 0")
         return retval
 
+    @field_validator("smarter_connect_timeout", "smarter_read_timeout", "smarter_write_timeout", "smarter_pool_timeout")
+    def check_smarter_phase_timeouts(cls, v, info) -> Optional[float]:
+        """Check smarter_connect_timeout, smarter_read_timeout, smarter_write_timeout and smarter_pool_timeout"""
+        if v in [None, ""]:
+            default = getattr(SettingsDefaults, info.field_name.upper())
+            return float(default) if default is not None else None
+        retval = float(v)
+        if retval <= 0:
+            raise ValueError("HTTP timeouts must be greater than 0")
+        return retval
+
 
 class SingletonSettings:
     """
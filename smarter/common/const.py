@@ -12,8 +12,16 @@ logger = logging.getLogger(__name__)
 SMARTER_API_VERSION = "v1"
 SMARTER_PLATFORM_SUBDOMAIN = "platform"
 SMARTER_DEFAULT_HTTP_TIMEOUT = 60  # seconds
+SMARTER_DEFAULT_CONNECT_TIMEOUT = 5.0  # seconds
+SMARTER_DEFAULT_READ_TIMEOUT = None  # seconds, or None for the client timeout
+SMARTER_DEFAULT_WRITE_TIMEOUT = 10.0  # seconds
+SMARTER_DEFAULT_POOL_TIMEOUT = 5.0  # seconds
 SMARTER_DEFAULT_CACHE_TIMEOUT = 60 * 10  # 10 minutes
 SMARTER_MAX_CACHE_SIZE = 128
+SMARTER_DEFAULT_PAGE_SIZE = 100
+SMARTER_DEFAULT_MAX_CONCURRENCY = 8
+SMARTER_HTTP_MAX_CONNECTIONS = 100
+SMARTER_HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
 
 HERE = os.path.abspath(os.path.dirname(__file__))  # smarter/smarter/common
 PROJECT_ROOT = str(Path(HERE).parent)  # smarter/smarter
@@ -41,3 +41,15 @@ class SmarterIlligalInvocationError(SmarterExceptionBase):
 
 class SmarterBusinessRuleViolation(SmarterExceptionBase):
     """Exception raised when policies are violated."""
+
+
+class SmarterRateLimitError(SmarterExceptionBase):
+    """Exception raised when a request cannot be admitted within the client-side rate limits."""
+
+
+class SmarterQueueTimeoutError(SmarterExceptionBase):
+    """Exception raised when a request is shed after waiting in the queue for longer than its deadline."""
+
+
+class SmarterDeadlineExceededError(SmarterExceptionBase):
+    """Exception raised when a call cannot complete before its deadline."""
@@ -0,0 +1,55 @@
+"""
+smarter-api fork safety.
+
+Pre-fork servers, such as gunicorn and Celery's prefork pool, import and warm
+up the SDK in a parent process and then fork() their workers. A child process
+inherits copies of the parent's sockets and locks, but not its threads. Pooled
+keep-alive connections would then be shared by the parent and every child, and
+a lock that another thread held at the time of the fork could never be released.
+
+Modules register a function with at_fork() and objects that own locks register
+themselves with register(). In the child, right after a fork, these reset the
+connection pools, locks and per-thread bookkeeping. Caches of plain data, such
+as RESOURCE_CACHE and its chatbot snapshots, are left as they are, so that each
+worker starts warm without re-fetching anything.
+"""
+
+import logging
+import os
+import weakref
+from typing import Callable, List
+
+
+logger = logging.getLogger(__name__)
+
+_hooks: List[Callable[[], None]] = []
+_objects: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def at_fork(hook: Callable[[], None]) -> Callable[[], None]:
+    """Register a function to run in the child after a fork. Usable as a decorator."""
+    _hooks.append(hook)
+    return hook
+
+
+def register(obj) -> None:
+    """
+    Register an object whose _after_fork() method is to be called in the child
+    after a fork. Objects are held by weak reference.
+    """
+    _objects.add(obj)
+
+
+def after_fork_in_child() -> None:
+    """Reset the registered state. Called automatically in the child after os.fork()."""
+    for hook in _hooks:
+        hook()
+    for obj in list(_objects):
+        obj._after_fork()  # pylint: disable=protected-access
+    logger.debug(
+        "after_fork_in_child() reset %s modules and %s objects in pid %s", len(_hooks), len(_objects), os.getpid()
+    )
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=after_fork_in_child)
@@ -2,11 +2,66 @@
 """
 Base models for all API responses.
 """
-from typing import Optional
+from collections.abc import Mapping
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any, Iterator, Optional
 
 from pydantic import BaseModel
 
 
+class ModelView(Mapping):
+    """
+    Read-only mapping view of a Pydantic model. Values are read directly from
+    the model rather than from a model_dump() copy, and nested models and lists
+    are wrapped in views of their own the first time that they are accessed.
+    Use to_dict() when a real, mutable dict is needed, for example for json.dumps().
+    """
+
+    __slots__ = ("_model", "_views")
+
+    def __init__(self, model: BaseModel):
+        self._model = model
+        self._views = {}
+
+    @staticmethod
+    def wrap(value: Any) -> Any:
+        """Wrap nested models and lists so that they are read-only as well."""
+        if isinstance(value, BaseModel):
+            return ModelView(value)
+        if isinstance(value, list):
+            return tuple(ModelView.wrap(item) for item in value)
+        if isinstance(value, dict):
+            return MappingProxyType({k: ModelView.wrap(v) for k, v in value.items()})
+        return value
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._views:
+            return self._views[key]
+        if key not in type(self._model).model_fields:
+            raise KeyError(key)
+        value = getattr(self._model, key)
+        if isinstance(value, (BaseModel, list, dict)):
+            value = self._views[key] = ModelView.wrap(value)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(type(self._model).model_fields)
+
+    def __len__(self) -> int:
+        return len(type(self._model).model_fields)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._model!r})"
+
+    @property
+    def model(self) -> BaseModel:
+        return self._model
+
+    def to_dict(self) -> dict:
+        return self._model.model_dump()
+
+
 class MetadataModel(BaseModel):
     """
     Metadata model for all API responses. Key might vary depending on the API end points.
@@ -20,12 +75,20 @@ class SmarterApiBaseModel(BaseModel):
     """
     Base model for all API responses. 'data' and 'status' will vary for each
     API end point and are assumed to be overridden by the inheriting class.
+
+    Typed views of nested data are parsed once and then cached on the instance
+    via functools.cached_property, which Pydantic leaves alone.
     """
 
     data: dict
     api: str
     thing: Optional[str]
     metadata: MetadataModel
-    status: dict = None
+    status: Optional[dict] = None
     message: Optional[str] = None
     error: Optional[str] = None  # FIX ME: This should be a dict
+
+    @cached_property
+    def view(self) -> ModelView:
+        """Read-only mapping view of this response."""
+        return ModelView(self)
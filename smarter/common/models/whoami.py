@@ -5,6 +5,7 @@ This module contains the WhoAmIModel class, which is used to represent the
 response from the WhoAmI API endpoint. The WhoAmI API endpoint is used to
 retrieve information about the current user and their account.
 """
+from functools import cached_property
 from typing import Optional
 
 from pydantic import BaseModel, EmailStr
@@ -49,14 +50,14 @@ class WhoAmIModel(SmarterApiBaseModel):
     message: Optional[str] = None
     error: Optional[str] = None  # FIX ME: This should be a dict
 
-    @property
+    @cached_property
     def user(self) -> UserModel:
         return UserModel(**self.data["user"])
 
-    @property
+    @cached_property
     def account(self) -> AccountModel:
         return AccountModel(**self.data["account"])
 
-    @property
+    @cached_property
     def environment(self) -> str:
         return self.data["environment"]
@@ -0,0 +1,105 @@
+"""
+Shared pool of httpx clients.
+
+httpx clients are thread-safe and each one maintains its own connection pool,
+so rather than creating a client per ApiBase instance we share one client per
+timeout value across the whole process. This lets concurrent requests, for
+example Chatbots.get_many(), reuse keep-alive connections.
+
+After a fork the child forgets the parent's clients, without closing them,
+since their connections still belong to the parent, and creates its own.
+
+The connect, read, write and pool phases of each request have their own
+timeouts, from Settings, each of which is capped at the client's timeout.
+
+set_transport() routes every shared client through another httpx transport,
+for example one that records or replays traffic.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+from smarter.common import forking
+from smarter.common.conf import settings as smarter_settings
+from smarter.common.const import (
+    SMARTER_HTTP_MAX_CONNECTIONS,
+    SMARTER_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+)
+
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[float, httpx.Client] = {}
+_lock = threading.Lock()
+_transport: Optional[httpx.BaseTransport] = None
+
+
+def http_timeout(timeout: float) -> httpx.Timeout:
+    """
+    The per-phase timeouts from Settings, each capped at timeout. Unless
+    SMARTER_READ_TIMEOUT is set, the read timeout is timeout itself, so that a
+    client with a long timeout can wait that long for a slow response.
+    """
+    read_timeout = smarter_settings.smarter_read_timeout
+    return httpx.Timeout(
+        connect=min(timeout, smarter_settings.smarter_connect_timeout),
+        read=min(timeout, read_timeout) if read_timeout is not None else timeout,
+        write=min(timeout, smarter_settings.smarter_write_timeout),
+        pool=min(timeout, smarter_settings.smarter_pool_timeout),
+    )
+
+
+def get_http_client(timeout: float) -> httpx.Client:
+    """Return the shared httpx client for a timeout value, creating it on first use."""
+    client = _clients.get(timeout)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(timeout)
+        if client is None:
+            client = httpx.Client(timeout=http_timeout(timeout), limits=http_limits(), transport=_transport)
+            _clients[timeout] = client
+            logger.debug("get_http_client() created shared client timeout=%s", timeout)
+        return client
+
+
+@forking.at_fork
+def _reset_after_fork() -> None:
+    global _clients, _lock  # pylint: disable=global-statement
+    _clients = {}
+    _lock = threading.Lock()
+
+
+def http_limits() -> httpx.Limits:
+    """The connection pool limits of the shared clients."""
+    return httpx.Limits(
+        max_connections=SMARTER_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=SMARTER_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    )
+
+
+def set_transport(transport: Optional[httpx.BaseTransport]) -> Optional[httpx.BaseTransport]:
+    """
+    Route the requests of every shared client through transport, or through the
+    network again if transport is None. The shared clients are recreated on next
+    use, and the old ones are left for the garbage collector, since other threads
+    may still be using them. Returns the previous transport.
+    """
+    global _transport  # pylint: disable=global-statement
+    with _lock:
+        previous, _transport = _transport, transport
+        _clients.clear()
+    logger.debug("set_transport() transport=%s", type(transport).__name__ if transport else None)
+    return previous
+
+
+def close_http_clients() -> None:
+    """Close and forget all shared httpx clients."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
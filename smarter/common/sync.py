@@ -0,0 +1,129 @@
+"""
+smarter-api thread-safe lazy initialization and caches.
+
+On free-threaded CPython, threads really do run the SDK at the same time, so
+lazily initialized attributes and module-level caches must be safe without
+relying on the GIL, and must not funnel every thread through one lock.
+
+lazy_property is a lock-free replacement for functools.cached_property. Two
+threads that read an uninitialized attribute at once may both compute it, but
+only the first result is published and both threads return that one, through
+a single dict.setdefault(). After that the value is read straight from the
+instance dict, as with cached_property. functools.cached_property instead
+holds one lock per property across every instance of the class on Python 3.11,
+so threads that first touch the properties of different chatbots wait for
+each other. Use lazy_property for values that are cheap and free of side
+effects to compute more than once, and a lock for the others.
+
+LockedLRUCache is a cachetools LRUCache whose operations hold a lock, since
+even a lookup reorders an LRUCache.
+"""
+
+import threading
+from typing import Any, Callable
+
+from cachetools import LRUCache
+
+from smarter.common import forking
+
+
+_MISSING = object()
+
+
+class lazy_property:  # pylint: disable=invalid-name
+    """A lock-free cached property. The first computed value wins."""
+
+    def __init__(self, func: Callable[[Any], Any]):
+        self.func = func
+        self.attrname = None
+        self.__doc__ = func.__doc__
+        self.__module__ = func.__module__
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.attrname = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        cache = instance.__dict__
+        value = cache.get(self.attrname, _MISSING)
+        if value is _MISSING:
+            value = cache.setdefault(self.attrname, self.func(instance))
+        return value
+
+
+class _ForkSafeLock:
+    """
+    A reentrant lock that is replaced in the child after a fork. Mappings are
+    unhashable, so they can't register themselves with forking, but their lock can.
+    """
+
+    __slots__ = ("lock", "__weakref__")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        forking.register(self)
+
+    def _after_fork(self) -> None:
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.lock.__exit__(*exc_info)
+
+
+class LockedLRUCache(LRUCache):
+    """A thread-safe LRUCache. The entries stay warm in a forked child."""
+
+    def __init__(self, maxsize: int, getsizeof: Callable[[Any], int] = None):
+        super().__init__(maxsize, getsizeof=getsizeof)
+        self._lock = _ForkSafeLock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            super().__delitem__(key)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return super().__contains__(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return super().__len__()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return super().get(key, default)
+
+    def pop(self, key, default=_MISSING):
+        with self._lock:
+            if default is _MISSING:
+                return super().pop(key)
+            return super().pop(key, default)
+
+    def popitem(self):
+        with self._lock:
+            return super().popitem()
+
+    def setdefault(self, key, default=None):
+        with self._lock:
+            return super().setdefault(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+
+    def items(self) -> list:
+        """A snapshot of the entries, which is safe to iterate while other threads write."""
+        with self._lock:
+            return list(super().items())
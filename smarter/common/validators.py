@@ -10,6 +10,8 @@ TODO: add `import validators` and study this library to see what can be removed
 import logging
 import re
 import warnings
+from functools import lru_cache
+from typing import Any, Callable, Iterable, List, Optional, Pattern, Tuple
 from urllib.parse import urlparse, urlunparse
 
 import validators
@@ -20,6 +22,8 @@ from smarter.common.exceptions import SmarterValueError
 
 logger = logging.getLogger(__name__)
 
+VALIDATOR_CACHE_SIZE = 4096
+
 
 # pylint: disable=R0904
 class SmarterValidator:
@@ -46,22 +50,36 @@ class SmarterValidator:
     VALID_CLEAN_STRING = r"^[\w\-\.~:\/\?#\[\]@!$&'()*+,;=%]+$"
     VALID_CLEAN_STRING_WITH_SPACES = r"^[\w\-\.~:\/\?#\[\]@!$&'()*+,;= %]+$"
 
+    # precompiled versions of the patterns above. Use these rather than passing the
+    # raw pattern strings to re.match(), which has to look them up in the re module
+    # cache on every call.
+    VALID_ACCOUNT_NUMBER_RE: Pattern = re.compile(VALID_ACCOUNT_NUMBER_PATTERN)
+    VALID_PORT_RE: Pattern = re.compile(VALID_PORT_PATTERN)
+    VALID_URL_RE: Pattern = re.compile(VALID_URL_PATTERN)
+    VALID_HOSTNAME_RE: Pattern = re.compile(VALID_HOSTNAME_PATTERN, re.IGNORECASE)
+    VALID_UUID_RE: Pattern = re.compile(VALID_UUID_PATTERN)
+    VALID_SESSION_KEY_RE: Pattern = re.compile(VALID_SESSION_KEY)
+    VALID_SEMANTIC_VERSION_RE: Pattern = re.compile(VALID_SEMANTIC_VERSION)
+    VALID_URL_FRIENDLY_STRING_RE: Pattern = re.compile(VALID_URL_FRIENDLY_STRING)
+    VALID_CLEAN_STRING_RE: Pattern = re.compile(VALID_CLEAN_STRING)
+    VALID_CLEAN_STRING_WITH_SPACES_RE: Pattern = re.compile(VALID_CLEAN_STRING_WITH_SPACES)
+
     @staticmethod
     def validate_session_key(session_key: str) -> None:
         """Validate session key format"""
-        if not re.match(SmarterValidator.VALID_SESSION_KEY, session_key):
+        if not isinstance(session_key, str) or not SmarterValidator.VALID_SESSION_KEY_RE.match(session_key):
             raise SmarterValueError(f"Invalid session key {session_key}")
 
     @staticmethod
     def validate_account_number(account_number: str) -> None:
         """Validate account number format"""
-        if not re.match(SmarterValidator.VALID_ACCOUNT_NUMBER_PATTERN, account_number):
+        if not isinstance(account_number, str) or not SmarterValidator.VALID_ACCOUNT_NUMBER_RE.match(account_number):
             raise SmarterValueError(f"Invalid account number {account_number}")
 
     @staticmethod
     def validate_port(port: str) -> None:
         """Validate port format"""
-        if not re.match(SmarterValidator.VALID_PORT_PATTERN, port):
+        if not isinstance(port, str) or not SmarterValidator.VALID_PORT_RE.match(port):
             raise SmarterValueError(f"Invalid port {port}")
 
     @staticmethod
@@ -73,31 +91,57 @@ class SmarterValidator:
             raise SmarterValueError(f"Invalid url {url}")
 
     @staticmethod
-    def validate_hostname(hostname: str) -> None:
-        """Validate hostname format"""
+    @lru_cache(maxsize=VALIDATOR_CACHE_SIZE)
+    def hostname_error(hostname: str) -> Optional[str]:
+        """
+        Return a description of what is wrong with a hostname, or None if it is valid.
+        Results are memoized since the same hostnames and domains tend to be validated
+        over and over again.
+        """
         if ":" in hostname:
-            hostname, port = hostname.split(":")
+            try:
+                hostname, port = hostname.split(":")
+            except ValueError:
+                return f"Invalid hostname {hostname}"
             if not port.isdigit() or not 0 <= int(port) <= 65535:
-                raise SmarterValueError(f"Invalid port {port}")
-        if len(hostname) > 255:
-            raise SmarterValueError(f"Invalid hostname {hostname}")
+                return f"Invalid port {port}"
+        if not hostname or len(hostname) > 255:
+            return f"Invalid hostname {hostname}"
         if hostname[-1] == ".":
             hostname = hostname[:-1]  # strip exactly one dot from the right, if present
-        allowed = re.compile(SmarterValidator.VALID_HOSTNAME_PATTERN, re.IGNORECASE)
+        allowed = SmarterValidator.VALID_HOSTNAME_RE
         if all(allowed.match(x) for x in hostname.split(".")):
-            return
-        raise SmarterValueError(f"Invalid hostname {hostname}")
+            return None
+        return f"Invalid hostname {hostname}"
+
+    @staticmethod
+    def validate_hostname(hostname: str) -> None:
+        """Validate hostname format"""
+        if not isinstance(hostname, str):
+            raise SmarterValueError(f"Invalid hostname {hostname}")
+        error = SmarterValidator.hostname_error(hostname)
+        if error:
+            raise SmarterValueError(error)
+
+    @staticmethod
+    def validate_domain(domain: str) -> None:
+        """Validate domain format. A domain may include a port, as in localhost:8000"""
+        if not isinstance(domain, str):
+            raise SmarterValueError(f"Invalid domain {domain}")
+        error = SmarterValidator.hostname_error(domain)
+        if error:
+            raise SmarterValueError(error.replace("Invalid hostname", "Invalid domain"))
 
     @staticmethod
     def validate_uuid(uuid: str) -> None:
         """Validate UUID format"""
-        if not re.match(SmarterValidator.VALID_UUID_PATTERN, uuid):
+        if not isinstance(uuid, str) or not SmarterValidator.VALID_UUID_RE.match(uuid):
             raise SmarterValueError(f"Invalid UUID {uuid}")
 
     @staticmethod
     def validate_clean_string(v: str) -> None:
         """Validate clean string format"""
-        if not re.match(SmarterValidator.VALID_CLEAN_STRING, v):
+        if not isinstance(v, str) or not SmarterValidator.VALID_CLEAN_STRING_RE.match(v):
             raise SmarterValueError(f"Invalid clean string {v}")
 
     # --------------------------------------------------------------------------
@@ -161,32 +205,80 @@ class SmarterValidator:
         except SmarterValueError:
             return False
 
+    # --------------------------------------------------------------------------
+    # batch helpers. These check an entire sequence in one pass and return
+    # a list of (index, value) tuples for every value that failed validation.
+    # An empty list means that every value is valid.
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def batch_match(values: Iterable[Any], pattern: Pattern) -> List[Tuple[int, Any]]:
+        """Return the (index, value) of every value that does not match a precompiled pattern"""
+        match = pattern.match
+        return [(i, v) for i, v in enumerate(values) if not isinstance(v, str) or match(v) is None]
+
+    @staticmethod
+    def batch_check(values: Iterable[Any], is_valid: Callable[[Any], bool]) -> List[Tuple[int, Any]]:
+        """Return the (index, value) of every value for which is_valid() is False"""
+        return [(i, v) for i, v in enumerate(values) if not is_valid(v)]
+
+    @staticmethod
+    def batch_validate_account_numbers(account_numbers: Iterable[str]) -> List[Tuple[int, Any]]:
+        return SmarterValidator.batch_match(account_numbers, SmarterValidator.VALID_ACCOUNT_NUMBER_RE)
+
+    @staticmethod
+    def batch_validate_session_keys(session_keys: Iterable[str]) -> List[Tuple[int, Any]]:
+        return SmarterValidator.batch_match(session_keys, SmarterValidator.VALID_SESSION_KEY_RE)
+
+    @staticmethod
+    def batch_validate_ports(ports: Iterable[str]) -> List[Tuple[int, Any]]:
+        return SmarterValidator.batch_match(ports, SmarterValidator.VALID_PORT_RE)
+
+    @staticmethod
+    def batch_validate_uuids(uuids: Iterable[str]) -> List[Tuple[int, Any]]:
+        return SmarterValidator.batch_match(uuids, SmarterValidator.VALID_UUID_RE)
+
+    @staticmethod
+    def batch_validate_hostnames(hostnames: Iterable[str]) -> List[Tuple[int, Any]]:
+        hostname_error = SmarterValidator.hostname_error
+        return [(i, v) for i, v in enumerate(hostnames) if not isinstance(v, str) or hostname_error(v) is not None]
+
+    @staticmethod
+    def batch_validate_domains(domains: Iterable[str]) -> List[Tuple[int, Any]]:
+        return SmarterValidator.batch_validate_hostnames(domains)
+
     # --------------------------------------------------------------------------
     # list helpers
     # --------------------------------------------------------------------------
+    @staticmethod
+    def raise_batch_errors(kind: str, failures: List[Tuple[int, Any]]) -> None:
+        """Raise a single SmarterValueError that describes every failure found by a batch helper"""
+        if failures:
+            details = ", ".join(f"[{i}] {v}" for i, v in failures)
+            raise SmarterValueError(f"Invalid {kind}: {details}")
+
     @staticmethod
     def validate_list_of_account_numbers(account_numbers: list) -> None:
         """Validate list of account numbers"""
-        for account_number in account_numbers:
-            SmarterValidator.validate_account_number(account_number)
+        failures = SmarterValidator.batch_validate_account_numbers(account_numbers)
+        SmarterValidator.raise_batch_errors("account number", failures)
 
     @staticmethod
     def validate_list_of_domains(domains: list) -> None:
         """Validate list of domains"""
-        for domain in domains:
-            SmarterValidator.validate_domain(domain)
+        failures = SmarterValidator.batch_validate_domains(domains)
+        SmarterValidator.raise_batch_errors("domain", failures)
 
     @staticmethod
     def validate_list_of_ports(ports: list) -> None:
         """Validate list of ports"""
-        for port in ports:
-            SmarterValidator.validate_port(port)
+        failures = SmarterValidator.batch_validate_ports(ports)
+        SmarterValidator.raise_batch_errors("port", failures)
 
     @staticmethod
     def validate_list_of_uuids(uuids: list) -> None:
         """Validate list of UUIDs"""
-        for uuid in uuids:
-            SmarterValidator.validate_uuid(uuid)
+        failures = SmarterValidator.batch_validate_uuids(uuids)
+        SmarterValidator.raise_batch_errors("UUID", failures)
 
     # --------------------------------------------------------------------------
     # utility helpers
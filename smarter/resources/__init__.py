@@ -1,7 +1,8 @@
 # pylint: disable=missing-module-docstring
 from .account import Account
 from .chatbot import Chatbot
+from .handle import ChatbotHandle
 from .plugin import Plugin
 
 
-__all__ = ["Account", "Chatbot", "Plugin"]
+__all__ = ["Account", "Chatbot", "ChatbotHandle", "Plugin"]
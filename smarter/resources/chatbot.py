@@ -4,12 +4,32 @@ smarter-api Chatbot.
 
 import json
 import logging
-from functools import cached_property
+import time
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Callable, Iterable, List
 from urllib.parse import ParseResult, urlparse
 
+import httpx
+from httpx import Response as httpx_Response
+
+from smarter.cache.prompt import PromptCache
 from smarter.common.classes import ApiBase
+from smarter.common.const import SMARTER_DEFAULT_MAX_CONCURRENCY
+from smarter.common.models.base import ModelView
+from smarter.common.sync import lazy_property
 from smarter.resources.models.chatbot import ChatbotModel
 from smarter.resources.models.prompt import MessageModel, PromptResponseModel
+from smarter.resources.snapshot import ChatbotSnapshot
+from smarter.traffic import deadlines
+from smarter.traffic.concurrency import ConcurrencyLimiter
+from smarter.traffic.hedging import Hedger
+from smarter.traffic.keys import ApiKeyPool
+from smarter.traffic.ratelimit import RateLimiter
+from smarter.traffic.scheduler import RequestScheduler, current_scheduling
+from smarter.traffic.timeouts import AdaptiveTimeouts
+from smarter.usage.ledger import UsageLedger
 
 
 logger = logging.getLogger(__name__)
@@ -22,6 +42,13 @@ class Chatbot(ApiBase):
 
     _name: str = None
     _chatbot_id: int = None
+    _snapshot: ChatbotSnapshot = None
+    prompt_cache: PromptCache = None
+    rate_limiter: RateLimiter = None
+    concurrency_limiter: ConcurrencyLimiter = None
+    scheduler: RequestScheduler = None
+    key_pool: ApiKeyPool = None
+    usage_ledger: UsageLedger = None
 
     def __init__(
         self,
@@ -30,12 +57,58 @@ class Chatbot(ApiBase):
         chatbot_id: int = None,
         name: str = None,
         timeout: int = None,
+        model: ChatbotModel = None,
+        snapshot: ChatbotSnapshot = None,
+        prompt_cache: PromptCache = None,
+        rate_limiter: RateLimiter = None,
+        concurrency_limiter: ConcurrencyLimiter = None,
+        scheduler: RequestScheduler = None,
+        key_pool: ApiKeyPool = None,
+        hedger: Hedger = None,
+        adaptive_timeouts: AdaptiveTimeouts = None,
+        usage_ledger: UsageLedger = None,
+        base_url: str = None,
     ):
-        self._chatbot_id = chatbot_id
-        self._name = name
+        """
+        Initializes the chatbot, either from a describe api request, from an already-parsed
+        ChatbotModel, or from a cached ChatbotSnapshot. Snapshots hold everything that the
+        chat path needs, so the describe request is deferred until some other part of the
+        manifest is accessed.
+
+        prompt_cache is an optional PromptCache for the responses of chatbots that
+        are declared to be deterministic. rate_limiter is an optional RateLimiter
+        that meters prompts against the platform's request and token rate limits.
+        concurrency_limiter is an optional ConcurrencyLimiter that adapts the number
+        of prompts that may be in flight at once. scheduler is an optional
+        RequestScheduler that admits prompts by priority class, tenant and chatbot.
+        key_pool is an optional ApiKeyPool across whose api keys prompts are spread.
+        hedger is an optional Hedger for the describe request. adaptive_timeouts is an
+        optional AdaptiveTimeouts that learns the read timeout of each endpoint.
+        usage_ledger is an optional UsageLedger that records the usage and latency
+        of each prompt. base_url overrides the api url of the configured environment.
+        """
+        self._snapshot = snapshot
+        self.prompt_cache = prompt_cache
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.scheduler = scheduler
+        self.key_pool = key_pool
+        self.usage_ledger = usage_ledger
+        self._chatbot_id = chatbot_id or (snapshot.chatbot_id if snapshot else None)
+        self._name = name or (snapshot.name if snapshot else None)
         # to do: need to setup a more intelligent way to build the url_endpoint from known data.
         url_endpoint = url_endpoint or f"cli/describe/chatbot/?name={self.name}"
-        super().__init__(api_key=api_key, url_endpoint=url_endpoint, model_class=ChatbotModel, timeout=timeout)
+        super().__init__(
+            api_key=api_key or (key_pool.primary if key_pool is not None else None),
+            url_endpoint=url_endpoint,
+            model_class=ChatbotModel,
+            timeout=timeout,
+            model=model,
+            lazy=snapshot is not None,
+            hedger=hedger,
+            adaptive_timeouts=adaptive_timeouts,
+            base_url=base_url,
+        )
         logger.debug("%s.__init__() chatbot_id=%s name=%s", self.formatted_class_name, self.chatbot_id, self.name)
 
     def validate(self):
@@ -64,22 +137,28 @@ class Chatbot(ApiBase):
     @property
     def model(self) -> ChatbotModel:
         """
-        Returns the Pydantic model instance.
+        Returns the Pydantic model instance. A chatbot that was restored from a
+        snapshot makes its describe request here, once, however many threads ask.
+        """
+        return super().model
+
+    @lazy_property
+    def snapshot(self) -> ChatbotSnapshot:
+        """
+        Returns a compact, immutable snapshot of this chatbot, suitable for caching.
         """
-        if not self._model:
-            if not self.httpx_response:
-                raise ValueError("http response did not return any data.")
-            self._model = self.model_class(**self.httpx_response.json())
-        return self._model
+        if self._snapshot is None:
+            self._snapshot = ChatbotSnapshot.from_model(self.model)
+        return self._snapshot
 
-    @cached_property
+    @lazy_property
     def name(self) -> str:
         """
         Get the name of the chatbot.
         """
         return self._name
 
-    @cached_property
+    @lazy_property
     def chatbot_id(self) -> int:
         """
         Get the chatbot_id of the chatbot. Corresponds with the Django model id.
@@ -90,85 +169,200 @@ class Chatbot(ApiBase):
             self._chatbot_id = int(path[-1])
         return self._chatbot_id
 
-    @cached_property
-    def chatbot_metadata(self) -> dict:
+    @lazy_property
+    def chatbot_metadata(self) -> Mapping:
         """
         Get the metadata of the chatbot.
-        Deconstructs the metadata Pydantic model into a standard json dictionary.
+        Returns a read-only view of the metadata Pydantic model rather than a model_dump() copy.
         """
-        return self.model.data.metadata.model_dump()
+        return ModelView(self.model.data.metadata)
 
-    @cached_property
+    @lazy_property
     def chatbot_description(self) -> str:
         """
         Get the description of the chatbot from the manifest metadata.
         """
         return self.model.data.metadata.description
 
-    @cached_property
+    @lazy_property
     def chatbot_version(self) -> str:
         """
         Get the version of the chatbot from the manifest metadata.
         """
+        if self._snapshot is not None:
+            return self._snapshot.version
         return self.model.data.metadata.version
 
-    @cached_property
-    def spec(self) -> dict:
+    @lazy_property
+    def spec(self) -> Mapping:
         """
         Get the spec of the chatbot from the manifest data.
-        Deconstructs the spec Pydantic model into a standard json dictionary.
+        Returns a read-only view of the spec Pydantic model rather than a model_dump() copy.
         """
-        return self.model.data.spec.model_dump()
+        return ModelView(self.model.data.spec)
 
-    @cached_property
-    def config(self) -> dict:
+    @lazy_property
+    def config(self) -> Mapping:
         """
         Get the config of the chatbot from the manifest data.
-        Deconstructs the config Pydantic model into a standard json dictionary.
+        Returns a read-only view of the config Pydantic model rather than a model_dump() copy.
         """
-        return self.model.data.spec.config.model_dump()
+        if self._snapshot is not None:
+            return self._snapshot.config
+        return ModelView(self.model.data.spec.config)
 
-    @cached_property
-    def status(self) -> dict:
+    @lazy_property
+    def status(self) -> Mapping:
         """
         Get the status of the chatbot from the manifest data.
-        Deconstructs the status Pydantic model into a standard json dictionary.
+        Returns a read-only view of the status Pydantic model rather than a model_dump() copy.
         """
-        return self.model.data.status.model_dump()
+        return ModelView(self.model.data.status)
 
-    @cached_property
+    @lazy_property
     def sandbox_url(self) -> ParseResult:
         """
         Get the sandbox URL of the chatbot from the manifest status and parse it.
         example: https://platform.smarter.sh/api/v1/chatbots/36/
         """
-        url_string = self.model.data.status.sandboxUrl
+        url_string = self._snapshot.sandbox_url if self._snapshot else self.model.data.status.sandboxUrl
         url_parsed = urlparse(url_string)
         return url_parsed
 
-    @cached_property
+    @lazy_property
     def url_chatapp(self) -> ParseResult:
         """
         Get the chatapp URL of the chatbot from the manifest status and parse it.
         example: https://netec-demo.3141-5926-5359.api.smarter.sh/chatapp/
         """
-        url_string = self.model.data.status.urlChatapp
+        url_string = self._snapshot.url_chatapp if self._snapshot else self.model.data.status.urlChatapp
         url_parsed = urlparse(url_string)
         return url_parsed
 
-    @cached_property
+    @lazy_property
     def url_chatbot(self) -> ParseResult:
         """
         Get the chatbot URL of the chatbot from the manifest status and parse it.
         example: "https://platform.smarter.sh/api/v1/chatbots/36/chat/"
         """
-        url_string = self.model.data.status.urlChatbot
+        url_string = self._snapshot.url_chatbot if self._snapshot else self.model.data.status.urlChatbot
         url_parsed = urlparse(url_string)
         return url_parsed
 
-    def prompt(self, message: str, verbose: bool = False) -> dict:
+    def prompt(self, message: str, verbose: bool = False, deadline: float = None) -> dict:
+        """
+        Chat with the chatbot. Responses are served from the prompt cache, if
+        one is configured and this chatbot is declared to be deterministic.
+
+        deadline is an optional limit, in seconds, on the whole call, including
+        any queued or throttled waits and retries. SmarterDeadlineExceededError
+        is raised if it passes.
+        """
+        with deadlines.deadline(deadline):
+            cache = self.prompt_cache
+            if cache is None or not cache.is_cacheable(self):
+                return self.send_prompt(message, verbose=verbose)
+            response = cache.lookup(self, message, verbose=verbose)
+            if response is None:
+                response = self.send_prompt(message, verbose=verbose)
+                cache.store(self, message, response, verbose=verbose)
+            return response
+
+    def prompt_many(
+        self,
+        messages: Iterable[str],
+        verbose: bool = False,
+        max_workers: int = SMARTER_DEFAULT_MAX_CONCURRENCY,
+        processes: bool = False,
+        postprocess: Callable[[Any], Any] = None,
+        chunksize: int = 1,
+    ) -> List[Any]:
+        """
+        Prompt the chatbot with many messages concurrently and return the responses,
+        or postprocess(response) if postprocess is given, in the order of the messages.
+        The first error is raised.
+
+        With processes=True the prompts fan out over a pool of max_workers processes,
+        so that CPU-heavy post-processing runs on every core. Each worker rebuilds the
+        chatbot from a picklable ChatbotHandle, and postprocess must be picklable too.
+        The rate limiter, concurrency limiter, scheduler and prompt cache of this
+        chatbot are not shared with the workers.
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+        max_workers = max(1, min(max_workers, len(messages)))
+        if not processes:
+
+            def prompt(message: str) -> Any:
+                response = self.prompt(message, verbose=verbose)
+                return postprocess(response) if postprocess is not None else response
+
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smarter-prompt-many") as executor:
+                return list(executor.map(prompt, messages))
+
+        # the handle refers to the api key, which is registered once in each worker.
+        from smarter.resources.handle import (  # pylint: disable=import-outside-toplevel
+            prompt_in_worker,
+            register_credentials,
+        )
+
+        handle = self.handle()
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=register_credentials, initargs=(handle.credentials(self.api_key),)
+        ) as executor:
+            count = len(messages)
+            return list(
+                executor.map(
+                    prompt_in_worker,
+                    [handle] * count,
+                    messages,
+                    [verbose] * count,
+                    [postprocess] * count,
+                    chunksize=chunksize,
+                )
+            )
+
+    def handle(self, credential: str = None):
+        """
+        Returns a picklable ChatbotHandle for this chatbot, which refers to its api key
+        by the name of a credential rather than holding the key.
+        """
+        # smarter.resources.handle imports this module.
+        from smarter.resources.handle import (  # pylint: disable=import-outside-toplevel
+            DEFAULT_CREDENTIAL,
+            ChatbotHandle,
+        )
+
+        return ChatbotHandle.from_chatbot(self, credential=credential or DEFAULT_CREDENTIAL)
+
+    def post_prompt(self, url: str, data: dict) -> httpx_Response:
+        """
+        Post a prompt, holding a slot of the scheduler and of the concurrency
+        limiter, if these are configured.
+        """
+        with ExitStack() as stack:
+            if self.scheduler is not None:
+                stack.enter_context(self.scheduler.slot(self.name))
+            if self.concurrency_limiter is not None:
+                stack.enter_context(self.concurrency_limiter.slot())
+            if self.key_pool is None:
+                return self.post(url=url, data=data)
+            # a throttled key goes into cooldown, and the prompt is retried with the next key.
+            attempts = len(self.key_pool)
+            for attempt in range(attempts):
+                try:
+                    with self.key_pool.use() as api_key:
+                        return self.post(url=url, data=data, api_key=api_key)
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code != 429 or attempt == attempts - 1:
+                        raise
+                    deadlines.current_deadline().check(f"{self.formatted_class_name}.post_prompt() retry")
+                    logger.debug("%s.post_prompt() throttled, retrying with another key", self.formatted_class_name)
+
+    def send_prompt(self, message: str, verbose: bool = False) -> dict:
         """
-        Chat with the chatbot.
+        Send a prompt to the chatbot.
         # http://platform.smarter.sh/api/v1/cli/chat/netec-demo/?new_session=true&uid=admin
         """
         # to do: Smarter() should pass in the 'whoami' data (username, etc) to the Chatbot class.
@@ -179,9 +373,21 @@ class Chatbot(ApiBase):
             "messages": [],
             "prompt": json.loads(escaped_message),
         }
-        response = self.post(url=url, data=data)
-        response_json: dict = response.json()
-        prompt_response = PromptResponseModel(**response_json)
+        limiter = self.rate_limiter
+        reserved = limiter.acquire(message) if limiter is not None else 0
+        usage = None
+        start = time.monotonic()
+        try:
+            response = self.post_prompt(url=url, data=data)
+            response_json: dict = response.json()
+            prompt_response = PromptResponseModel(**response_json)
+            usage = prompt_response.data.response.data.body.usage
+        finally:
+            if limiter is not None:
+                limiter.settle(reserved, usage)
+        if self.usage_ledger is not None:
+            tenant = current_scheduling().tenant
+            self.usage_ledger.record_response(self.name, prompt_response, time.monotonic() - start, tenant=tenant)
 
         if verbose:
             return prompt_response.model_dump()
@@ -0,0 +1,139 @@
+"""
+smarter-api ChatbotHandle.
+
+A Chatbot holds a live httpx client and its cached api responses, so it can't
+be sent to another process. A ChatbotHandle is a small, picklable reference to
+a chatbot: its name, id, environment and snapshot, and a reference to its
+credential rather than the api key itself. A worker process rebuilds the
+Chatbot from the handle on first use, over its own pooled http client, and
+reuses it for every later task with the same handle.
+
+Credential references are resolved in the worker, first from the credentials
+that were registered with register_credential(), for example by the
+initializer of a process pool, and then from the environment variable of the
+same name.
+
+    handle = chatbot.handle()
+    with ProcessPoolExecutor(initializer=register_credentials, initargs=(handle.credentials(api_key),)) as executor:
+        executor.map(work, [handle] * 100, prompts)
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from smarter.common import forking
+from smarter.common.conf import settings as smarter_settings
+from smarter.common.exceptions import SmarterConfigurationError
+from smarter.resources.chatbot import Chatbot
+from smarter.resources.snapshot import ChatbotSnapshot
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CREDENTIAL = "SMARTER_API_KEY"
+
+_credentials: Dict[str, str] = {}
+_chatbots: Dict["ChatbotHandle", Chatbot] = {}
+_lock = threading.Lock()
+
+
+@forking.at_fork
+def _reset_after_fork() -> None:
+    global _lock  # pylint: disable=global-statement
+    # the credentials and chatbots of the parent are inherited, but not whoever held the lock.
+    _lock = threading.Lock()
+
+
+def register_credential(reference: str, api_key: str) -> None:
+    """Register the api key that a credential reference resolves to in this process."""
+    with _lock:
+        _credentials[reference] = api_key
+
+
+def register_credentials(credentials: Dict[str, str]) -> None:
+    """Register several credential references. Usable as a process pool initializer."""
+    for reference, api_key in credentials.items():
+        register_credential(reference, api_key)
+
+
+def resolve_credential(reference: str) -> str:
+    """Return the api key of a credential reference."""
+    with _lock:
+        api_key = _credentials.get(reference)
+    api_key = api_key or os.environ.get(reference)
+    if not api_key and reference == DEFAULT_CREDENTIAL:
+        api_key = smarter_settings.smarter_api_key.get_secret_value()
+    if not api_key:
+        raise SmarterConfigurationError(f"credential {reference} is not registered or set in the environment")
+    return api_key
+
+
+@dataclass(frozen=True, slots=True)
+class ChatbotHandle:
+    """A picklable reference to a chatbot, from which a worker process rebuilds it."""
+
+    name: str
+    chatbot_id: int
+    environment: str
+    credential: str = DEFAULT_CREDENTIAL
+    timeout: Optional[int] = None
+    snapshot: Optional[ChatbotSnapshot] = None
+    base_url: Optional[str] = None
+
+    @classmethod
+    def from_chatbot(cls, chatbot: Chatbot, credential: str = DEFAULT_CREDENTIAL) -> "ChatbotHandle":
+        """Create a handle for a chatbot. The snapshot spares the worker a describe request."""
+        snapshot = chatbot.snapshot
+        return cls(
+            name=snapshot.name,
+            chatbot_id=snapshot.chatbot_id,
+            environment=smarter_settings.environment,
+            credential=credential,
+            timeout=chatbot.timeout,
+            snapshot=snapshot,
+            base_url=chatbot.base_url,
+        )
+
+    def credentials(self, api_key: str) -> Dict[str, str]:
+        """Return the credentials to register in the workers that use this handle."""
+        return {self.credential: api_key}
+
+    def chatbot(self) -> Chatbot:
+        """Return this process's Chatbot for the handle, building it on first use."""
+        with _lock:
+            chatbot = _chatbots.get(self)
+        if chatbot is not None:
+            return chatbot
+        if self.environment != smarter_settings.environment:
+            raise SmarterConfigurationError(
+                f"{self.name} belongs to the {self.environment} environment, "
+                f"but this process is configured for {smarter_settings.environment}"
+            )
+        chatbot = Chatbot(
+            api_key=resolve_credential(self.credential),
+            chatbot_id=self.chatbot_id,
+            name=self.name,
+            timeout=self.timeout,
+            snapshot=self.snapshot,
+            base_url=self.base_url,
+        )
+        with _lock:
+            # if two threads built one at once, they all use the first.
+            chatbot = _chatbots.setdefault(self, chatbot)
+        logger.debug("ChatbotHandle.chatbot() built %s in pid %s", self.name, os.getpid())
+        return chatbot
+
+    def prompt(self, message: str, verbose: bool = False, deadline: float = None):
+        """Prompt the chatbot from this process."""
+        return self.chatbot().prompt(message, verbose=verbose, deadline=deadline)
+
+
+def prompt_in_worker(
+    handle: ChatbotHandle, message: str, verbose: bool = False, postprocess: Callable[[Any], Any] = None
+) -> Any:
+    """Prompt a chatbot in a worker process and post-process the response there. Picklable."""
+    response = handle.prompt(message, verbose=verbose)
+    return postprocess(response) if postprocess is not None else response
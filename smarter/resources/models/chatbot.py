@@ -8,7 +8,7 @@ chatbot API endpoint.
 from typing import Any, List, Optional
 from urllib.parse import urlparse
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from smarter.common.models.base import SmarterApiBaseModel
 
@@ -92,3 +92,24 @@ class DataModel(BaseModel):
 
 class ChatbotModel(SmarterApiBaseModel):
     data: DataModel
+
+
+class ChatbotListItemModel(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    name: str
+
+
+class ChatbotListDataModel(BaseModel):
+    titles: List[Any] = []
+    items: List[ChatbotListItemModel] = []
+
+
+class ChatbotListModel(SmarterApiBaseModel):
+    """
+    Response model for the 'cli/get/chatbot/' list endpoint. The list endpoint
+    returns summary rows rather than full manifests.
+    """
+
+    data: ChatbotListDataModel
+    metadata: dict = {}
@@ -0,0 +1,86 @@
+"""
+smarter-api ChatbotSnapshot.
+
+A compact, immutable representation of a chatbot that holds only the resolved
+fields that the chat path needs. The resource cache stores these rather than
+live Chatbot objects, which carry an httpx client, the raw http response and
+the full Pydantic manifest.
+
+Snapshots are built through SNAPSHOT_STORE, which interns their strings and
+shares identical config blocks, since these repeat across a chatbot fleet.
+The store is bounded, so that it doesn't outgrow the resource cache whose
+snapshots it serves.
+"""
+
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlparse
+
+from smarter.common.conf import settings as smarter_settings
+from smarter.resources.models.chatbot import ChatbotModel
+from smarter.resources.store import ManifestStore
+
+
+# room for the strings of every snapshot in a full resource cache, with a few to spare.
+SNAPSHOT_STORE = ManifestStore(max_size=32 * max(1, smarter_settings.smarter_max_cache_size))
+
+
+@dataclass(frozen=True, slots=True)
+class ChatbotSnapshot:
+    """Slotted, immutable snapshot of a chatbot manifest."""
+
+    name: str
+    chatbot_id: int
+    api_version: str
+    version: str
+    modified: str
+    url_chatbot: str
+    url_chatapp: str
+    sandbox_url: str
+    config: Mapping = field(hash=False)
+    custom_url: Optional[str] = None
+
+    @classmethod
+    def from_model(cls, model: ChatbotModel) -> "ChatbotSnapshot":
+        """Create a snapshot from a describe chatbot api response."""
+        status = model.data.status
+        path = list(filter(None, urlparse(status.sandboxUrl).path.split("/")))
+        return cls.from_dict(
+            {
+                "name": model.data.metadata.name,
+                "chatbot_id": int(path[-1]),
+                "api_version": model.data.apiVersion,
+                "version": model.data.metadata.version,
+                "modified": status.modified,
+                "url_chatbot": status.urlChatbot,
+                "url_chatapp": status.urlChatapp,
+                "sandbox_url": status.sandboxUrl,
+                "config": model.data.spec.config.model_dump(),
+                "custom_url": status.customUrl,
+            }
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatbotSnapshot":
+        data = {key: SNAPSHOT_STORE.intern(value) if isinstance(value, str) else value for key, value in data.items()}
+        data["config"] = SNAPSHOT_STORE.share_config(data["config"])
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "chatbot_id": self.chatbot_id,
+            "api_version": self.api_version,
+            "version": self.version,
+            "modified": self.modified,
+            "url_chatbot": self.url_chatbot,
+            "url_chatapp": self.url_chatapp,
+            "sandbox_url": self.sandbox_url,
+            "config": dict(self.config),
+            "custom_url": self.custom_url,
+        }
+
+    def __reduce__(self):
+        # MappingProxyType cannot be pickled, so round trip through a plain dict.
+        return (self.__class__.from_dict, (self.to_dict(),))
@@ -0,0 +1,207 @@
+"""
+smarter-api ManifestStore.
+
+An in-memory store for the ChatbotModel manifests of a large chatbot fleet.
+Across hundreds or thousands of chatbots the same strings repeat in every
+manifest (provider, defaultModel, defaultSystemRole, status values, hostnames)
+and many chatbots share identical config blocks. The store interns repeated
+string values and shares identical nested config blocks between manifests,
+and it can report how much memory this saves.
+
+ChatbotSnapshot also uses a store to intern its strings and to share identical
+config blocks between the snapshots in the resource cache.
+
+Manifests returned by the store share objects with one another and must be
+treated as read-only. A store with a max_size keeps at most that many interned
+strings, shared blocks and shared configs each, evicting the least recently
+used, so that a long-running process that sees an unbounded stream of chatbots
+doesn't hold on to the values of chatbots it has long forgotten. An evicted
+value is only no longer shared with the values that are added after it.
+"""
+
+import json
+import logging
+import sys
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, Union
+
+from cachetools import LRUCache
+from pydantic import BaseModel
+
+from smarter.common import forking
+from smarter.resources.models.chatbot import ChatbotModel, ConfigModel, SpecModel
+
+
+logger = logging.getLogger(__name__)
+
+# nested blocks that are commonly identical between chatbots, and are therefore
+# shared between manifests rather than stored once per chatbot.
+SHARED_BLOCK_TYPES: Tuple[Type[BaseModel], ...] = (ConfigModel, SpecModel)
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    Approximate the memory footprint of an object graph in bytes. Objects that
+    have already been counted in seen are not counted again, which is how shared
+    strings and blocks are accounted for.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, BaseModel):
+        size += deep_sizeof(obj.__dict__, seen)
+        size += deep_sizeof(obj.__pydantic_fields_set__, seen)
+    elif isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+class ManifestStore:
+    """
+    Stores ChatbotModel manifests keyed by chatbot name, interning repeated
+    strings and sharing identical nested config blocks between chatbots.
+    """
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size
+        self._manifests: Dict[str, ChatbotModel] = {}
+        self._strings: Dict[str, str] = self._table()
+        self._blocks: Dict[Tuple[type, str], BaseModel] = self._table()
+        self._configs: Dict[str, Mapping] = self._table()
+        self._block_hits = 0
+        # reentrant, since share_config() interns its keys while it holds the lock.
+        self._lock = threading.RLock()
+        forking.register(self)
+
+    def _table(self) -> dict:
+        return LRUCache(maxsize=self.max_size) if self.max_size else {}
+
+    def _after_fork(self) -> None:
+        # manifests and interned strings are plain data, and stay shared with the parent copy-on-write.
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._manifests)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._manifests
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._manifests))
+
+    def get(self, name: str) -> Optional[ChatbotModel]:
+        return self._manifests.get(name)
+
+    def add(self, manifest: Union[ChatbotModel, dict]) -> ChatbotModel:
+        """
+        Add a manifest to the store, replacing any existing manifest with the same
+        chatbot name. Returns the deduplicated manifest that the store now holds.
+        A ChatbotModel that is passed in is copied rather than modified in place.
+        """
+        if isinstance(manifest, dict):
+            manifest = ChatbotModel(**manifest)
+        else:
+            manifest = manifest.model_copy(deep=True)
+        with self._lock:
+            manifest = self._dedupe(manifest)
+            self._manifests[manifest.data.metadata.name] = manifest
+        return manifest
+
+    def add_many(self, manifests: List[Union[ChatbotModel, dict]]) -> None:
+        for manifest in manifests:
+            self.add(manifest)
+
+    def remove(self, name: str) -> None:
+        """
+        Remove a manifest. Interned strings and shared blocks are kept until
+        clear() is called, since other manifests are likely to be using them.
+        """
+        with self._lock:
+            self._manifests.pop(name, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._manifests.clear()
+            self._strings.clear()
+            self._blocks.clear()
+            self._configs.clear()
+            self._block_hits = 0
+
+    def intern(self, value: str) -> str:
+        """Return the canonical instance of a string value."""
+        with self._lock:
+            return self._strings.setdefault(value, value)
+
+    def share_config(self, config: Mapping) -> Mapping:
+        """
+        Return the shared, read-only instance of a config mapping, with interned
+        string keys and values. Identical configs map to the same instance.
+        """
+        key = json.dumps(config, sort_keys=True, default=str)
+        with self._lock:
+            shared = self._configs.get(key)
+            if shared is not None:
+                self._block_hits += 1
+                return shared
+            shared = MappingProxyType({self.intern(k): self._dedupe_value(v) for k, v in config.items()})
+            self._configs[key] = shared
+        return shared
+
+    def _dedupe(self, model: BaseModel) -> BaseModel:
+        """
+        Intern the string values of a model in place, and return the shared
+        instance of the model if an identical block is already in the store.
+        """
+        if isinstance(model, SHARED_BLOCK_TYPES):
+            key = (type(model), model.model_dump_json())
+            shared = self._blocks.get(key)
+            if shared is not None:
+                self._block_hits += 1
+                return shared
+        values = model.__dict__
+        for field_name, value in values.items():
+            values[field_name] = self._dedupe_value(value)
+        if isinstance(model, SHARED_BLOCK_TYPES):
+            self._blocks[key] = model
+        return model
+
+    def _dedupe_value(self, value: Any) -> Any:
+        if isinstance(value, str):
+            return self.intern(value)
+        if isinstance(value, BaseModel):
+            return self._dedupe(value)
+        if isinstance(value, list):
+            return [self._dedupe_value(item) for item in value]
+        if isinstance(value, dict):
+            return {self._dedupe_value(k): self._dedupe_value(v) for k, v in value.items()}
+        return value
+
+    def stats(self) -> dict:
+        """
+        Report the memory savings of the store. raw_bytes approximates the size of
+        the manifests if each one were stored independently, stored_bytes is the
+        size of the manifests as they are actually stored.
+        """
+        with self._lock:
+            manifests = list(self._manifests.values())
+            strings = len(self._strings)
+            blocks = len(self._blocks) + len(self._configs)
+            block_hits = self._block_hits
+        raw_bytes = sum(deep_sizeof(manifest) for manifest in manifests)
+        stored_bytes = deep_sizeof(manifests) - sys.getsizeof(manifests)
+        return {
+            "manifests": len(manifests),
+            "interned_strings": strings,
+            "shared_blocks": blocks,
+            "shared_block_hits": block_hits,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "saved_bytes": raw_bytes - stored_bytes,
+            "saved_ratio": round(1 - stored_bytes / raw_bytes, 4) if raw_bytes else 0.0,
+        }
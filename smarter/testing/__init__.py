@@ -0,0 +1,28 @@
+# pylint: disable=missing-module-docstring
+from .cassette import (
+    Cassette,
+    Interaction,
+    RecordingTransport,
+    ReplayReport,
+    ReplayTransport,
+    recording,
+    replay_traffic,
+    replaying,
+)
+from .server import FakeServer, FakeServerConfig, FakeServerProcess, Latency
+
+
+__all__ = [
+    "Cassette",
+    "FakeServer",
+    "FakeServerConfig",
+    "FakeServerProcess",
+    "Interaction",
+    "Latency",
+    "RecordingTransport",
+    "ReplayReport",
+    "ReplayTransport",
+    "recording",
+    "replay_traffic",
+    "replaying",
+]
@@ -0,0 +1,8 @@
+"""
+smarter-api fake server entry point: python -m smarter.testing --help
+"""
+
+from smarter.testing.server import main
+
+
+main()
@@ -0,0 +1,353 @@
+"""
+smarter-api traffic recording and replay.
+
+RecordingTransport is an httpx transport that passes requests through to the
+network and records each exchange (whoami, describe, chat) into a Cassette:
+its offset from the start of the recording, its latency, the request path and
+json body, and the response status, headers and body. The api key in the
+Authorization header is never recorded, and is scrubbed from anything else
+that is. Identical response bodies, such as repeated describe responses, are
+stored once.
+
+ReplayTransport answers requests from a Cassette without touching the network,
+either at full speed or with the recorded latency of each response, and
+replay_traffic() re-issues a cassette's prompts through the SDK, at full speed
+or with their original arrival times, and reports the throughput and memory of
+the client. Replaying production traffic shapes against a new SDK version
+catches client-side regressions offline:
+
+    with recording("traffic.cassette"):
+        ...  # run the workload
+
+    with replaying("traffic.cassette", timing="original") as cassette:
+        report = replay_traffic(cassette, Smarter(api_key=...).resources.chatbots, timing="original")
+
+Cassettes are gzipped json lines.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import unquote
+
+import httpx
+
+from smarter.common import pool
+from smarter.common.exceptions import SmarterValueError
+
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_FORMAT = "smarter-cassette"
+CASSETTE_VERSION = 1
+REDACTED = "<redacted>"
+# the response headers worth keeping; everything else is connection noise or sensitive.
+RECORDED_HEADERS = ["content-type", "retry-after"]
+# the body is read decoded, so the headers that describe its encoding on the wire no longer apply.
+ENCODING_HEADERS = ["content-encoding", "content-length", "transfer-encoding"]
+TIMINGS = ["fast", "original"]
+
+
+@dataclass(slots=True)
+class Interaction:
+    """One recorded request and its response, or its transport error."""
+
+    offset: float
+    elapsed: float
+    method: str
+    path: str
+    request: Optional[dict]
+    status: int
+    headers: Dict[str, str]
+    body: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def endpoint(self) -> str:
+        """The api endpoint, for example cli/chat/ or cli/whoami/"""
+        path = self.path.split("?", 1)[0]
+        parts = path.split("/cli/", 1)[-1].split("/")
+        return f"cli/{parts[0]}/"
+
+
+class Cassette:
+    """Recorded interactions, in the order in which they started, and their response bodies by digest."""
+
+    def __init__(self, interactions: List[Interaction] = None, bodies: Dict[str, bytes] = None):
+        self.interactions = interactions or []
+        self.bodies = bodies or {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    def add(self, interaction: Interaction, body: Optional[bytes]) -> None:
+        with self._lock:
+            if body is not None:
+                digest = hashlib.sha256(body).hexdigest()[:32]
+                self.bodies.setdefault(digest, body)
+                interaction.body = digest
+            self.interactions.append(interaction)
+
+    def body(self, interaction: Interaction) -> bytes:
+        return self.bodies.get(interaction.body, b"") if interaction.body else b""
+
+    def sorted(self) -> List[Interaction]:
+        return sorted(self.interactions, key=lambda interaction: interaction.offset)
+
+    def save(self, path: str) -> None:
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"format": CASSETTE_FORMAT, "version": CASSETTE_VERSION}) + "\n")
+            for digest, body in self.bodies.items():
+                try:
+                    line = {"digest": digest, "text": body.decode("utf-8")}
+                except UnicodeDecodeError:
+                    line = {"digest": digest, "base64": base64.b64encode(body).decode("ascii")}
+                f.write(json.dumps(line, separators=(",", ":")) + "\n")
+            for interaction in self.sorted():
+                f.write(json.dumps({"interaction": asdict(interaction)}, separators=(",", ":")) + "\n")
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        cassette = cls()
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("format") != CASSETTE_FORMAT or header.get("version") != CASSETTE_VERSION:
+                raise SmarterValueError(f"{path} is not a version {CASSETTE_VERSION} smarter cassette")
+            for line in f:
+                entry = json.loads(line)
+                if "interaction" in entry:
+                    cassette.interactions.append(Interaction(**entry["interaction"]))
+                elif "text" in entry:
+                    cassette.bodies[entry["digest"]] = entry["text"].encode("utf-8")
+                else:
+                    cassette.bodies[entry["digest"]] = base64.b64decode(entry["base64"])
+        return cassette
+
+
+def scrub(text: str, secret: str) -> str:
+    return text.replace(secret, REDACTED) if secret else text
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Passes requests through to transport, by default the network, and records them into cassette."""
+
+    def __init__(
+        self,
+        cassette: Cassette = None,
+        transport: httpx.BaseTransport = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.cassette = cassette if cassette is not None else Cassette()
+        self.transport = transport or httpx.HTTPTransport(limits=pool.http_limits())
+        self.clock = clock
+        self.started = clock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        authorization = request.headers.get("Authorization", "")
+        secret = authorization.split(" ", 1)[-1] if authorization else ""
+        start = self.clock()
+        interaction = Interaction(
+            offset=round(start - self.started, 6),
+            elapsed=0.0,
+            method=request.method,
+            path=scrub(unquote(request.url.raw_path.decode("ascii")), secret),
+            request=self.request_json(request, secret),
+            status=0,
+            headers={},
+        )
+        try:
+            response = self.transport.handle_request(request)
+            body = response.read()
+        except httpx.TransportError as e:
+            interaction.elapsed = round(self.clock() - start, 6)
+            interaction.error = type(e).__name__
+            self.cassette.add(interaction, None)
+            raise
+        response.close()
+        interaction.elapsed = round(self.clock() - start, 6)
+        interaction.status = response.status_code
+        interaction.headers = {key: response.headers[key] for key in RECORDED_HEADERS if key in response.headers}
+        self.cassette.add(
+            interaction, scrub(body.decode("utf-8", "surrogateescape"), secret).encode("utf-8", "surrogateescape")
+        )
+        headers = [(key, value) for key, value in response.headers.multi_items() if key not in ENCODING_HEADERS]
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+    @staticmethod
+    def request_json(request: httpx.Request, secret: str) -> Optional[dict]:
+        if not request.content:
+            return None
+        try:
+            return json.loads(scrub(request.content.decode("utf-8"), secret))
+        except ValueError:
+            return None
+
+    def close(self) -> None:
+        # every shared client closes its transport, but the recording outlives them.
+        pass
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """
+    Answers requests from a cassette, without touching the network. Requests are
+    matched by method and path, each to the next unused recording for them; with
+    loop, the recordings of a path are reused once they run out. With timing
+    'original' each response takes its recorded latency, divided by speed.
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        timing: str = "fast",
+        speed: float = 1.0,
+        loop: bool = True,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if timing not in TIMINGS:
+            raise SmarterValueError(f"timing must be one of {', '.join(TIMINGS)}, not {timing}")
+        self.cassette = cassette
+        self.timing = timing
+        self.speed = speed
+        self.loop = loop
+        self.sleep = sleep
+        self._recordings = defaultdict(list)
+        for interaction in cassette.sorted():
+            self._recordings[(interaction.method, interaction.path)].append(interaction)
+        self._next = Counter()
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = (request.method, unquote(request.url.raw_path.decode("ascii")))
+        recordings = self._recordings.get(key)
+        if not recordings:
+            raise SmarterValueError(f"{key[0]} {key[1]} is not in the cassette")
+        with self._lock:
+            index = self._next[key]
+            self._next[key] += 1
+        if index >= len(recordings) and not self.loop:
+            raise SmarterValueError(f"the cassette has only {len(recordings)} recordings of {key[0]} {key[1]}")
+        interaction = recordings[index % len(recordings)]
+        if self.timing == "original":
+            self.sleep(interaction.elapsed / self.speed)
+        if interaction.error:
+            error = getattr(httpx, interaction.error, httpx.TransportError)
+            raise error(f"replayed {interaction.error}", request=request)
+        return httpx.Response(
+            interaction.status,
+            headers=interaction.headers,
+            content=self.cassette.body(interaction),
+            request=request,
+        )
+
+
+@contextmanager
+def recording(path: str, transport: httpx.BaseTransport = None) -> Iterator[Cassette]:
+    """Record the traffic of every SDK client within the block, and save it to path."""
+    recorder = RecordingTransport(transport=transport)
+    previous = pool.set_transport(recorder)
+    try:
+        yield recorder.cassette
+    finally:
+        pool.set_transport(previous)
+        recorder.transport.close()
+        recorder.cassette.save(path)
+        logger.debug("recording() saved %s interactions to %s", len(recorder.cassette), path)
+
+
+@contextmanager
+def replaying(path_or_cassette, timing: str = "fast", speed: float = 1.0, loop: bool = True) -> Iterator[Cassette]:
+    """Serve every SDK client's requests within the block from a cassette."""
+    cassette = path_or_cassette if isinstance(path_or_cassette, Cassette) else Cassette.load(path_or_cassette)
+    previous = pool.set_transport(ReplayTransport(cassette, timing=timing, speed=speed, loop=loop))
+    try:
+        yield cassette
+    finally:
+        pool.set_transport(previous)
+
+
+@dataclass
+class ReplayReport:
+    """The client-side results of replay_traffic()."""
+
+    prompts: int = 0
+    errors: Counter = field(default_factory=Counter)
+    elapsed: float = 0.0
+    peak_memory: Optional[int] = None
+
+    @property
+    def throughput(self) -> float:
+        return self.prompts / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "prompts": self.prompts,
+            "errors": dict(self.errors),
+            "elapsed": round(self.elapsed, 6),
+            "throughput": round(self.throughput, 3),
+            "peak_memory": self.peak_memory,
+        }
+
+
+def replay_traffic(
+    cassette: Cassette,
+    chatbots,
+    timing: str = "fast",
+    speed: float = 1.0,
+    max_workers: int = 8,
+    trace_memory: bool = False,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+) -> ReplayReport:
+    """
+    Re-issue the prompts of a cassette through chatbots, a Chatbots resource, on
+    max_workers threads: as fast as possible, or at their recorded offsets divided
+    by speed. Run it within replaying() to keep it off the network. With
+    trace_memory the report includes the peak memory that the client allocated.
+    """
+    if timing not in TIMINGS:
+        raise SmarterValueError(f"timing must be one of {', '.join(TIMINGS)}, not {timing}")
+    prompts = [
+        interaction
+        for interaction in cassette.sorted()
+        if interaction.endpoint == "cli/chat/" and interaction.request and "prompt" in interaction.request
+    ]
+    report = ReplayReport()
+    lock = threading.Lock()
+
+    def send(interaction: Interaction) -> None:
+        name = interaction.path.split("/cli/chat/", 1)[1].split("/", 1)[0]
+        try:
+            chatbots.get(name=name).prompt(interaction.request["prompt"])
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            with lock:
+                report.errors[type(e).__name__] += 1
+        with lock:
+            report.prompts += 1
+
+    if trace_memory:
+        tracemalloc.start()
+    start = clock()
+    first = prompts[0].offset if prompts else 0.0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smarter-replay") as executor:
+        for interaction in prompts:
+            if timing == "original":
+                delay = (interaction.offset - first) / speed - (clock() - start)
+                if delay > 0:
+                    sleep(delay)
+            executor.submit(send, interaction)
+    report.elapsed = clock() - start
+    if trace_memory:
+        report.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return report
@@ -0,0 +1,455 @@
+"""
+smarter-api fake server.
+
+A local stand-in for the Smarter platform, for testing and load testing the
+SDK offline. It implements the endpoints that the SDK calls on its hot path,
+with payloads built from the example api responses that ship with the package:
+
+- POST cli/whoami/
+- POST cli/describe/chatbot/?name=<name>
+- POST cli/chat/<name>/
+
+and it injects the faults that the client's retry, pooling and caching logic
+have to cope with: latency drawn from a configurable distribution, 500 errors,
+429s with a Retry-After header, bodies that trickle in slowly, and connection
+resets.
+
+The server runs in-process on a background thread,
+
+    with FakeServer(FakeServerConfig(chat_latency=Latency.parse("lognormal:0.2,0.5"))) as server:
+        client = Smarter(api_key=..., base_url=server.url)
+
+or in one or more subprocesses that share a port, so that it doesn't compete
+with the client under test for the GIL:
+
+    with FakeServer.subprocess(config, processes=4) as server:
+        ...
+
+or from the command line: python -m smarter.testing --port 8000 --throttle-rate 0.05
+"""
+
+import argparse
+import copy
+import json
+import logging
+import math
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from smarter.common.const import PROJECT_ROOT
+from smarter.common.exceptions import SmarterConfigurationError, SmarterValueError
+
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/api/v1/"
+LATENCY_KINDS = ["constant", "uniform", "normal", "lognormal", "exponential"]
+# the chat response's prompt tokens, less the tokens of its example prompt.
+SYSTEM_PROMPT_TOKENS = 544
+
+
+def load_json(relative_path: str) -> dict:
+    with open(os.path.join(PROJECT_ROOT, relative_path), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@dataclass(frozen=True)
+class Latency:
+    """
+    A latency distribution, in seconds. a and b are the parameters of the distribution:
+    constant(a), uniform(a, b), normal(mean a, standard deviation b), lognormal(median a,
+    sigma b) and exponential(mean a).
+    """
+
+    kind: str = "constant"
+    a: float = 0.0
+    b: float = 0.0
+
+    def __post_init__(self):
+        if self.kind not in LATENCY_KINDS:
+            raise SmarterValueError(f"latency must be one of {', '.join(LATENCY_KINDS)}, not {self.kind}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        """Parse a distribution such as 'constant:0.05', 'uniform:0.01,0.2' or 'lognormal:0.2,0.5'."""
+        kind, _, params = spec.partition(":")
+        try:
+            values = [float(value) for value in params.split(",") if value]
+        except ValueError as e:
+            raise SmarterValueError(f"invalid latency {spec}") from e
+        return cls(kind, *values[:2])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(self.a, self.b))
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        if self.kind == "exponential":
+            return rng.expovariate(1 / self.a) if self.a > 0 else 0.0
+        return self.a
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.a},{self.b}"
+
+
+@dataclass
+class FakeServerConfig:
+    """
+    The behavior of a FakeServer. Each rate is the probability that a request
+    gets that fault. chatbots limits the chatbots that exist, by name; by default
+    every name does.
+    """
+
+    whoami_latency: Latency = field(default_factory=Latency)
+    describe_latency: Latency = field(default_factory=Latency)
+    chat_latency: Latency = field(default_factory=Latency)
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: float = 1.0
+    slow_body_rate: float = 0.0
+    slow_body_seconds: float = 1.0
+    reset_rate: float = 0.0
+    chatbots: Optional[List[str]] = None
+    seed: Optional[int] = None
+
+    def to_args(self) -> List[str]:
+        """The command line arguments of python -m smarter.testing for this config."""
+        args = [
+            f"--whoami-latency={self.whoami_latency}",
+            f"--describe-latency={self.describe_latency}",
+            f"--chat-latency={self.chat_latency}",
+            f"--error-rate={self.error_rate}",
+            f"--throttle-rate={self.throttle_rate}",
+            f"--retry-after={self.retry_after}",
+            f"--slow-body-rate={self.slow_body_rate}",
+            f"--slow-body-seconds={self.slow_body_seconds}",
+            f"--reset-rate={self.reset_rate}",
+        ]
+        if self.chatbots is not None:
+            args.append(f"--chatbots={','.join(self.chatbots)}")
+        if self.seed is not None:
+            args.append(f"--seed={self.seed}")
+        return args
+
+
+class Payloads:
+    """Realistic response payloads, built from the example api responses."""
+
+    def __init__(self):
+        self.whoami = json.dumps(load_json("common/data/whoami.json")).encode("utf-8")
+        self.chatbot_template = load_json("resources/data/chatbot.json")
+        self.chat_template = load_json("resources/data/chat.json")
+        self.sequence = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def chatbot_id(name: str) -> int:
+        """A stable id for a chatbot name."""
+        return zlib.crc32(name.encode("utf-8")) % 100000 + 100
+
+    def describe(self, name: str) -> bytes:
+        data = copy.deepcopy(self.chatbot_template)
+        chatbot_id = self.chatbot_id(name)
+        status = data["data"]["status"]
+        data["data"]["metadata"]["name"] = name
+        for key in ["sandboxHost", "sandboxUrl", "urlChatbot"]:
+            status[key] = status[key].replace("/chatbots/36/", f"/chatbots/{chatbot_id}/")
+        for key in ["defaultHost", "hostname", "url", "urlChatapp"]:
+            status[key] = status[key].replace("netec-demo.", f"{name}.")
+        return json.dumps(data).encode("utf-8")
+
+    def chat(self, prompt: str) -> bytes:
+        with self._lock:
+            self.sequence += 1
+            sequence = self.sequence
+        data = copy.deepcopy(self.chat_template)
+        body = data["data"]["response"]["data"]["body"]
+        body["id"] = f"chatcmpl-fake{os.getpid()}x{sequence}"
+        body["created"] = int(time.time())
+        body["metadata"]["input_text"] = prompt
+        usage = body["usage"]
+        usage["prompt_tokens"] = SYSTEM_PROMPT_TOKENS + max(1, len(prompt) // 4)
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return json.dumps(data).encode("utf-8")
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Serves one request of a FakeServer, with the faults of its config."""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in one segment, rather than waiting on a delayed ack.
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    server: "FakeHTTPServer"
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        url = urlparse(self.path)
+        prefix = len(API_PREFIX)
+        path = url.path[prefix:] if url.path.startswith(API_PREFIX) else None
+        endpoint, name = self.route(path, parse_qs(url.query))
+        if endpoint is None:
+            return self.reply(404, {"error": f"{self.path} not found"}, "not_found", endpoint="unknown")
+        if not self.headers.get("Authorization", "").startswith("Token "):
+            return self.reply(401, {"error": "authentication credentials were not provided"}, "unauthorized", endpoint)
+
+        fault = fake.fault()
+        if fault == "reset":
+            fake.count(endpoint, "reset")
+            return self.reset()
+        if fault == "throttled":
+            headers = {"Retry-After": f"{fake.config.retry_after:g}"}
+            return self.reply(429, {"error": "request was throttled"}, "throttled", endpoint, headers=headers)
+        if fault == "error":
+            return self.reply(500, {"error": "internal server error"}, "error", endpoint)
+
+        time.sleep(fake.latency(endpoint))
+        if not fake.exists(name):
+            return self.reply(404, {"error": f"chatbot {name} not found"}, "not_found", endpoint)
+        if endpoint == "whoami":
+            body = fake.payloads.whoami
+        elif endpoint == "describe":
+            body = fake.payloads.describe(name)
+        else:
+            body = fake.payloads.chat(str(request.get("prompt", "")))
+        slow = fake.slow_body()
+        return self.send_body(200, body, "slow" if slow else "ok", endpoint, slow=slow)
+
+    @staticmethod
+    def route(path: Optional[str], query: dict) -> tuple:
+        """Return the endpoint and chatbot name of a request path, or None."""
+        if path == "cli/whoami/":
+            return "whoami", None
+        if path == "cli/describe/chatbot/" and query.get("name"):
+            return "describe", query["name"][0]
+        if path and path.startswith("cli/chat/") and path.count("/") == 3:
+            return "chat", path.split("/")[2]
+        return None, None
+
+    def reply(self, status: int, data: dict, outcome: str, endpoint: str, headers: dict = None) -> None:
+        self.send_body(status, json.dumps(data).encode("utf-8"), outcome, endpoint, headers=headers)
+
+    def send_body(
+        self, status: int, body: bytes, outcome: str, endpoint: str, headers: dict = None, slow: bool = False
+    ) -> None:
+        self.server.fake.count(endpoint, outcome)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not slow:
+            self.wfile.write(body)
+            return
+        # the body trickles in ten chunks over slow_body_seconds.
+        self.wfile.flush()
+        chunk = max(1, -(-len(body) // 10))
+        pause = self.server.fake.config.slow_body_seconds / 10
+        for start in range(0, len(body), chunk):
+            end = start + chunk
+            self.wfile.write(body[start:end])
+            self.wfile.flush()
+            time.sleep(pause)
+
+    def reset(self) -> None:
+        """Drop the connection with a TCP reset, without a response."""
+        self.close_connection = True
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        self.connection.close()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug("FakeServer %s", format % args)
+
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    """The http server of a FakeServer. With reuse_port, several processes can share its port."""
+
+    daemon_threads = True
+    fake: "FakeServer" = None
+    reuse_port: bool = False
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def handle_error(self, request, client_address):
+        # clients that give up on a slow body, or a reset, are part of the job.
+        logger.debug("FakeServer connection from %s failed", client_address, exc_info=True)
+
+
+class FakeServer:
+    """A local stand-in for the Smarter platform api. See the module docstring."""
+
+    def __init__(self, config: FakeServerConfig = None, host: str = "127.0.0.1", port: int = 0, reuse_port=False):
+        self.config = config or FakeServerConfig()
+        self.payloads = Payloads()
+        self.stats = Counter()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._chatbots = set(self.config.chatbots) if self.config.chatbots is not None else None
+        self.httpd = FakeHTTPServer((host, port), FakeHandler, bind_and_activate=False)
+        self.httpd.fake = self
+        self.httpd.reuse_port = reuse_port
+        try:
+            self.httpd.server_bind()
+            self.httpd.server_activate()
+        except OSError:
+            self.httpd.server_close()
+            raise
+        self._thread: threading.Thread = None
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self) -> str:
+        """The base url to pass to the client, for example http://127.0.0.1:8000/api/v1/"""
+        return f"http://{self.httpd.server_address[0]}:{self.port}{API_PREFIX}"
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="smarter-fake-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def fault(self) -> Optional[str]:
+        """Draw the fault, if any, of a request."""
+        with self._lock:
+            draw = self._rng.random()
+        for fault, rate in [
+            ("reset", self.config.reset_rate),
+            ("throttled", self.config.throttle_rate),
+            ("error", self.config.error_rate),
+        ]:
+            if draw < rate:
+                return fault
+            draw -= rate
+        return None
+
+    def latency(self, endpoint: str) -> float:
+        latency = getattr(self.config, f"{endpoint}_latency")
+        with self._lock:
+            return latency.sample(self._rng)
+
+    def slow_body(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.config.slow_body_rate
+
+    def exists(self, name: Optional[str]) -> bool:
+        return name is None or self._chatbots is None or name in self._chatbots
+
+    def count(self, endpoint: str, outcome: str) -> None:
+        with self._lock:
+            self.stats[f"{endpoint}.{outcome}"] += 1
+
+    @staticmethod
+    def subprocess(config: FakeServerConfig = None, port: int = 0, processes: int = 1) -> "FakeServerProcess":
+        """Start the server in processes subprocesses that share one port."""
+        return FakeServerProcess(config or FakeServerConfig(), port=port, processes=processes)
+
+
+class FakeServerProcess:
+    """A FakeServer running in one or more subprocesses. See FakeServer.subprocess()."""
+
+    def __init__(self, config: FakeServerConfig, port: int = 0, processes: int = 1):
+        if processes > 1 and not port:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+        command = [sys.executable, "-m", "smarter.testing", f"--port={port}", *config.to_args()]
+        if processes > 1:
+            command.append("--reuse-port")
+        self.processes = []
+        self.url = None
+        for _ in range(processes):
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)  # pylint: disable=R1732
+            self.processes.append(process)
+            line = process.stdout.readline()
+            if not line.startswith("listening on "):
+                self.stop()
+                raise SmarterConfigurationError(f"the fake server did not start: {line!r}")
+            self.url = line.split()[-1]
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait(timeout=10)
+            process.stdout.close()
+
+    def __enter__(self) -> "FakeServerProcess":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m smarter.testing", description="Run a fake Smarter platform api.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--reuse-port", action="store_true")
+    for endpoint in ["whoami", "describe", "chat"]:
+        parser.add_argument(f"--{endpoint}-latency", type=Latency.parse, default=Latency())
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--slow-body-rate", type=float, default=0.0)
+    parser.add_argument("--slow-body-seconds", type=float, default=1.0)
+    parser.add_argument("--reset-rate", type=float, default=0.0)
+    parser.add_argument("--chatbots", type=lambda value: value.split(","), default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    config = FakeServerConfig(
+        whoami_latency=args.whoami_latency,
+        describe_latency=args.describe_latency,
+        chat_latency=args.chat_latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        slow_body_rate=args.slow_body_rate,
+        slow_body_seconds=args.slow_body_seconds,
+        reset_rate=args.reset_rate,
+        chatbots=args.chatbots,
+        seed=args.seed,
+    )
+    server = FakeServer(config, host=args.host, port=args.port, reuse_port=args.reuse_port)
+    print(f"listening on {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Shared offline test fixtures for the smarter package. These are built from the
+example api responses in smarter/common/data and smarter/resources/data.
+"""
+
+import copy
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from smarter.common.const import PROJECT_ROOT
+from smarter.common.models.whoami import WhoAmIModel
+from smarter.resources.models.chatbot import ChatbotModel
+
+
+TEST_API_KEY = "0123456789abcdef0123456789abcdef0123456789abcdef0123456789abcdef"
+
+
+def load_json(relative_path: str) -> dict:
+    """Load one of the example api responses that ship with the package."""
+    with open(os.path.join(PROJECT_ROOT, relative_path), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def whoami_json() -> dict:
+    return load_json("common/data/whoami.json")
+
+
+def chatbot_json(name: str = "netec-demo", chatbot_id: int = 36) -> dict:
+    """Return an example describe chatbot response for the given name and id."""
+    data = copy.deepcopy(load_json("resources/data/chatbot.json"))
+    status = data["data"]["status"]
+    data["data"]["metadata"]["name"] = name
+    for key in ["sandboxHost", "sandboxUrl", "urlChatbot"]:
+        status[key] = status[key].replace("/chatbots/36/", f"/chatbots/{chatbot_id}/")
+    for key in ["defaultHost", "hostname", "url", "urlChatapp"]:
+        status[key] = status[key].replace("netec-demo.", f"{name}.")
+    return data
+
+
+def chat_json() -> dict:
+    """Return an example 'cli/chat/' prompt response."""
+    return load_json("resources/data/chat.json")
+
+
+def whoami_model() -> WhoAmIModel:
+    return WhoAmIModel(**whoami_json())
+
+
+def chatbot_model(name: str = "netec-demo", chatbot_id: int = 36) -> ChatbotModel:
+    return ChatbotModel(**chatbot_json(name=name, chatbot_id=chatbot_id))
+
+
+def chatbot_list_json(names: list) -> dict:
+    """Return an example 'cli/get/chatbot/' list response for the given chatbot names."""
+    return {
+        "data": {"titles": [{"name": "name", "type": "CharField"}], "items": [{"name": name} for name in names]},
+        "api": "smarter.sh/v1",
+        "thing": "Chatbot",
+        "metadata": {"count": len(names)},
+    }
+
+
+def json_response(data: dict, status_code: int = 200) -> httpx.Response:
+    return httpx.Response(status_code, json=data, request=httpx.Request("POST", "https://platform.smarter.sh/"))
+
+
+class FakeApi:
+    """
+    Serves list and describe requests for a fleet of chatbots. Use fake_api.post
+    as the side_effect of a mock of ApiBase.post. Chatbot ids are derived from the
+    digits in the chatbot name, plus 100. With paginated=False the list endpoint
+    ignores the page parameters and always returns the whole fleet.
+    """
+
+    def __init__(self, names: list, delay: float = 0.0, missing: tuple = (), paginated: bool = True):
+        self.names = names
+        self.paginated = paginated
+        self.delay = delay
+        self.missing = missing
+        self.urls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, data=None, headers=None):  # pylint: disable=unused-argument
+        with self.lock:
+            self.urls.append(url)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            query = parse_qs(urlparse(url).query)
+            if "cli/get/chatbot/" in url and not self.paginated:
+                return json_response(chatbot_list_json(self.names))
+            if "cli/get/chatbot/" in url:
+                page, page_size = int(query["page"][0]), int(query["page_size"][0])
+                start, end = (page - 1) * page_size, page * page_size
+                return json_response(chatbot_list_json(self.names[start:end]))
+            name = query["name"][0]
+            if name in self.missing:
+                response = json_response({"error": "not found"}, status_code=404)
+                response.raise_for_status()
+            return json_response(chatbot_json(name, int(re.sub(r"\D", "", name) or 0) + 100))
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def list_requests(self) -> list:
+        return [url for url in self.urls if "cli/get/chatbot/" in url]
+
+    def describe_requests(self) -> list:
+        return [url for url in self.urls if "cli/describe/chatbot/" in url]
@@ -0,0 +1,166 @@
+"""
+Test the resumable batch pipeline.
+"""
+
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+from smarter.batch import BatchPipeline, Checkpoint
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterConfigurationError
+from smarter.resources import Chatbot
+from smarter.resources.snapshot import ChatbotSnapshot
+
+from .fixtures import TEST_API_KEY, chat_json, chatbot_model, json_response
+
+
+class Interrupted(BaseException):
+    """Stands in for a KeyboardInterrupt or a killed worker."""
+
+
+class FakeChatbot:
+    """Answers verbose prompts with the example chat response, and counts them."""
+
+    def __init__(self, name: str = "faq-bot", interrupt_at: int = None, fail: str = None, timeout: str = None):
+        self.name = name
+        self.interrupt_at = interrupt_at
+        self.fail = fail
+        self.timeout = timeout
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def prompt(self, message: str, verbose: bool = False, deadline: float = None):  # pylint: disable=unused-argument
+        with self.lock:
+            self.prompts.append(message)
+            count = len(self.prompts)
+        if count == self.interrupt_at:
+            raise Interrupted()
+        if message == self.fail:
+            raise ValueError("boom")
+        if message == self.timeout:
+            raise httpx.ReadTimeout("timed out")
+        time.sleep(0.001 * (count % 3))
+        response = copy.deepcopy(chat_json())
+        response["data"]["response"]["data"]["body"]["smarter"]["messages"][-1]["content"] = f"re: {message}"
+        return response
+
+
+class TestBatchPipeline(unittest.TestCase):
+    """Test streaming, ordering, checkpoints and resuming."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.input = os.path.join(directory.name, "prompts.jsonl")
+        self.output = os.path.join(directory.name, "results.jsonl")
+
+    def write_input(self, count: int, extra: str = "") -> None:
+        with open(self.input, "w", encoding="utf-8") as f:
+            for i in range(count):
+                f.write(json.dumps({"prompt": f"prompt {i}", "tenant": "acme"}) + "\n")
+            f.write(extra)
+
+    def results(self) -> list:
+        with open(self.output, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_results_in_input_order_with_usage(self):
+        self.write_input(50, extra="\nnot json\n")
+        chatbot = FakeChatbot(fail="prompt 7")
+        stats = BatchPipeline(self.input, self.output, chatbot=chatbot, concurrency=4, checkpoint_every=10).run()
+        results = self.results()
+        self.assertEqual([result["index"] for result in results], list(range(1, 52)))
+        self.assertEqual(results[0]["response"], "re: prompt 0")
+        self.assertEqual(results[0]["tenant"], "acme")
+        self.assertEqual(results[0]["model"], "gpt-4o-2024-08-06")
+        self.assertEqual(results[0]["usage"]["total_tokens"], 571)
+        self.assertTrue(results[7]["error"].startswith("ValueError"))
+        self.assertTrue(results[50]["error"].startswith("JSONDecodeError"))
+        self.assertEqual((stats.records, stats.errors, stats.total_tokens), (51, 2, 49 * 571))
+        self.assertTrue(Checkpoint.load(f"{self.output}.checkpoint").complete)
+        # a complete batch is not run again.
+        again = FakeChatbot()
+        self.assertEqual(BatchPipeline(self.input, self.output, chatbot=again).run().records, 51)
+        self.assertEqual(again.prompts, [])
+
+    def test_resume_after_an_interruption(self):
+        self.write_input(40)
+        first = FakeChatbot(interrupt_at=25)
+        with self.assertRaises(Interrupted):
+            BatchPipeline(self.input, self.output, chatbot=first, concurrency=4, checkpoint_every=7).run()
+        written = len(self.results())
+        self.assertGreaterEqual(written, 20)
+        self.assertLess(written, 40)
+
+        second = FakeChatbot()
+        stats = BatchPipeline(self.input, self.output, chatbot=second, concurrency=4, checkpoint_every=7).run()
+        self.assertEqual(stats.resumed_at, written)
+        self.assertEqual(len(second.prompts), 40 - written)
+        self.assertEqual([result["index"] for result in self.results()], list(range(1, 41)))
+        self.assertEqual(stats.total_tokens, stats.records * 571)
+
+    def test_resume_past_the_checkpoint_and_a_torn_line(self):
+        self.write_input(10)
+        BatchPipeline(self.input, self.output, chatbot=FakeChatbot(), checkpoint_every=3).run()
+        results = self.results()
+        # a crash after six results were written, but before they were checkpointed, mid-way through the seventh.
+        Checkpoint().save(f"{self.output}.checkpoint")
+        with open(self.output, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(result, separators=(",", ":")) + "\n" for result in results[:6])
+            f.write('{"id":"7","ind')
+        chatbot = FakeChatbot()
+        stats = BatchPipeline(self.input, self.output, chatbot=chatbot).run()
+        self.assertEqual(chatbot.prompts, [f"prompt {i}" for i in range(6, 10)])
+        self.assertEqual(self.results(), results[:6] + self.results()[6:])
+        self.assertEqual(len(self.results()), 10)
+        self.assertEqual(stats.records, 10)
+
+    def test_retry_errors(self):
+        self.write_input(10)
+        stats = BatchPipeline(self.input, self.output, chatbot=FakeChatbot(fail="prompt 7", timeout="prompt 3")).run()
+        self.assertEqual((stats.errors, stats.retryable), (2, 1))
+        self.assertTrue(self.results()[3]["retryable"])
+        self.assertFalse(self.results()[7]["retryable"])
+        # an interrupted retry leaves the output as it was.
+        before = self.results()
+        with self.assertRaises(Interrupted):
+            BatchPipeline(self.input, self.output, chatbot=FakeChatbot(interrupt_at=1), retry_errors=True).run()
+        self.assertEqual(self.results(), before)
+        # a complete batch is only prompted again for its retryable errors.
+        chatbot = FakeChatbot(fail="prompt 7")
+        stats = BatchPipeline(self.input, self.output, chatbot=chatbot, retry_errors=True).run()
+        self.assertEqual(chatbot.prompts, ["prompt 3"])
+        self.assertEqual((stats.records, stats.errors, stats.retryable), (10, 1, 0))
+        results = self.results()
+        self.assertEqual([result["index"] for result in results], list(range(1, 11)))
+        self.assertEqual((results[3]["response"], results[3]["error"]), ("re: prompt 3", None))
+        self.assertTrue(results[7]["error"].startswith("ValueError"))
+        checkpoint = Checkpoint.load(f"{self.output}.checkpoint")
+        self.assertTrue(checkpoint.complete)
+        self.assertEqual(checkpoint.output_offset, os.path.getsize(self.output))
+        self.assertFalse(os.path.exists(f"{self.output}.retry"))
+
+    def test_chatbots_by_name(self):
+        with open(self.input, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "a", "prompt": "hello", "chatbot": "netec-demo"}) + "\n")
+        chatbots = mock.Mock()
+        chatbots.get.return_value = Chatbot(api_key=TEST_API_KEY, snapshot=ChatbotSnapshot.from_model(chatbot_model()))
+        with mock.patch.object(ApiBase, "post", return_value=json_response(chat_json())):
+            BatchPipeline(self.input, self.output, chatbots=chatbots).run()
+        (result,) = self.results()
+        self.assertEqual((result["id"], result["chatbot"], result["error"]), ("a", "netec-demo", None))
+        chatbots.get.assert_called_once_with(name="netec-demo")
+        with self.assertRaises(SmarterConfigurationError):
+            BatchPipeline(self.input, self.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Test the load generator.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from array import array
+from collections import Counter
+
+import httpx
+
+from smarter.api.client import RESOURCE_CACHE
+from smarter.bench import BenchConfig, BenchResult, error_kind, run
+from smarter.bench.runner import main
+from smarter.common.exceptions import SmarterValueError
+
+
+class FakeChatbot:
+    """Answers prompts after delay, failing every failures-th one, and counts them."""
+
+    def __init__(self, delay: float = 0.0, failures: int = 0):
+        self.delay = delay
+        self.failures = failures
+        self.prompts = 0
+        self.lock = threading.Lock()
+
+    def prompt(self, message: str) -> str:
+        with self.lock:
+            self.prompts += 1
+            count = self.prompts
+        time.sleep(self.delay)
+        if self.failures and count % self.failures == 0:
+            request = httpx.Request("POST", "http://platform.example.com/api/v1/cli/chat/faq-bot/")
+            raise httpx.HTTPStatusError("throttled", request=request, response=httpx.Response(429, request=request))
+        return message
+
+
+class TestBenchConfig(unittest.TestCase):
+    """Test validation and arrival schedules."""
+
+    def test_validation(self):
+        for kwargs in [{"mode": "burst"}, {"execution": "async"}, {"requests": 0}, {"mode": "poisson", "rate": 0}]:
+            with self.assertRaises(SmarterValueError):
+                BenchConfig(**kwargs)
+
+    def test_arrivals(self):
+        self.assertEqual(BenchConfig(mode="constant", rate=4, requests=3).arrivals(), [0.0, 0.25, 0.5])
+        poisson = BenchConfig(mode="poisson", rate=100, requests=5000, seed=1).arrivals()
+        self.assertEqual(poisson, BenchConfig(mode="poisson", rate=100, requests=5000, seed=1).arrivals())
+        self.assertAlmostEqual(poisson[-1] / len(poisson), 0.01, delta=0.001)
+
+
+class TestRun(unittest.TestCase):
+    """Test closed and open loop runs."""
+
+    def test_closed_loop_threads(self):
+        chatbot = FakeChatbot(delay=0.01, failures=10)
+        result = run(BenchConfig(requests=40, concurrency=4, warmup=2), chatbot, target="fake")
+        self.assertEqual(chatbot.prompts, 42)
+        self.assertEqual(result.requests, 40)
+        self.assertEqual(sum(result.errors.values()), 4)
+        self.assertEqual(set(result.errors), {"http_429"})
+        self.assertTrue(all(latency >= 0.009 for latency in result.latencies))
+        # four threads overlap their prompts.
+        self.assertLess(result.elapsed, 40 * 0.01)
+
+    def test_open_loop_charges_queueing_delay(self):
+        # one thread can serve 20 prompts per second, but they arrive at 100 per second.
+        chatbot = FakeChatbot(delay=0.05)
+        config = BenchConfig(mode="constant", rate=100, requests=10, warmup=0, execution="sync")
+        result = run(config, chatbot)
+        latencies = list(result.latencies)
+        self.assertGreater(latencies[-1], latencies[0] + 0.3)
+        self.assertGreaterEqual(result.elapsed, 0.5)
+
+    def test_open_loop_threads_keep_the_schedule(self):
+        config = BenchConfig(mode="poisson", rate=200, requests=50, concurrency=8, warmup=0, seed=1)
+        result = run(config, FakeChatbot(delay=0.02))
+        self.assertLess(result.percentiles()["p50"], 0.05)
+        self.assertAlmostEqual(result.elapsed, config.arrivals()[-1] + 0.02, delta=0.15)
+
+    def test_result(self):
+        latencies = array("d", [i / 1000 for i in range(1, 1001)])
+        result = BenchResult(BenchConfig(), "fake", 2.0, 0.5, latencies, Counter({"http_500": 100}))
+        self.assertEqual(result.percentiles(), {"p50": 0.5, "p95": 0.95, "p99": 0.99, "p999": 0.999})
+        self.assertEqual(result.throughput, 500.0)
+        self.assertEqual(result.goodput, 450.0)
+        self.assertEqual(result.cpu_per_request, 0.0005)
+        report = json.loads(json.dumps(result.to_dict()))
+        self.assertEqual(report["latency"]["p99"], 0.99)
+        self.assertEqual(report["config"]["mode"], "closed")
+        self.assertIn("http_500 100", result.format())
+
+    def test_error_kind(self):
+        self.assertEqual(error_kind(ValueError("boom")), "ValueError")
+        self.assertEqual(error_kind(httpx.ReadTimeout("slow")), "ReadTimeout")
+
+
+class TestMain(unittest.TestCase):
+    """Test python -m smarter.bench against a fake server subprocess."""
+
+    def test_json_output(self):
+        RESOURCE_CACHE.clear()
+        self.addCleanup(RESOURCE_CACHE.clear)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.json")
+            main(["--requests", "20", "--concurrency", "2", "--server-processes", "1", "--json", path])
+            with open(path, encoding="utf-8") as f:
+                report = json.load(f)
+        self.assertEqual(report["requests"], 20)
+        self.assertEqual(report["errors"], {})
+        self.assertGreater(report["cpu_per_request"], 0)
+        self.assertEqual(set(report["latency"]), {"p50", "p95", "p99", "p999"})
+
+
+if __name__ == "__main__":
+    unittest.main()
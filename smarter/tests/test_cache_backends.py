@@ -0,0 +1,279 @@
+"""
+Test the cache backends, against a local fake of a Redis client.
+"""
+
+import fnmatch
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from smarter import Smarter
+from smarter.api.client import RESOURCE_CACHE
+from smarter.cache import (
+    DiskCacheBackend,
+    MemoryCacheBackend,
+    PromptCache,
+    RedisCacheBackend,
+)
+from smarter.cache.backends import dumps, loads
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterConfigurationError, SmarterValueError
+from smarter.resources.snapshot import ChatbotSnapshot
+
+from .fixtures import TEST_API_KEY, FakeApi, chat_json, chatbot_model, whoami_model
+
+
+class FakeRedis:
+    """The subset of redis-py's Redis class that RedisCacheBackend uses, in memory."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.data = {}
+        self.commands = []
+        self.round_trips = 0
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= self.now:
+            del self.data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self.lock:
+            self.round_trips += 1
+            self.commands.append(("get", key))
+            return self._live(key)
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        with self.lock:
+            self.round_trips += 1
+            self.commands.append(("set", key))
+            if nx and self._live(key) is not None:
+                return None
+            expires = self.now + ex if ex else self.now + px / 1000 if px else None
+            self.data[key] = (value if isinstance(value, bytes) else str(value).encode(), expires)
+            return True
+
+    def delete(self, *keys):
+        with self.lock:
+            self.round_trips += 1
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def eval(self, script, numkeys, *keys_and_args):
+        """Runs RedisCacheBackend.RELEASE_SCRIPT, atomically."""
+        assert script == RedisCacheBackend.RELEASE_SCRIPT and numkeys == 1
+        key, token = keys_and_args
+        with self.lock:
+            self.round_trips += 1
+            if self._live(key) != token.encode():
+                return 0
+            del self.data[key]
+            return 1
+
+    def scan_iter(self, match="*"):
+        with self.lock:
+            return [key for key in list(self.data) if fnmatch.fnmatch(key, match) and self._live(key) is not None]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Buffers commands and sends them to FakeRedis in one round trip."""
+
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.keys = []
+
+    def get(self, key):
+        self.keys.append(key)
+        return self
+
+    def execute(self):
+        with self.redis.lock:
+            self.redis.round_trips += 1
+            return [self.redis._live(key) for key in self.keys]  # pylint: disable=protected-access
+
+
+def snapshot(name: str = "netec-demo", chatbot_id: int = 36) -> ChatbotSnapshot:
+    return ChatbotSnapshot.from_model(chatbot_model(name=name, chatbot_id=chatbot_id))
+
+
+class TestSerialization(unittest.TestCase):
+    """Test dumps() and loads()."""
+
+    def test_chatbot_model_round_trip(self):
+        model = chatbot_model()
+        restored = loads(dumps(model))
+        self.assertEqual(restored, model)
+        self.assertEqual(restored.data.status.urlChatbot, model.data.status.urlChatbot)
+
+    def test_snapshot_round_trip(self):
+        self.assertEqual(loads(dumps(snapshot())), snapshot())
+        self.assertEqual(dict(loads(dumps(snapshot())).config), dict(snapshot().config))
+
+    def test_json_round_trip(self):
+        self.assertEqual(loads(dumps(chat_json())), chat_json())
+        self.assertEqual(loads(dumps(chat_json()).decode("utf-8")), chat_json())
+
+    def test_unknown_tag(self):
+        with self.assertRaises(SmarterValueError):
+            loads(b"x{}")
+
+
+class TestLocalBackends(unittest.TestCase):
+    """Test the memory and disk backends."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.now = 1000.0
+
+    def test_memory_backend(self):
+        backend = MemoryCacheBackend(maxsize=10, ttl=60)
+        backend.set("Chatbot_netec-demo", snapshot())
+        self.assertEqual(backend.get("Chatbot_netec-demo"), snapshot())
+        self.assertEqual(backend.get_many(["Chatbot_netec-demo", "Chatbot_other"]), {"Chatbot_netec-demo": snapshot()})
+        backend.delete("Chatbot_netec-demo")
+        self.assertIsNone(backend.get("Chatbot_netec-demo"))
+
+    def test_disk_backend_ttl(self):
+        backend = DiskCacheBackend(self.directory.name, ttl=60, clock=lambda: self.now)
+        backend.set("Chatbot_netec-demo", chatbot_model())
+        backend.set("prompt", chat_json(), ttl=600)
+        self.assertEqual(backend.get("Chatbot_netec-demo"), chatbot_model())
+        self.now += 61
+        self.assertIsNone(backend.get("Chatbot_netec-demo"))
+        self.assertEqual(backend.get("prompt"), chat_json())
+
+    def test_disk_backend_is_shared_and_cleared(self):
+        other = os.path.join(self.directory.name, "other.txt")
+        with open(other, "w", encoding="utf-8") as f:
+            f.write("not a cache entry")
+        DiskCacheBackend(self.directory.name).set("Chatbot_netec-demo", snapshot())
+        backend = DiskCacheBackend(self.directory.name)
+        self.assertEqual(backend.get("Chatbot_netec-demo"), snapshot())
+        backend.clear()
+        self.assertIsNone(backend.get("Chatbot_netec-demo"))
+        self.assertTrue(os.path.exists(other))
+
+    def test_prompt_cache_backend_tier(self):
+        backend = MemoryCacheBackend()
+        PromptCache(backend=backend).set("key", chat_json())
+        cache = PromptCache(backend=backend)
+        self.assertEqual(cache.get("key"), chat_json())
+        self.assertEqual(cache.get("key"), chat_json())
+        self.assertEqual(cache.stats()["backend_hits"], 1)
+        self.assertEqual(cache.stats()["hits"], 2)
+
+
+class TestRedisCacheBackend(unittest.TestCase):
+    """Test RedisCacheBackend against FakeRedis."""
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.backend = RedisCacheBackend(self.redis, ttl=60, sleep=self.sleep, clock=lambda: self.redis.now)
+
+    def sleep(self, seconds: float) -> None:
+        self.redis.now += seconds
+
+    def test_round_trip_and_ttl(self):
+        self.backend.set("Chatbot_netec-demo", snapshot())
+        self.assertIn("smarter:Chatbot_netec-demo", self.redis.data)
+        self.assertEqual(self.backend.get("Chatbot_netec-demo"), snapshot())
+        self.redis.now += 61
+        self.assertIsNone(self.backend.get("Chatbot_netec-demo"))
+
+    def test_get_many_is_one_round_trip(self):
+        for i in range(10):
+            self.backend.set(f"Chatbot_chatbot-{i}", snapshot(name=f"chatbot-{i}", chatbot_id=i))
+        self.redis.round_trips = 0
+        keys = [f"Chatbot_chatbot-{i}" for i in range(12)]
+        values = self.backend.get_many(keys)
+        self.assertEqual(self.redis.round_trips, 1)
+        self.assertEqual(len(values), 10)
+        self.assertEqual(values["Chatbot_chatbot-3"].chatbot_id, 3)
+
+    def test_clear_only_removes_prefixed_keys(self):
+        self.redis.set("unrelated", b"1")
+        self.backend.set("Chatbot_netec-demo", snapshot())
+        self.backend.clear()
+        self.assertEqual(list(self.redis.data), ["unrelated"])
+
+    def test_refresh_lease(self):
+        fetches = []
+
+        def fetch():
+            fetches.append(1)
+            return snapshot()
+
+        self.assertEqual(self.backend.refresh("Chatbot_netec-demo", fetch), snapshot())
+        self.assertEqual(self.backend.refresh("Chatbot_netec-demo", fetch), snapshot())
+        self.assertEqual(len(fetches), 1)
+        self.assertNotIn("smarter:lease:Chatbot_netec-demo", self.redis.data)
+
+    def test_expired_lease_is_not_released(self):
+        lease_key = "smarter:lease:Chatbot_netec-demo"
+
+        def fetch():
+            # the lease expires during a slow fetch, and another client takes it.
+            self.redis.now += 31
+            self.redis.set(lease_key, "other", px=30000, nx=True)
+            return snapshot()
+
+        self.assertEqual(self.backend.refresh("Chatbot_netec-demo", fetch), snapshot())
+        self.assertEqual(self.redis.get(lease_key), b"other")
+
+    def test_refresh_waits_for_the_lease_holder(self):
+        self.redis.set("smarter:lease:Chatbot_netec-demo", "other", px=30000, nx=True)
+
+        def sleep(seconds):
+            self.redis.now += seconds
+            self.backend.set("Chatbot_netec-demo", snapshot())
+
+        self.backend.sleep = sleep
+        self.assertEqual(self.backend.refresh("Chatbot_netec-demo", self.fail), snapshot())
+
+    def test_refresh_gives_up_on_a_stuck_lease_holder(self):
+        self.redis.set("smarter:lease:Chatbot_netec-demo", "other", px=30000, nx=True)
+        self.assertEqual(self.backend.refresh("Chatbot_netec-demo", snapshot), snapshot())
+        self.assertEqual(self.backend.get("Chatbot_netec-demo"), snapshot())
+
+    def test_from_url_requires_redis(self):
+        with mock.patch.dict("sys.modules", {"redis": None}):
+            with self.assertRaises(SmarterConfigurationError):
+                RedisCacheBackend.from_url("redis://localhost:6379/0")
+
+
+class TestCacheBackendClient(unittest.TestCase):
+    """Test that pods share described chatbots through a RedisCacheBackend."""
+
+    def setUp(self):
+        RESOURCE_CACHE.clear()
+        self.addCleanup(RESOURCE_CACHE.clear)
+        self.redis = FakeRedis()
+        self.shared_cache = RedisCacheBackend(self.redis)
+
+    def client(self) -> Smarter:
+        return Smarter(api_key=TEST_API_KEY, model=whoami_model(), shared_cache=self.shared_cache)
+
+    def test_get_many_uses_a_pipelined_lookup(self):
+        names = [f"chatbot-{i}" for i in range(5)]
+        fake_api = FakeApi(names=names)
+        with mock.patch.object(ApiBase, "post", side_effect=fake_api.post):
+            self.client().resources.chatbots.get_many(names)
+            # another pod starts with an empty RESOURCE_CACHE.
+            RESOURCE_CACHE.clear()
+            self.redis.round_trips = 0
+            result = self.client().resources.chatbots.get_many(names)
+        self.assertTrue(result.ok)
+        self.assertEqual(len(fake_api.describe_requests()), 5)
+        self.assertEqual(self.redis.round_trips, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
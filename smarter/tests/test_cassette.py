@@ -0,0 +1,157 @@
+"""
+Test recording and replaying traffic with cassettes.
+"""
+
+import gzip
+import os
+import tempfile
+import unittest
+
+import httpx
+
+from smarter import Smarter
+from smarter.api.client import RESOURCE_CACHE
+from smarter.common import pool
+from smarter.common.exceptions import SmarterValueError
+from smarter.testing import (
+    Cassette,
+    FakeServer,
+    FakeServerConfig,
+    Interaction,
+    RecordingTransport,
+    ReplayTransport,
+    recording,
+    replay_traffic,
+    replaying,
+)
+
+from .fixtures import TEST_API_KEY
+
+
+class TestCassette(unittest.TestCase):
+    """Test recording against a FakeServer and replaying without it."""
+
+    def setUp(self):
+        RESOURCE_CACHE.clear()
+        self.addCleanup(RESOURCE_CACHE.clear)
+        self.addCleanup(pool.set_transport, None)
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "traffic.cassette")
+
+    def record(self) -> str:
+        """Record a whoami, a describe and two prompts, and return the server url."""
+        with FakeServer(FakeServerConfig(seed=1)) as server:
+            with recording(self.path) as cassette:
+                chatbot = Smarter(api_key=TEST_API_KEY, base_url=server.url).resources.chatbots.get(name="faq-bot")
+                chatbot.prompt("What are your opening hours?")
+                chatbot.prompt("Where are you?")
+        self.assertEqual(len(cassette), 4)
+        return server.url
+
+    def test_record_scrubs_the_api_key(self):
+        self.record()
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            text = f.read()
+        self.assertNotIn(TEST_API_KEY, text)
+        cassette = Cassette.load(self.path)
+        self.assertEqual(
+            [interaction.endpoint for interaction in cassette.interactions],
+            ["cli/whoami/", "cli/describe/", "cli/chat/", "cli/chat/"],
+        )
+        chat = cassette.interactions[2]
+        self.assertEqual(chat.request["prompt"], "What are your opening hours?")
+        self.assertEqual(chat.status, 200)
+        self.assertEqual(chat.headers, {"content-type": "application/json"})
+        self.assertGreater(chat.elapsed, 0)
+        self.assertLessEqual(len(cassette.bodies), 4)
+
+    def test_replay_without_the_network(self):
+        base_url = self.record()
+        RESOURCE_CACHE.clear()
+        with replaying(self.path):
+            chatbot = Smarter(api_key=TEST_API_KEY, base_url=base_url).resources.chatbots.get(name="faq-bot")
+            responses = [chatbot.prompt(prompt, verbose=True) for prompt in ["first", "second", "third"]]
+        inputs = [response["data"]["response"]["data"]["body"]["metadata"]["input_text"] for response in responses]
+        # each request is answered by the next recording of its path, looping around.
+        self.assertEqual(inputs, ["What are your opening hours?", "Where are you?", "What are your opening hours?"])
+
+    def test_replay_traffic(self):
+        base_url = self.record()
+        RESOURCE_CACHE.clear()
+        with replaying(self.path) as cassette:
+            chatbots = Smarter(api_key=TEST_API_KEY, base_url=base_url).resources.chatbots
+            report = replay_traffic(cassette, chatbots, timing="original", speed=100.0, trace_memory=True)
+        self.assertEqual(report.prompts, 2)
+        self.assertEqual(report.errors, {})
+        self.assertGreater(report.peak_memory, 0)
+        self.assertGreater(report.to_dict()["throughput"], 0)
+
+
+class TestReplayTransport(unittest.TestCase):
+    """Test matching, timing and errors of a ReplayTransport."""
+
+    def cassette(self) -> Cassette:
+        cassette = Cassette()
+        for offset, elapsed, status in [(0.0, 0.2, 200), (0.5, 0.4, 429)]:
+            interaction = Interaction(offset, elapsed, "POST", "/api/v1/cli/whoami/", None, status, {})
+            cassette.add(interaction, b'{"status": %d}' % status)
+        cassette.add(Interaction(1.0, 0.1, "POST", "/api/v1/cli/chat/faq-bot/", None, 0, {}, error="ReadTimeout"), None)
+        return cassette
+
+    def test_original_timing_and_order(self):
+        sleeps = []
+        transport = ReplayTransport(self.cassette(), timing="original", speed=2.0, sleep=sleeps.append)
+        with httpx.Client(transport=transport, base_url="http://platform.example.com") as client:
+            statuses = [client.post("api/v1/cli/whoami/").status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 429, 200])
+        self.assertEqual(sleeps, [0.1, 0.2, 0.1])
+
+    def test_errors(self):
+        transport = ReplayTransport(self.cassette(), loop=False)
+        with httpx.Client(transport=transport, base_url="http://platform.example.com") as client:
+            with self.assertRaises(httpx.ReadTimeout):
+                client.post("api/v1/cli/chat/faq-bot/")
+            with self.assertRaises(SmarterValueError):
+                client.post("api/v1/cli/chat/other-bot/")
+            client.post("api/v1/cli/whoami/")
+            client.post("api/v1/cli/whoami/")
+            with self.assertRaises(SmarterValueError):
+                client.post("api/v1/cli/whoami/")
+        with self.assertRaises(SmarterValueError):
+            ReplayTransport(Cassette(), timing="slow")
+
+    def test_record_and_replay_compressed_responses(self):
+        content = b'{"status": "ok"}'
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            encoded = gzip.compress(content)
+            headers = {"content-type": "application/json", "content-encoding": "gzip"}
+            return httpx.Response(200, headers=headers, stream=httpx.ByteStream(encoded), request=request)
+
+        recorder = RecordingTransport(transport=httpx.MockTransport(handler))
+        with httpx.Client(transport=recorder, base_url="http://platform.example.com") as client:
+            self.assertEqual(client.post("api/v1/cli/whoami/").json(), {"status": "ok"})
+        self.assertEqual(recorder.cassette.body(recorder.cassette.interactions[0]), content)
+        with httpx.Client(
+            transport=ReplayTransport(recorder.cassette), base_url="http://platform.example.com"
+        ) as client:
+            self.assertEqual(client.post("api/v1/cli/whoami/").json(), {"status": "ok"})
+
+    def test_save_and_load(self):
+        cassette = self.cassette()
+        cassette.add(Interaction(2.0, 0.1, "GET", "/binary", None, 200, {}), b"\xff\xfe")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traffic.cassette")
+            cassette.save(path)
+            loaded = Cassette.load(path)
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                f.write("{}\n")
+            with self.assertRaises(SmarterValueError):
+                Cassette.load(path)
+        self.assertEqual(loaded.interactions, cassette.interactions)
+        self.assertEqual(loaded.bodies, cassette.bodies)
+
+
+if __name__ == "__main__":
+    unittest.main()
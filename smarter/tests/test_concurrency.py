@@ -0,0 +1,143 @@
+"""
+Test the adaptive (AIMD) concurrency limiter.
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+from smarter import Chatbot
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterValueError
+from smarter.traffic import ConcurrencyLimiter
+
+from .fixtures import TEST_API_KEY, chat_json, chatbot_model, json_response
+
+
+def status_error(status_code: int) -> httpx.HTTPStatusError:
+    response = json_response({}, status_code=status_code)
+    return httpx.HTTPStatusError("error", request=response.request, response=response)
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+    """Test ConcurrencyLimiter."""
+
+    def setUp(self):
+        self.now = 0.0
+
+    def limiter(self, **kwargs) -> ConcurrencyLimiter:
+        return ConcurrencyLimiter(clock=lambda: self.now, **kwargs)
+
+    def saturate(self, limiter: ConcurrencyLimiter, requests: int, latency: float = 0.1, error=None) -> None:
+        """Complete requests while the limiter is fully used."""
+        for _ in range(requests):
+            limiter.in_flight = limiter.limit - 1
+            self.now += latency
+            limiter.record(latency, error)
+        limiter.in_flight = 0
+
+    def test_invalid_limits(self):
+        with self.assertRaises(SmarterValueError):
+            ConcurrencyLimiter(initial_limit=10, max_limit=5)
+        with self.assertRaises(SmarterValueError):
+            ConcurrencyLimiter(backoff=1.5)
+
+    def test_additive_increase(self):
+        limiter = self.limiter(initial_limit=2)
+        # about one more slot per limit's worth of completed requests.
+        self.saturate(limiter, 3)
+        self.assertEqual(limiter.limit, 3)
+        self.saturate(limiter, 4)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_no_increase_when_underused(self):
+        limiter = self.limiter(initial_limit=4)
+        for _ in range(50):
+            limiter.record(0.1)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_max_limit(self):
+        limiter = self.limiter(initial_limit=2, max_limit=3)
+        self.saturate(limiter, 100)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_multiplicative_decrease(self):
+        limiter = self.limiter(initial_limit=16)
+        self.saturate(limiter, 1)
+        self.saturate(limiter, 1, error=status_error(429))
+        self.assertEqual(limiter.limit, 8)
+        self.saturate(limiter, 1, error=status_error(503))
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.stats()["overloads"], 2)
+        # client errors are not overloads.
+        self.saturate(limiter, 1, error=status_error(404))
+        self.assertEqual(limiter.limit, 4)
+        self.saturate(limiter, 10, error=status_error(500))
+        self.assertEqual(limiter.limit, 1)
+
+    def test_one_decrease_per_window(self):
+        limiter = self.limiter(initial_limit=16)
+        self.saturate(limiter, 1, latency=1.0)
+        for _ in range(5):
+            limiter.record(0.0, status_error(429))
+        self.assertEqual(limiter.limit, 8)
+
+    def test_latency_gradient(self):
+        limiter = self.limiter(initial_limit=16)
+        self.saturate(limiter, 20, latency=0.1)
+        self.assertEqual(limiter.limit, 17)
+        self.saturate(limiter, 3, latency=1.0)
+        self.assertLess(limiter.limit, 17)
+        self.assertEqual(limiter.stats()["overloads"], 0)
+
+    def test_acquire_blocks_at_limit(self):
+        limiter = ConcurrencyLimiter(initial_limit=2)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        threading.Timer(0.05, limiter.release).start()
+        self.assertTrue(limiter.acquire(timeout=5))
+        self.assertEqual(limiter.stats()["max_in_flight"], 2)
+
+    def test_slot(self):
+        limiter = ConcurrencyLimiter(initial_limit=4)
+        with limiter.slot():
+            self.assertEqual(limiter.in_flight, 1)
+        with self.assertRaises(httpx.HTTPStatusError):
+            with limiter.slot():
+                raise status_error(429)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_chatbot_prompt(self):
+        limiter = ConcurrencyLimiter(initial_limit=8)
+        chatbot = Chatbot(api_key=TEST_API_KEY, name="netec-demo", model=chatbot_model(), concurrency_limiter=limiter)
+        responses = [status_error(429), json_response(chat_json())]
+        with mock.patch.object(ApiBase, "post", side_effect=responses):
+            with self.assertRaises(httpx.HTTPStatusError):
+                chatbot.prompt("Hello")
+            chatbot.prompt("Hello")
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_threads_respect_the_limit(self):
+        limiter = ConcurrencyLimiter(initial_limit=3, max_limit=3)
+
+        def work():
+            for _ in range(5):
+                with limiter.slot():
+                    time.sleep(0.001)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(limiter.stats()["max_in_flight"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
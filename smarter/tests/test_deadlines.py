@@ -0,0 +1,193 @@
+"""
+Test call deadlines, per-phase timeouts and adaptive read timeouts.
+"""
+
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+from smarter import Chatbot
+from smarter.common.classes import ApiBase
+from smarter.common.conf import settings as smarter_settings
+from smarter.common.exceptions import SmarterDeadlineExceededError
+from smarter.common.pool import http_timeout
+from smarter.traffic import (
+    AdaptiveTimeouts,
+    ApiKeyPool,
+    ConcurrencyLimiter,
+    Hedger,
+    RateLimiter,
+    RequestScheduler,
+    deadline,
+)
+from smarter.traffic.deadlines import NO_DEADLINE, current_deadline, remaining
+
+from .fixtures import TEST_API_KEY, chat_json, chatbot_model, json_response
+
+
+ENDPOINT = "/api/v1/cli/chat/netec-demo/"
+
+
+class TestDeadline(unittest.TestCase):
+    """Test the deadline context."""
+
+    def test_no_deadline(self):
+        self.assertEqual(current_deadline(), NO_DEADLINE)
+        self.assertIsNone(remaining())
+        self.assertEqual(remaining(5.0), 5.0)
+
+    def test_nested_deadlines_only_shorten(self):
+        with deadline(10.0) as outer:
+            self.assertLessEqual(remaining(), 10.0)
+            self.assertEqual(remaining(1.0), 1.0)
+            with deadline(60.0) as inner:
+                self.assertEqual(inner, outer)
+            with deadline(None) as inner:
+                self.assertEqual(inner, outer)
+            with deadline(1.0) as inner:
+                self.assertLess(inner.expires, outer.expires)
+        self.assertEqual(current_deadline(), NO_DEADLINE)
+
+    def test_check(self):
+        with deadline(0.5) as current:
+            current.check("now")
+            with self.assertRaises(SmarterDeadlineExceededError):
+                current.check("a long wait", wait=1.0)
+        with deadline(0) as current:
+            self.assertTrue(current.expired)
+
+
+class TestDeadlinePropagation(unittest.TestCase):
+    """Test that waits are cut short at the call deadline."""
+
+    def test_rate_limiter(self):
+        sleeps = []
+        limiter = RateLimiter(requests_per_minute=1, burst_seconds=1, sleep=sleeps.append)
+        limiter.acquire(tokens=1)
+        with deadline(5.0), self.assertRaises(SmarterDeadlineExceededError):
+            limiter.acquire(tokens=1)
+        self.assertEqual(sleeps, [])
+
+    def test_concurrency_limiter(self):
+        limiter = ConcurrencyLimiter(initial_limit=1)
+        limiter.acquire()
+        with deadline(0.02), self.assertRaises(SmarterDeadlineExceededError):
+            with limiter.slot():
+                pass
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_scheduler(self):
+        scheduler = RequestScheduler(max_in_flight=1)
+        scheduler.acquire("netec-demo")
+        with deadline(0.02), self.assertRaises(SmarterDeadlineExceededError):
+            scheduler.acquire("netec-demo")
+        self.assertEqual(scheduler.stats()["shed"]["default"], 1)
+
+    def test_key_pool_cooldown(self):
+        error = httpx.HTTPStatusError(
+            "", request=None, response=httpx.Response(429, request=httpx.Request("POST", "https://localhost/"))
+        )
+        pool = ApiKeyPool(["key-aaaa"], cooldown=60, sleep=self.fail)
+        pool.release(pool.select(), error=error)
+        with deadline(5.0), self.assertRaises(SmarterDeadlineExceededError):
+            pool.select()
+
+    def test_hedger(self):
+        hedger = Hedger(initial_delay=0.01)
+        seen = []
+
+        def call():
+            seen.append(current_deadline())
+            time.sleep(0.2)
+
+        try:
+            with deadline(0.05) as current, self.assertRaises(SmarterDeadlineExceededError):
+                hedger.call(ENDPOINT, call)
+        finally:
+            hedger.shutdown()
+        # the attempts run in the executor, with the caller's deadline.
+        self.assertEqual(set(seen), {current})
+
+    def test_chatbot_prompt(self):
+        deadlines = []
+
+        def post(url, data=None, headers=None, api_key=None):  # pylint: disable=unused-argument
+            deadlines.append(remaining())
+            return json_response(chat_json())
+
+        chatbot = Chatbot(api_key=TEST_API_KEY, name="netec-demo", model=chatbot_model())
+        with mock.patch.object(ApiBase, "post", side_effect=post):
+            chatbot.prompt("Hello", deadline=30.0)
+            chatbot.prompt("Hello")
+        self.assertLessEqual(deadlines[0], 30.0)
+        self.assertIsNone(deadlines[1])
+
+
+class TestTimeouts(unittest.TestCase):
+    """Test the per-phase and adaptive timeouts of requests."""
+
+    def setUp(self):
+        self.adaptive = AdaptiveTimeouts(min_samples=3, min_timeout=0.5, max_timeout=30.0)
+        self.chatbot = Chatbot(
+            api_key=TEST_API_KEY, name="netec-demo", model=chatbot_model(), adaptive_timeouts=self.adaptive
+        )
+
+    def test_phase_timeouts_from_settings(self):
+        timeout = http_timeout(60)
+        self.assertEqual(timeout.connect, smarter_settings.smarter_connect_timeout)
+        self.assertEqual(timeout.read, 60)
+        self.assertEqual(timeout.write, smarter_settings.smarter_write_timeout)
+        self.assertEqual(timeout.pool, smarter_settings.smarter_pool_timeout)
+        self.assertEqual(http_timeout(1).read, 1)
+        # the client timeout is the read timeout, unless one is set.
+        self.assertEqual(http_timeout(300).read, 300)
+        self.assertEqual(http_timeout(300).connect, smarter_settings.smarter_connect_timeout)
+        settings = smarter_settings.model_copy(update={"smarter_read_timeout": 30.0})
+        with mock.patch("smarter.common.pool.smarter_settings", settings):
+            self.assertEqual(http_timeout(300).read, 30.0)
+            self.assertEqual(http_timeout(10).read, 10)
+
+    def test_adaptive_read_timeout(self):
+        self.assertEqual(self.adaptive.read_timeout(ENDPOINT), 30.0)
+        for latency in [0.5, 1.0, 2.0]:
+            self.adaptive.observe(ENDPOINT, latency)
+        self.assertEqual(self.adaptive.read_timeout(ENDPOINT), 6.0)
+        self.assertEqual(self.adaptive.stats(), {ENDPOINT: 6.0})
+        self.assertEqual(self.chatbot.request_timeout(ENDPOINT).read, 6.0)
+        self.adaptive.observe(ENDPOINT, 0.01)
+        self.adaptive.observe(ENDPOINT, 0.01)
+        self.adaptive.observe(ENDPOINT, 0.01)
+        self.assertEqual(self.adaptive.read_timeout(ENDPOINT), 6.0)
+
+    def test_request_timeout_is_cut_short_by_the_deadline(self):
+        with deadline(2.0):
+            timeout = self.chatbot.request_timeout(ENDPOINT)
+        self.assertLessEqual(timeout.read, 2.0)
+        self.assertLessEqual(timeout.connect, 2.0)
+        with deadline(0), self.assertRaises(SmarterDeadlineExceededError):
+            self.chatbot.request_timeout(ENDPOINT)
+
+    def test_post_observes_latency(self):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json=chat_json()))
+        client = httpx.Client(transport=transport, timeout=http_timeout(60))
+        with mock.patch.object(ApiBase, "client", client):
+            self.chatbot.post(self.chatbot.base_url + "cli/chat/netec-demo/", data={})
+        self.assertEqual(len(self.adaptive._latencies[ENDPOINT]), 1)  # pylint: disable=protected-access
+
+    def test_post_timeout_past_the_deadline(self):
+        def handler(request):
+            time.sleep(0.03)
+            raise httpx.ReadTimeout("timed out", request=request)
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        with mock.patch.object(ApiBase, "client", client):
+            with deadline(0.02), self.assertRaises(SmarterDeadlineExceededError):
+                self.chatbot.post(self.chatbot.base_url + "cli/chat/netec-demo/", data={})
+            with self.assertRaises(httpx.ReadTimeout):
+                self.chatbot.post(self.chatbot.base_url + "cli/chat/netec-demo/", data={})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Test the fake Smarter platform server, and the client against it.
+"""
+
+import random
+import time
+import unittest
+
+import httpx
+
+from smarter import Smarter
+from smarter.api.client import RESOURCE_CACHE
+from smarter.common.exceptions import SmarterValueError
+from smarter.testing import FakeServer, FakeServerConfig, Latency
+
+from .fixtures import TEST_API_KEY
+
+
+class TestLatency(unittest.TestCase):
+    """Test the latency distributions."""
+
+    def test_parse(self):
+        self.assertEqual(Latency.parse("constant:0.05"), Latency("constant", 0.05))
+        self.assertEqual(Latency.parse("lognormal:0.2,0.5"), Latency("lognormal", 0.2, 0.5))
+        self.assertEqual(Latency.parse(str(Latency("uniform", 0.1, 0.2))), Latency("uniform", 0.1, 0.2))
+        with self.assertRaises(SmarterValueError):
+            Latency.parse("gamma:1")
+        with self.assertRaises(SmarterValueError):
+            Latency.parse("uniform:a,b")
+
+    def test_samples(self):
+        rng = random.Random(1)
+        self.assertEqual(Latency("constant", 0.05).sample(rng), 0.05)
+        uniform = [Latency("uniform", 0.1, 0.2).sample(rng) for _ in range(1000)]
+        self.assertTrue(all(0.1 <= value <= 0.2 for value in uniform))
+        lognormal = sorted(Latency("lognormal", 0.2, 0.5).sample(rng) for _ in range(1000))
+        self.assertAlmostEqual(lognormal[500], 0.2, delta=0.03)
+        self.assertTrue(all(Latency("normal", 0.0, 1.0).sample(rng) >= 0 for _ in range(100)))
+
+
+class TestFakeServer(unittest.TestCase):
+    """Test the endpoints and faults of an in-process FakeServer."""
+
+    def setUp(self):
+        RESOURCE_CACHE.clear()
+        self.addCleanup(RESOURCE_CACHE.clear)
+
+    def serve(self, **config) -> FakeServer:
+        server = FakeServer(FakeServerConfig(seed=1, **config)).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def client(self, server: FakeServer) -> Smarter:
+        return Smarter(api_key=TEST_API_KEY, base_url=server.url)
+
+    def post(self, server: FakeServer, path: str, headers: dict = None) -> httpx.Response:
+        headers = {"Authorization": f"Token {TEST_API_KEY}"} if headers is None else headers
+        return httpx.post(server.url + path, json={}, headers=headers)
+
+    def test_whoami_describe_and_chat(self):
+        server = self.serve()
+        client = self.client(server)
+        chatbot = client.resources.chatbots.get(name="faq-bot")
+        response = chatbot.prompt("What are your opening hours?", verbose=True)
+        self.assertEqual(client.model.data["user"]["username"], "admin")
+        self.assertEqual(chatbot.name, "faq-bot")
+        self.assertEqual(chatbot.chatbot_id, server.payloads.chatbot_id("faq-bot"))
+        body = response["data"]["response"]["data"]["body"]
+        self.assertEqual(body["metadata"]["input_text"], "What are your opening hours?")
+        self.assertEqual(body["usage"]["total_tokens"], body["usage"]["prompt_tokens"] + 24)
+        self.assertIsInstance(chatbot.prompt("hello"), str)
+        self.assertEqual(server.stats, {"whoami.ok": 1, "describe.ok": 1, "chat.ok": 2})
+
+    def test_unknown_chatbots_and_paths(self):
+        server = self.serve(chatbots=["faq-bot"])
+        self.assertEqual(self.post(server, "cli/describe/chatbot/?name=other-bot").status_code, 404)
+        self.assertEqual(self.post(server, "cli/chat/faq-bot/").status_code, 200)
+        self.assertEqual(self.post(server, "cli/unknown/").status_code, 404)
+        self.assertEqual(self.post(server, "cli/whoami/", headers={}).status_code, 401)
+
+    def test_throttled_with_retry_after(self):
+        server = self.serve(throttle_rate=1.0, retry_after=2.5)
+        response = self.post(server, "cli/whoami/")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "2.5")
+        with self.assertRaises(httpx.HTTPStatusError):
+            self.client(server)
+        self.assertEqual(server.stats["whoami.throttled"], 2)
+
+    def test_errors(self):
+        server = self.serve(error_rate=0.5)
+        statuses = [self.post(server, "cli/whoami/").status_code for _ in range(40)]
+        self.assertEqual(set(statuses), {200, 500})
+        self.assertEqual(server.stats["whoami.error"], statuses.count(500))
+
+    def test_connection_reset(self):
+        server = self.serve(reset_rate=1.0)
+        with self.assertRaises(httpx.TransportError):
+            self.post(server, "cli/whoami/")
+        self.assertEqual(server.stats["whoami.reset"], 1)
+
+    def test_latency_and_slow_bodies(self):
+        server = self.serve(whoami_latency=Latency("constant", 0.1), slow_body_rate=1.0, slow_body_seconds=0.2)
+        start = time.monotonic()
+        response = self.post(server, "cli/whoami/")
+        self.assertGreaterEqual(time.monotonic() - start, 0.28)
+        self.assertEqual(response.json()["data"]["user"]["username"], "admin")
+        self.assertEqual(server.stats["whoami.slow"], 1)
+
+
+class TestFakeServerProcess(unittest.TestCase):
+    """Test a FakeServer in subprocesses."""
+
+    def test_subprocesses_share_a_port(self):
+        config = FakeServerConfig(chatbots=["faq-bot"], chat_latency=Latency("constant", 0.01))
+        with FakeServer.subprocess(config, processes=2) as server:
+            client = Smarter(api_key=TEST_API_KEY, base_url=server.url)
+            chatbot = client.resources.chatbots.chatbot(name="faq-bot")
+            self.assertIsInstance(chatbot.prompt("hello"), str)
+        self.assertTrue(all(process.poll() is not None for process in server.processes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Test that client state is reset, and caches stay warm, in forked children.
+"""
+
+import json
+import os
+import threading
+import unittest
+from unittest import mock
+
+from smarter import Smarter
+from smarter.api.client import RESOURCE_CACHE
+from smarter.common import pool
+from smarter.common.classes import ApiBase
+from smarter.common.pool import get_http_client
+from smarter.resources.snapshot import ChatbotSnapshot
+from smarter.traffic import ConcurrencyLimiter, Hedger, RequestScheduler
+
+from .fixtures import TEST_API_KEY, chatbot_model, whoami_model
+
+
+def run_in_child(child) -> dict:
+    """Fork, run child() in the child process and return the dict that it returns."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover - runs in the child
+        os.close(read_fd)
+        try:
+            result = child()
+        except BaseException as e:  # pylint: disable=broad-exception-caught
+            result = {"error": repr(e)}
+        os.write(write_fd, json.dumps(result).encode())
+        os._exit(0)  # pylint: disable=protected-access
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data)
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "requires os.fork()")
+class TestFork(unittest.TestCase):
+    """Test fork safety."""
+
+    def setUp(self):
+        RESOURCE_CACHE.clear()
+        self.addCleanup(RESOURCE_CACHE.clear)
+
+    def test_http_clients_are_not_shared_with_the_parent(self):
+        parent = get_http_client(60)
+        client = Smarter(api_key=TEST_API_KEY, model=whoami_model())
+        self.assertIs(client.client, parent)
+
+        def child():
+            return {"same": client.client is parent, "clients": len(pool._clients)}  # pylint: disable=W0212
+
+        result = run_in_child(child)
+        self.assertEqual(result, {"same": False, "clients": 1})
+        self.assertIs(client.client, parent)
+
+    def test_locks_held_at_fork_are_reset(self):
+        scheduler = RequestScheduler(max_in_flight=1)
+        limiter = ConcurrencyLimiter(initial_limit=1)
+        hedger = Hedger(initial_delay=0.01)
+        self.addCleanup(hedger.shutdown)
+        hedger.call("cli/whoami/", lambda: None)
+        scheduler.acquire("netec-demo")
+        limiter.acquire()
+
+        def child():
+            # a lock that no thread of the child can ever release would deadlock here.
+            get_http_client(60)
+            scheduler.acquire("netec-demo")
+            return {
+                "scheduler": scheduler.stats()["in_flight"],
+                "limiter": limiter.acquire(timeout=0),
+                "hedger": hedger.call("cli/whoami/", lambda: "child"),
+            }
+
+        holder = threading.Thread(target=lambda: pool._lock.acquire(timeout=1), daemon=True)  # pylint: disable=W0212
+        holder.start()
+        holder.join()
+        try:
+            result = run_in_child(child)
+        finally:
+            pool._lock.release()  # pylint: disable=protected-access
+        self.assertEqual(result, {"scheduler": 1, "limiter": True, "hedger": "child"})
+        self.assertEqual(scheduler.stats()["in_flight"], 1)
+
+    def test_manifest_cache_stays_warm(self):
+        client = Smarter(api_key=TEST_API_KEY, model=whoami_model())
+        chatbots = client.resources.chatbots
+        chatbots.save_to_cache(chatbots.cache_key("netec-demo"), ChatbotSnapshot.from_model(chatbot_model()))
+
+        def child():
+            with mock.patch.object(ApiBase, "post", side_effect=AssertionError("re-fetched")):
+                chatbot = chatbots.get(name="netec-demo")
+                return {"chatbot_id": chatbot.chatbot_id, "url": chatbot.url_chatbot.geturl()}
+
+        result = run_in_child(child)
+        self.assertEqual(result["chatbot_id"], 36)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+Test bulk Chatbots.get_many().
+"""
+
+import unittest
+from unittest import mock
+
+import httpx
+
+from smarter import Smarter
+from smarter.api.client import RESOURCE_CACHE
+from smarter.common.classes import ApiBase
+
+from .fixtures import TEST_API_KEY, FakeApi, whoami_model
+
+
+class TestChatbotsGetMany(unittest.TestCase):
+    """Test Chatbots.get_many()."""
+
+    def setUp(self):
+        RESOURCE_CACHE.clear()
+        self.chatbots = Smarter(api_key=TEST_API_KEY, model=whoami_model()).resources.chatbots
+        self.api = FakeApi([], delay=0.05, missing=("chatbot-404",))
+        patcher = mock.patch.object(ApiBase, "post", side_effect=self.api.post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(RESOURCE_CACHE.clear)
+
+    def test_concurrent_fetch(self):
+        names = [f"chatbot-{i}" for i in range(16)]
+        result = self.chatbots.get_many(names, max_concurrency=8)
+        self.assertTrue(result.ok)
+        self.assertEqual(list(result.chatbots), names)
+        self.assertEqual(result.chatbots["chatbot-15"].chatbot_id, 115)
+        self.assertGreater(self.api.max_in_flight, 1)
+        self.assertLessEqual(self.api.max_in_flight, 8)
+
+    def test_cache_hits_and_duplicates(self):
+        self.chatbots.get(name="chatbot-1")
+        result = self.chatbots.get_many(["chatbot-1", "chatbot-2", "chatbot-2", "chatbot-1"])
+        self.assertEqual(list(result.chatbots), ["chatbot-1", "chatbot-2"])
+        self.assertEqual(len(self.api.describe_requests()), 2)
+
+    def test_errors_are_collected(self):
+        result = self.chatbots.get_many(["chatbot-1", "chatbot-404", "chatbot-3"])
+        self.assertFalse(result.ok)
+        self.assertEqual(list(result.chatbots), ["chatbot-1", "chatbot-3"])
+        self.assertIsInstance(result.errors["chatbot-404"], httpx.HTTPStatusError)
+        self.assertNotIn(self.chatbots.cache_key("chatbot-404"), RESOURCE_CACHE)
+
+
+if __name__ == "__main__":
+    unittest.main()
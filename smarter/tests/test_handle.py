@@ -0,0 +1,101 @@
+"""
+Test picklable chatbot handles and Chatbot.prompt_many().
+"""
+
+import dataclasses
+import os
+import pickle
+import unittest
+from unittest import mock
+
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterConfigurationError
+from smarter.resources import Chatbot
+from smarter.resources import handle as handles
+from smarter.resources.snapshot import ChatbotSnapshot
+
+from .fixtures import TEST_API_KEY, chat_json, chatbot_model, json_response
+
+
+def post(url, data=None, headers=None, api_key=None):  # pylint: disable=unused-argument
+    return json_response(chat_json())
+
+
+def word_count(response: str) -> tuple:
+    """A picklable post-processing function that reports the worker that ran it."""
+    return os.getpid(), len(response.split())
+
+
+class TestChatbotHandle(unittest.TestCase):
+    """Test ChatbotHandle."""
+
+    def setUp(self):
+        self.chatbot = Chatbot(api_key=TEST_API_KEY, snapshot=ChatbotSnapshot.from_model(chatbot_model()))
+        self.addCleanup(handles._chatbots.clear)  # pylint: disable=protected-access
+        self.addCleanup(handles._credentials.clear)  # pylint: disable=protected-access
+
+    def test_pickle_round_trip_without_the_api_key(self):
+        handle = self.chatbot.handle(credential="NETEC_API_KEY")
+        data = pickle.dumps(handle)
+        self.assertNotIn(TEST_API_KEY.encode(), data)
+        self.assertEqual(pickle.loads(data), handle)
+        self.assertEqual(handle.name, "netec-demo")
+        self.assertEqual(handle.chatbot_id, 36)
+
+    def test_chatbot_is_rebuilt_once_per_process(self):
+        handle = pickle.loads(pickle.dumps(self.chatbot.handle(credential="NETEC_API_KEY")))
+        handles.register_credential("NETEC_API_KEY", TEST_API_KEY)
+        with mock.patch.object(ApiBase, "post", side_effect=AssertionError("described")):
+            chatbot = handle.chatbot()
+        self.assertIs(handle.chatbot(), chatbot)
+        self.assertIsNot(chatbot, self.chatbot)
+        self.assertEqual(chatbot.api_key, TEST_API_KEY)
+        self.assertEqual(chatbot.url_chatbot, self.chatbot.url_chatbot)
+
+    def test_unresolved_credential(self):
+        handle = self.chatbot.handle(credential="UNSET_SMARTER_API_KEY")
+        with self.assertRaises(SmarterConfigurationError):
+            handle.chatbot()
+
+    def test_credential_from_the_environment(self):
+        handle = self.chatbot.handle(credential="NETEC_API_KEY")
+        with mock.patch.dict(os.environ, {"NETEC_API_KEY": TEST_API_KEY}):
+            self.assertEqual(handle.chatbot().api_key, TEST_API_KEY)
+
+    def test_other_environment(self):
+        handle = dataclasses.replace(self.chatbot.handle(), environment="other")
+        with self.assertRaises(SmarterConfigurationError):
+            handle.chatbot()
+
+
+class TestPromptMany(unittest.TestCase):
+    """Test Chatbot.prompt_many() over threads and processes."""
+
+    def setUp(self):
+        self.chatbot = Chatbot(api_key=TEST_API_KEY, snapshot=ChatbotSnapshot.from_model(chatbot_model()))
+        self.addCleanup(handles._chatbots.clear)  # pylint: disable=protected-access
+        self.addCleanup(handles._credentials.clear)  # pylint: disable=protected-access
+
+    def test_threads(self):
+        with mock.patch.object(ApiBase, "post", side_effect=post) as mock_post:
+            responses = self.chatbot.prompt_many(["hello"] * 5, max_workers=3)
+        self.assertEqual(len(responses), 5)
+        self.assertEqual(len(set(responses)), 1)
+        self.assertEqual(mock_post.call_count, 5)
+        self.assertEqual(self.chatbot.prompt_many([]), [])
+
+    @unittest.skipUnless(hasattr(os, "fork"), "the patched post is inherited by forked workers")
+    def test_processes(self):
+        expected = self.chatbot_response()
+        with mock.patch.object(ApiBase, "post", side_effect=post):
+            results = self.chatbot.prompt_many(["hello"] * 6, max_workers=2, processes=True, postprocess=word_count)
+        self.assertEqual([count for _, count in results], [len(expected.split())] * 6)
+        self.assertNotIn(os.getpid(), {pid for pid, _ in results})
+
+    def chatbot_response(self) -> str:
+        with mock.patch.object(ApiBase, "post", side_effect=post):
+            return self.chatbot.prompt("hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
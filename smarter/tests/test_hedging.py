@@ -0,0 +1,131 @@
+"""
+Test request hedging.
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from smarter import Chatbot, Smarter
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterValueError
+from smarter.traffic import Hedger
+from smarter.traffic.hedging import percentile
+
+from .fixtures import TEST_API_KEY, chatbot_json, json_response, whoami_json
+
+
+ENDPOINT = "/api/v1/cli/whoami/"
+
+
+class TestHedger(unittest.TestCase):
+    """Test the Hedger delay, budget and first-response-wins behavior."""
+
+    def setUp(self):
+        self.hedger = Hedger(initial_delay=0.02, min_samples=5, budget=0.0, burst=1)
+
+    def tearDown(self):
+        self.hedger.shutdown()
+
+    def test_percentile(self):
+        self.assertEqual(percentile(range(1, 101), 0.95), 95)
+        self.assertEqual(percentile([3.0], 0.95), 3.0)
+        with self.assertRaises(SmarterValueError):
+            Hedger(quantile=1.5)
+
+    def test_fast_call_is_not_hedged(self):
+        self.assertEqual(self.hedger.call(ENDPOINT, lambda: "fast"), "fast")
+        stats = self.hedger.stats()
+        self.assertEqual((stats["requests"], stats["hedges"]), (1, 0))
+
+    def test_slow_call_is_hedged_and_the_first_response_wins(self):
+        calls = []
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                calls.append(len(calls))
+                attempt = calls[-1]
+            time.sleep(1.0 if attempt == 0 else 0.01)
+            return attempt
+
+        start = time.monotonic()
+        self.assertEqual(self.hedger.call(ENDPOINT, call), 1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        stats = self.hedger.stats()
+        self.assertEqual((stats["hedges"], stats["hedge_wins"]), (1, 1))
+
+    def test_queue_wait_does_not_count_toward_the_delay(self):
+        hedger = Hedger(initial_delay=0.05, budget=0.0, burst=1, max_workers=1)
+        self.addCleanup(hedger.shutdown)
+        # every worker is busy for longer than the hedge delay.
+        hedger.executor.submit(time.sleep, 0.2)
+        self.assertEqual(hedger.call(ENDPOINT, lambda: "fast"), "fast")
+        self.assertEqual(hedger.stats()["hedges"], 0)
+
+    def test_budget_caps_hedges(self):
+        def slow():
+            time.sleep(0.05)
+            return "slow"
+
+        for _ in range(3):
+            self.hedger.call(ENDPOINT, slow)
+        stats = self.hedger.stats()
+        # budget=0 leaves only the burst of one hedge.
+        self.assertEqual(stats["hedges"], 1)
+        self.assertEqual(stats["over_budget"], 2)
+
+    def test_failed_hedge_falls_back_to_the_primary(self):
+        attempts = []
+
+        def call():
+            attempts.append(None)
+            if len(attempts) > 1:
+                raise ValueError("hedge failed")
+            time.sleep(0.05)
+            return "primary"
+
+        self.assertEqual(self.hedger.call(ENDPOINT, call), "primary")
+
+    def test_delay_adapts_to_observed_latency(self):
+        self.assertEqual(self.hedger.delay(ENDPOINT), 0.02)
+        for latency in [0.1, 0.1, 0.1, 0.1, 0.3]:
+            self.hedger.observe(ENDPOINT, latency)
+        self.assertEqual(self.hedger.delay(ENDPOINT), 0.3)
+        self.hedger.observe(ENDPOINT, 60.0)
+        self.assertEqual(self.hedger.delay(ENDPOINT), self.hedger.max_delay)
+        self.assertEqual(self.hedger.stats()["delays"][ENDPOINT], self.hedger.max_delay)
+
+
+class TestHedgedResources(unittest.TestCase):
+    """Test that whoami and describe requests are hedged."""
+
+    def test_whoami_and_describe_are_hedged(self):
+        hedger = Hedger(initial_delay=0.02, budget=1.0)
+        calls = {"whoami": 0, "describe": 0}
+        lock = threading.Lock()
+
+        def post(url, data=None, headers=None, api_key=None):  # pylint: disable=unused-argument
+            name = "whoami" if "whoami" in url else "describe"
+            with lock:
+                calls[name] += 1
+                attempt = calls[name]
+            if attempt == 1:
+                time.sleep(0.5)
+            return json_response(whoami_json() if name == "whoami" else chatbot_json())
+
+        try:
+            with mock.patch.object(ApiBase, "post", side_effect=post):
+                client = Smarter(api_key=TEST_API_KEY, hedger=hedger)
+                chatbot = client.resources.chatbots.chatbot(name="netec-demo")
+                self.assertIs(chatbot.hedger, hedger)
+                self.assertEqual(chatbot.model.data.metadata.name, "netec-demo")
+                self.assertIsInstance(Chatbot(name="netec-demo", api_key=TEST_API_KEY, hedger=hedger).hedger, Hedger)
+        finally:
+            hedger.shutdown()
+        self.assertGreaterEqual(hedger.stats()["hedge_wins"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Test the multi api key pool.
+"""
+
+import unittest
+from unittest import mock
+
+import httpx
+
+from smarter import Chatbot, Smarter
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterValueError
+from smarter.traffic import ApiKeyPool
+from smarter.traffic.keys import LEAST_LOADED
+
+from .fixtures import chat_json, chatbot_model, json_response, whoami_model
+
+
+KEYS = ["key-aaaa", "key-bbbb", "key-cccc"]
+
+
+def throttled(retry_after: str = None) -> httpx.Response:
+    headers = {"Retry-After": retry_after} if retry_after else {}
+    return httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://platform.smarter.sh/"))
+
+
+class TestApiKeyPool(unittest.TestCase):
+    """Test ApiKeyPool selection, cooldown and metrics."""
+
+    def setUp(self):
+        self.now = 0.0
+
+    def pool(self, **kwargs) -> ApiKeyPool:
+        return ApiKeyPool(KEYS, clock=lambda: self.now, sleep=self.sleep, **kwargs)
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+    def test_requires_keys(self):
+        with self.assertRaises(SmarterValueError):
+            ApiKeyPool([])
+        with self.assertRaises(SmarterValueError):
+            ApiKeyPool(KEYS, strategy="random")
+
+    def test_round_robin(self):
+        pool = self.pool()
+        selected = []
+        for _ in range(6):
+            with pool.use() as key:
+                selected.append(key)
+        self.assertEqual(selected, KEYS + KEYS)
+
+    def test_least_loaded(self):
+        pool = self.pool(strategy=LEAST_LOADED)
+        first, second = pool.select(), pool.select()
+        self.assertEqual([first, second], KEYS[:2])
+        pool.release(first)
+        # the first key is idle again, and the third key was never used.
+        self.assertIn(pool.select(), [KEYS[0], KEYS[2]])
+        self.assertEqual(sum(stats["in_flight"] for stats in pool.stats().values()), 2)
+
+    def test_cooldown(self):
+        pool = self.pool(cooldown=30)
+        key = pool.select()
+        error = httpx.HTTPStatusError("throttled", request=throttled().request, response=throttled("5"))
+        pool.release(key, error=error)
+        self.assertNotIn(key, [pool.select() for _ in range(4)])
+        self.assertEqual(pool.stats()["0:...aaaa"]["throttled"], 1)
+        self.assertEqual(pool.stats()["0:...aaaa"]["cooldown_remaining"], 5)
+        self.now += 5
+        self.assertIn(key, [pool.select() for _ in range(3)])
+
+    def test_waits_when_every_key_is_cooling_down(self):
+        pool = self.pool(cooldown=10)
+        for _ in KEYS:
+            key = pool.select()
+            pool.release(key, error=httpx.HTTPStatusError("", request=throttled().request, response=throttled()))
+        pool.select()
+        self.assertEqual(self.now, 10)
+
+    def test_chatbot_retries_throttled_prompts_with_another_key(self):
+        pool = self.pool()
+        keys = []
+
+        def post(url, data=None, headers=None, api_key=None):  # pylint: disable=unused-argument
+            keys.append(api_key)
+            if api_key == KEYS[0]:
+                response = throttled()
+                response.raise_for_status()
+            return json_response(chat_json())
+
+        with mock.patch.object(ApiBase, "post", side_effect=post):
+            client = Smarter(key_pool=pool, model=whoami_model())
+            chatbot = client.resources.chatbots.chatbot(name="netec-demo", model=chatbot_model())
+            self.assertEqual(chatbot.api_key, KEYS[0])
+            chatbot.prompt("Hello")
+            chatbot.prompt("Hello")
+        self.assertEqual(keys, [KEYS[0], KEYS[1], KEYS[2]])
+        stats = pool.stats()
+        self.assertEqual([stats[name]["requests"] for name in stats], [1, 1, 1])
+        self.assertEqual(stats["0:...aaaa"]["errors"], 1)
+
+    def test_chatbot_gives_up_when_every_key_is_throttled(self):
+        chatbot = Chatbot(name="netec-demo", model=chatbot_model(), key_pool=self.pool())
+        with mock.patch.object(
+            ApiBase, "post", side_effect=httpx.HTTPStatusError("", request=None, response=throttled())
+        ):
+            with self.assertRaises(httpx.HTTPStatusError):
+                chatbot.prompt("Hello")
+        self.assertEqual(sum(stats["throttled"] for stats in chatbot.key_pool.stats().values()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Test the auto-paginating Chatbots.list() iterator.
+"""
+
+import unittest
+from unittest import mock
+
+from smarter import Smarter
+from smarter.api.client import RESOURCE_CACHE
+from smarter.common.classes import ApiBase
+
+from .fixtures import TEST_API_KEY, FakeApi, whoami_model
+
+
+FLEET = [f"chatbot-{i}" for i in range(7)]
+
+
+class TestChatbotsList(unittest.TestCase):
+    """Test Chatbots.list()."""
+
+    def setUp(self):
+        RESOURCE_CACHE.clear()
+        self.client = Smarter(api_key=TEST_API_KEY, model=whoami_model())
+        self.api = FakeApi(FLEET)
+        patcher = mock.patch.object(ApiBase, "post", side_effect=self.api.post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(RESOURCE_CACHE.clear)
+
+    def test_list_all_pages(self):
+        for prefetch in [True, False]:
+            chatbots = list(self.client.resources.chatbots.list(page_size=3, prefetch=prefetch))
+            self.assertEqual([chatbot.name for chatbot in chatbots], FLEET)
+        self.assertEqual(chatbots[6].chatbot_id, 106)
+        # 3 pages for each of the two iterations, and each chatbot is described only once.
+        self.assertEqual(len(self.api.list_requests()), 6)
+        self.assertEqual(len(self.api.describe_requests()), len(FLEET))
+        self.assertIn(self.client.resources.chatbots.cache_key("chatbot-6"), RESOURCE_CACHE)
+
+    def test_list_is_lazy(self):
+        iterator = self.client.resources.chatbots.list(page_size=3, prefetch=False)
+        self.assertEqual(next(iterator).name, "chatbot-0")
+        self.assertEqual(len(self.api.list_requests()), 1)
+        iterator.close()
+
+    def test_exact_multiple_of_page_size(self):
+        self.api.names = FLEET[:6]
+        chatbots = list(self.client.resources.chatbots.list(page_size=3))
+        self.assertEqual(len(chatbots), 6)
+        self.assertEqual(len(self.api.list_requests()), 3)
+
+    def test_server_ignores_page_parameters(self):
+        self.api.paginated = False
+        chatbots = list(self.client.resources.chatbots.list(page_size=3))
+        self.assertEqual([chatbot.name for chatbot in chatbots], FLEET)
+        self.assertEqual(len(self.api.list_requests()), 2)
+
+    def test_failed_chatbots_are_skipped(self):
+        self.api.missing = ("chatbot-1", "chatbot-4")
+        errors = {}
+        chatbots = list(self.client.resources.chatbots.list(page_size=3, errors=errors))
+        self.assertEqual(
+            [chatbot.name for chatbot in chatbots], [name for name in FLEET if name not in self.api.missing]
+        )
+        self.assertEqual(sorted(errors), ["chatbot-1", "chatbot-4"])
+        self.assertEqual(len(self.api.list_requests()), 3)
+
+    def test_list_page_uses_the_client_options(self):
+        client = Smarter(api_key=TEST_API_KEY, model=whoami_model(), base_url="http://localhost:8000/api/v1/")
+        client.resources.chatbots.list_page(page_size=3)
+        self.assertTrue(self.api.list_requests()[0].startswith("http://localhost:8000/api/v1/cli/get/chatbot/"))
+
+    def test_next_page_is_described_in_background(self):
+        iterator = self.client.resources.chatbots.list(page_size=3)
+        self.assertEqual(next(iterator).name, "chatbot-0")
+        iterator.close()
+        # the first page was described before it was yielded.
+        self.assertGreaterEqual(len(self.api.describe_requests()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
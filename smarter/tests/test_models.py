@@ -0,0 +1,51 @@
+"""
+Test the api response models and their read-only mapping views.
+"""
+
+import unittest
+from collections.abc import Mapping
+
+from smarter import Chatbot
+from smarter.common.models.base import ModelView
+
+from .fixtures import TEST_API_KEY, chatbot_model, whoami_model
+
+
+class TestModels(unittest.TestCase):
+    """Test the memoized typed views of the api response models."""
+
+    def test_whoami_submodels_are_cached(self):
+        whoami = whoami_model()
+        self.assertIs(whoami.user, whoami.user)
+        self.assertIs(whoami.account, whoami.account)
+        self.assertEqual(whoami.user.email, "admin@smarter.sh")
+        self.assertEqual(whoami.account.account_number, "3141-5926-5359")
+        self.assertEqual(whoami.model_dump()["data"]["user"]["username"], "admin")
+
+    def test_model_view(self):
+        model = chatbot_model()
+        view = ModelView(model.data)
+        self.assertIsInstance(view, Mapping)
+        self.assertEqual(view["metadata"]["name"], "netec-demo")
+        self.assertIs(view["spec"], view["spec"])
+        self.assertEqual(view["spec"]["plugins"], ())
+        self.assertEqual(set(view), set(type(model.data).model_fields))
+        self.assertEqual(view.to_dict(), model.data.model_dump())
+        with self.assertRaises(KeyError):
+            view["not_a_field"]  # pylint: disable=pointless-statement
+        with self.assertRaises(TypeError):
+            view["kind"] = "Plugin"  # pylint: disable=unsupported-assignment-operation
+
+    def test_chatbot_views(self):
+        chatbot = Chatbot(api_key=TEST_API_KEY, name="netec-demo", model=chatbot_model())
+        self.assertIsInstance(chatbot.config, Mapping)
+        self.assertEqual(chatbot.config["provider"], "openai")
+        self.assertEqual(chatbot.config["defaultModel"], "gpt-4o")
+        self.assertEqual(chatbot.chatbot_metadata["name"], "netec-demo")
+        self.assertIs(chatbot.status["deployed"], True)
+        self.assertEqual(dict(chatbot.config), chatbot.model.data.spec.config.model_dump())
+        self.assertIn("key", chatbot.metadata)
+
+
+if __name__ == "__main__":
+    unittest.main()
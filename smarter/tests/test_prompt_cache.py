@@ -0,0 +1,118 @@
+"""
+Test the client-side prompt response cache.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from smarter import Chatbot
+from smarter.cache import PromptCache
+from smarter.common.classes import ApiBase
+from smarter.resources.models.chatbot import ChatbotModel
+
+from .fixtures import TEST_API_KEY, chat_json, chatbot_json, json_response
+
+
+def deterministic_chatbot(prompt_cache: PromptCache, version: str = "1.0.0", temperature: float = 0.0) -> Chatbot:
+    data = chatbot_json()
+    data["data"]["metadata"]["version"] = version
+    data["data"]["spec"]["config"]["defaultTemperature"] = temperature
+    return Chatbot(api_key=TEST_API_KEY, name="netec-demo", model=ChatbotModel(**data), prompt_cache=prompt_cache)
+
+
+class TestPromptCache(unittest.TestCase):
+    """Test PromptCache and its use by Chatbot.prompt()."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        patcher = mock.patch.object(ApiBase, "post", side_effect=lambda *args, **kwargs: json_response(chat_json()))
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeat_prompts_are_cached(self):
+        cache = PromptCache()
+        chatbot = deterministic_chatbot(cache)
+        first = chatbot.prompt("Hello, World!")
+        second = chatbot.prompt("Hello, World!")
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith("JSON object provided is invalid"))
+        self.assertEqual(self.post.call_count, 1)
+        chatbot.prompt("Hello, World?")
+        self.assertEqual(self.post.call_count, 2)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_verbose_responses_are_copies(self):
+        chatbot = deterministic_chatbot(PromptCache())
+        chatbot.prompt("Hello", verbose=True)["api"] = "changed"
+        self.assertEqual(chatbot.prompt("Hello", verbose=True)["api"], "smarter.sh/v1")
+        self.assertEqual(self.post.call_count, 1)
+
+    def test_disk_tier_responses_are_copies(self):
+        deterministic_chatbot(PromptCache(directory=self.tmpdir.name)).prompt("Hello", verbose=True)
+        chatbot = deterministic_chatbot(PromptCache(directory=self.tmpdir.name))
+        chatbot.prompt("Hello", verbose=True)["api"] = "changed"
+        self.assertEqual(chatbot.prompt("Hello", verbose=True)["api"], "smarter.sh/v1")
+        self.assertEqual(self.post.call_count, 1)
+
+    def test_non_deterministic_chatbots_are_not_cached(self):
+        cache = PromptCache()
+        chatbot = deterministic_chatbot(cache, temperature=1.0)
+        chatbot.prompt("Hello")
+        chatbot.prompt("Hello")
+        self.assertEqual(self.post.call_count, 2)
+        self.assertEqual(cache.stats()["bypassed"], 2)
+        # unless the user declares the chatbot deterministic.
+        chatbot = deterministic_chatbot(PromptCache(chatbots=["netec-demo"]), temperature=1.0)
+        chatbot.prompt("Hello")
+        chatbot.prompt("Hello")
+        self.assertEqual(self.post.call_count, 3)
+
+    def test_manifest_version_invalidates(self):
+        cache = PromptCache()
+        deterministic_chatbot(cache, version="1.0.0").prompt("Hello")
+        deterministic_chatbot(cache, version="1.0.1").prompt("Hello")
+        self.assertEqual(self.post.call_count, 2)
+
+    def test_disk_tier(self):
+        deterministic_chatbot(PromptCache(directory=self.tmpdir.name)).prompt("Hello")
+        cache = PromptCache(directory=self.tmpdir.name)
+        deterministic_chatbot(cache).prompt("Hello")
+        self.assertEqual(self.post.call_count, 1)
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        cache.clear()
+        deterministic_chatbot(PromptCache(directory=self.tmpdir.name)).prompt("Hello")
+        self.assertEqual(self.post.call_count, 2)
+
+    def test_clear_only_removes_cache_entries(self):
+        settings_path = os.path.join(self.tmpdir.name, "settings.json")
+        with open(settings_path, "w", encoding="utf-8") as f:
+            f.write("{}")
+        cache = PromptCache(directory=self.tmpdir.name)
+        deterministic_chatbot(cache).prompt("Hello")
+        cache.clear()
+        self.assertTrue(os.path.exists(settings_path))
+        deterministic_chatbot(PromptCache(directory=self.tmpdir.name)).prompt("Hello")
+        self.assertEqual(self.post.call_count, 2)
+
+    def test_disk_ttl(self):
+        cache = PromptCache(directory=self.tmpdir.name, disk_ttl=1)
+        cache.set("abc", "response")
+        self.assertEqual(PromptCache(directory=self.tmpdir.name).get("abc"), "response")
+        with mock.patch("smarter.cache.prompt.time.time", return_value=10**10):
+            self.assertIsNone(PromptCache(directory=self.tmpdir.name).get("abc"))
+
+    def test_failed_disk_writes_leave_no_temporary_files(self):
+        cache = PromptCache(directory=self.tmpdir.name)
+        cache.set("unserializable", object())
+        with mock.patch("smarter.cache.prompt.os.replace", side_effect=OSError("read-only file system")):
+            cache.set("abc", "response")
+        files = [name for _, _, names in os.walk(self.tmpdir.name) for name in names]
+        self.assertEqual(files, [])
+        self.assertEqual(cache.get("abc"), "response")
+
+
+if __name__ == "__main__":
+    unittest.main()
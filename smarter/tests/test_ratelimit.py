@@ -0,0 +1,143 @@
+"""
+Test the client-side token-bucket rate limiter.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from smarter import Chatbot
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterRateLimitError, SmarterValueError
+from smarter.resources.models.prompt import PromptResponseModel
+from smarter.traffic import RateLimiter
+
+from .fixtures import TEST_API_KEY, chat_json, chatbot_model, json_response
+
+
+class FakeClock:
+    """A clock that only advances when something sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.lock = threading.Lock()
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        with self.lock:
+            self.now += seconds
+
+
+def usage():
+    return PromptResponseModel(**chat_json()).data.response.data.body.usage
+
+
+def acquire_in_process(path: str, results) -> None:
+    limiter = RateLimiter(requests_per_minute=60, burst_seconds=2, path=path, sleep=lambda seconds: None)
+    for _ in range(2):
+        try:
+            limiter.acquire(tokens=1, timeout=0)
+            results.put(True)
+        except SmarterRateLimitError:
+            results.put(False)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test RateLimiter."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def limiter(self, **kwargs) -> RateLimiter:
+        return RateLimiter(clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_requires_a_limit(self):
+        with self.assertRaises(SmarterValueError):
+            RateLimiter()
+
+    def test_requests_per_minute(self):
+        limiter = self.limiter(requests_per_minute=60, burst_seconds=5)
+        for _ in range(5):
+            limiter.acquire("hi")
+        self.assertEqual(self.clock.now, 1000.0)
+        for _ in range(10):
+            limiter.acquire("hi")
+        # after the burst, requests are admitted at one per second.
+        self.assertAlmostEqual(self.clock.now, 1010.0)
+        self.assertEqual(limiter.stats()["throttled"], 10)
+
+    def test_tokens_per_minute(self):
+        limiter = self.limiter(tokens_per_minute=600, burst_seconds=1)
+        self.assertEqual(limiter.acquire(tokens=10), 10)
+        limiter.acquire(tokens=10)
+        self.assertAlmostEqual(self.clock.now, 1001.0)
+
+    def test_estimate_and_settle(self):
+        limiter = self.limiter(tokens_per_minute=6000, completion_tokens=100)
+        message = "x" * 400
+        reserved = limiter.acquire(message)
+        self.assertEqual(reserved, 201)
+        self.assertAlmostEqual(limiter.levels()["tokens"], 6000 - 201)
+        limiter.settle(reserved, usage())
+        self.assertAlmostEqual(limiter.levels()["tokens"], 6000 - 571)
+        # the completion estimate moves toward the observed completion sizes.
+        self.assertLess(limiter.completion_tokens, 100)
+        # a failed request refunds its reservation.
+        limiter.settle(limiter.acquire(message), None)
+        self.assertAlmostEqual(limiter.levels()["tokens"], 6000 - 571)
+
+    def test_oversized_prompt_waits_for_a_full_bucket(self):
+        limiter = self.limiter(tokens_per_minute=60, burst_seconds=10)
+        limiter.acquire(tokens=100)
+        self.assertEqual(self.clock.now, 1000.0)
+        self.assertLess(limiter.levels()["tokens"], 0)
+
+    def test_timeout(self):
+        limiter = self.limiter(requests_per_minute=1, burst_seconds=1)
+        limiter.acquire("hi")
+        with self.assertRaises(SmarterRateLimitError):
+            limiter.acquire("hi", timeout=10)
+
+    def test_threads(self):
+        limiter = self.limiter(requests_per_minute=6000, burst_seconds=0.5)
+        threads = [threading.Thread(target=lambda: [limiter.acquire(tokens=1) for _ in range(25)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(limiter.stats()["acquired"], 200)
+        # 50 requests of burst, then 150 more at 100 per second.
+        self.assertAlmostEqual(self.clock.now, 1001.5, delta=0.05)
+
+    def test_shared_between_processes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "ratelimit")
+            results = multiprocessing.get_context("fork").Queue()
+            processes = [
+                multiprocessing.get_context("fork").Process(target=acquire_in_process, args=(path, results))
+                for _ in range(2)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            admitted = [results.get(timeout=5) for _ in range(4)]
+        # the two processes share a bucket of two requests.
+        self.assertEqual(admitted.count(True), 2)
+
+    def test_chatbot_prompt(self):
+        limiter = self.limiter(requests_per_minute=60, tokens_per_minute=60000)
+        chatbot = Chatbot(api_key=TEST_API_KEY, name="netec-demo", model=chatbot_model(), rate_limiter=limiter)
+        with mock.patch.object(ApiBase, "post", return_value=json_response(chat_json())):
+            chatbot.prompt("Hello, World!")
+        self.assertEqual(limiter.stats()["actual_tokens"], 571)
+        self.assertAlmostEqual(limiter.levels()["tokens"], 60000 - 571)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Test the priority-aware request scheduler.
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from smarter import Chatbot
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterQueueTimeoutError
+from smarter.traffic import ConcurrencyLimiter, Priority, RequestScheduler, scheduling
+from smarter.traffic.scheduler import SchedulingContext, current_scheduling
+
+from .fixtures import TEST_API_KEY, chat_json, chatbot_model, json_response
+
+
+def wait_until(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+
+class TestRequestScheduler(unittest.TestCase):
+    """Test RequestScheduler admission order."""
+
+    def setUp(self):
+        self.order = []
+        self.threads = []
+
+    def tearDown(self):
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+    def enqueue(self, scheduler: RequestScheduler, tag: str, chatbot: str = "bot", **context) -> None:
+        """Queue a request in a thread, and wait until it is queued."""
+        queued = sum(stats for stats in scheduler.stats()["queued"].values())
+
+        def run():
+            scheduler.acquire(chatbot, SchedulingContext(**context))
+            self.order.append(tag)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        wait_until(lambda: sum(scheduler.stats()["queued"].values()) > queued or tag in self.order)
+
+    def release(self, scheduler: RequestScheduler, chatbot: str = "bot") -> None:
+        admitted = len(self.order)
+        scheduler.release(chatbot)
+        wait_until(lambda: len(self.order) > admitted)
+
+    def test_interactive_preempts_queued_batch(self):
+        scheduler = RequestScheduler(max_in_flight=1)
+        self.enqueue(scheduler, "running", priority=Priority.BATCH)
+        self.enqueue(scheduler, "batch", priority=Priority.BATCH)
+        self.enqueue(scheduler, "default")
+        self.enqueue(scheduler, "interactive", priority=Priority.INTERACTIVE)
+        self.release(scheduler)
+        self.release(scheduler)
+        self.release(scheduler)
+        self.assertEqual(self.order, ["running", "interactive", "default", "batch"])
+
+    def test_reserved_slots(self):
+        scheduler = RequestScheduler(max_in_flight=3, reserved=1)
+        for i in range(3):
+            self.enqueue(scheduler, f"batch-{i}", priority=Priority.BATCH)
+        self.assertEqual(self.order, ["batch-0", "batch-1"])
+        self.enqueue(scheduler, "interactive", priority=Priority.INTERACTIVE)
+        self.assertEqual(self.order[-1], "interactive")
+        self.assertEqual(scheduler.stats()["queued"]["batch"], 1)
+        # batch requests are only admitted while a slot remains free for interactive requests.
+        scheduler.release("bot")
+        self.assertEqual(scheduler.stats()["queued"]["batch"], 1)
+        self.release(scheduler)
+        self.assertEqual(self.order[-1], "batch-2")
+
+    def test_fair_queuing_between_tenants(self):
+        scheduler = RequestScheduler(max_in_flight=1)
+        self.enqueue(scheduler, "running")
+        for i in range(3):
+            self.enqueue(scheduler, f"a-{i}", tenant="a")
+        self.enqueue(scheduler, "b-0", tenant="b")
+        for _ in range(4):
+            self.release(scheduler)
+        self.assertEqual(self.order, ["running", "a-0", "b-0", "a-1", "a-2"])
+
+    def test_bulkheads(self):
+        scheduler = RequestScheduler(max_in_flight=4, bulkheads={"slow": 1})
+        self.enqueue(scheduler, "slow-0", chatbot="slow")
+        self.enqueue(scheduler, "slow-1", chatbot="slow")
+        self.enqueue(scheduler, "fast", chatbot="fast")
+        self.assertEqual(self.order, ["slow-0", "fast"])
+        self.assertEqual(scheduler.stats()["chatbots_in_flight"], {"slow": 1, "fast": 1})
+        self.release(scheduler, chatbot="slow")
+        self.assertEqual(self.order[-1], "slow-1")
+
+    def test_queue_deadline_shedding(self):
+        scheduler = RequestScheduler(max_in_flight=1, max_wait={Priority.BATCH: 0.01})
+        scheduler.acquire("bot")
+        with scheduling(priority=Priority.BATCH):
+            with self.assertRaises(SmarterQueueTimeoutError):
+                scheduler.acquire("bot")
+        self.assertEqual(scheduler.stats()["shed"]["batch"], 1)
+        self.assertEqual(scheduler.stats()["queued"]["batch"], 0)
+
+    def test_limiter_capacity(self):
+        limiter = ConcurrencyLimiter(initial_limit=2)
+        scheduler = RequestScheduler(limiter=limiter, reserved=0)
+        self.assertEqual(scheduler.capacity, 2)
+        with self.assertRaises(RuntimeError):
+            with scheduler.slot("bot"):
+                raise RuntimeError("not an overload")
+        self.assertEqual(scheduler.stats()["in_flight"], 0)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_limiter_grows_under_load(self):
+        limiter = ConcurrencyLimiter(initial_limit=2, max_limit=16)
+        scheduler = RequestScheduler(limiter=limiter, reserved=0)
+
+        def run():
+            for _ in range(50):
+                with scheduler.slot("bot"):
+                    time.sleep(0.01)
+
+        threads = [threading.Thread(target=run, daemon=True) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        self.assertGreater(limiter.increases, 0)
+        self.assertGreater(limiter.limit, 2)
+        self.assertGreater(limiter.max_in_flight, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_scheduling_context(self):
+        self.assertEqual(current_scheduling().priority, Priority.DEFAULT)
+        with scheduling(priority=Priority.BATCH, tenant="nightly"):
+            with scheduling(max_wait=5):
+                context = current_scheduling()
+        self.assertEqual((context.priority, context.tenant, context.max_wait), (Priority.BATCH, "nightly", 5))
+        self.assertEqual(current_scheduling().tenant, "default")
+
+    def test_chatbot_prompt(self):
+        scheduler = RequestScheduler(max_in_flight=2)
+        chatbot = Chatbot(api_key=TEST_API_KEY, name="netec-demo", model=chatbot_model(), scheduler=scheduler)
+        with mock.patch.object(ApiBase, "post", return_value=json_response(chat_json())):
+            with scheduling(priority=Priority.BATCH):
+                chatbot.prompt("Hello")
+        stats = scheduler.stats()
+        self.assertEqual(stats["admitted"]["batch"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+"""
+Test the host-local shared manifest cache.
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from smarter import Smarter
+from smarter.api.client import RESOURCE_CACHE
+from smarter.cache import SharedManifestCache
+from smarter.common.classes import ApiBase
+from smarter.resources.snapshot import ChatbotSnapshot
+
+from .fixtures import TEST_API_KEY, FakeApi, chatbot_model, whoami_model
+
+
+def snapshot(name: str = "netec-demo", chatbot_id: int = 36) -> ChatbotSnapshot:
+    return ChatbotSnapshot.from_model(chatbot_model(name=name, chatbot_id=chatbot_id))
+
+
+def refresh_in_process(path: str, fetches: str, results) -> None:
+    cache = SharedManifestCache(path, poll=0.01)
+
+    def fetch() -> ChatbotSnapshot:
+        with open(fetches, "a", encoding="utf-8") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(0.3)
+        return snapshot()
+
+    results.put(cache.refresh("Chatbot_netec-demo", fetch).chatbot_id)
+
+
+class TestSharedManifestCache(unittest.TestCase):
+    """Test SharedManifestCache entries, ttls and refresh leases."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "manifests.db")
+        self.now = 1000.0
+        self.cache = SharedManifestCache(self.path, ttl=60, clock=lambda: self.now, sleep=self.sleep)
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.get("Chatbot_netec-demo"))
+        self.cache.set("Chatbot_netec-demo", snapshot())
+        cached = self.cache.get("Chatbot_netec-demo")
+        self.assertEqual(cached, snapshot())
+        self.assertEqual(dict(cached.config), dict(snapshot().config))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_entries_are_shared_between_connections(self):
+        other = SharedManifestCache(self.path, clock=lambda: self.now)
+        self.cache.set("Chatbot_netec-demo", snapshot())
+        self.assertEqual(other.get("Chatbot_netec-demo"), snapshot())
+        other.delete("Chatbot_netec-demo")
+        self.assertIsNone(self.cache.get("Chatbot_netec-demo"))
+
+    def test_ttl(self):
+        self.cache.set("Chatbot_netec-demo", snapshot())
+        self.assertEqual(len(self.cache), 1)
+        self.now += 61
+        self.assertIsNone(self.cache.get("Chatbot_netec-demo"))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.purge(), 1)
+
+    def test_one_lease_holder_per_key(self):
+        self.assertTrue(self.cache.acquire_lease("Chatbot_netec-demo"))
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.cache.acquire_lease("Chatbot_netec-demo")))
+        thread.start()
+        thread.join()
+        self.assertEqual(other, [False])
+        self.cache.release_lease("Chatbot_netec-demo")
+        self.now += 1
+        self.assertTrue(self.cache.acquire_lease("Chatbot_netec-demo"))
+
+    def test_expired_lease_is_taken_over(self):
+        thread = threading.Thread(target=lambda: self.cache.acquire_lease("Chatbot_netec-demo"))
+        thread.start()
+        thread.join()
+        self.assertFalse(self.cache.acquire_lease("Chatbot_netec-demo"))
+        self.now += self.cache.lease
+        self.assertTrue(self.cache.acquire_lease("Chatbot_netec-demo"))
+
+    def test_lease_errors_are_not_hidden_by_the_rollback(self):
+        statements = []
+
+        def execute(sql, *args):  # pylint: disable=unused-argument
+            statements.append(sql)
+            if sql.startswith("SELECT"):
+                raise sqlite3.OperationalError("disk I/O error")
+            if sql == "ROLLBACK" and not connection.in_transaction:
+                raise sqlite3.OperationalError("cannot rollback - no transaction is active")
+
+        connection = mock.Mock(in_transaction=False)
+        connection.execute.side_effect = execute
+        self.cache._local.connection = connection  # pylint: disable=protected-access
+        # sqlite has already rolled back, and the error is raised as it is.
+        with self.assertRaisesRegex(sqlite3.OperationalError, "disk I/O error"):
+            self.cache.acquire_lease("Chatbot_netec-demo")
+        self.assertNotIn("ROLLBACK", statements)
+        connection.in_transaction = True
+        with self.assertRaisesRegex(sqlite3.OperationalError, "disk I/O error"):
+            self.cache.acquire_lease("Chatbot_netec-demo")
+        self.assertEqual(statements[-1], "ROLLBACK")
+
+    def test_refresh_gives_up_on_a_stuck_lease_holder(self):
+        thread = threading.Thread(target=lambda: self.cache.acquire_lease("Chatbot_netec-demo"))
+        thread.start()
+        thread.join()
+        refreshed = self.cache.refresh("Chatbot_netec-demo", snapshot)
+        self.assertEqual(refreshed, snapshot())
+        self.assertGreaterEqual(self.cache.stats()["waits"], self.cache.lease_wait / self.cache.poll - 1)
+
+    def test_single_writer_refresh_across_processes(self):
+        fetches = os.path.join(self.directory.name, "fetches")
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        processes = [context.Process(target=refresh_in_process, args=(self.path, fetches, results)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=30)
+        self.assertEqual([results.get(timeout=5) for _ in processes], [36] * 4)
+        with open(fetches, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+
+class TestSharedManifestCacheClient(unittest.TestCase):
+    """Test that clients share described chatbots through the shared cache."""
+
+    def setUp(self):
+        RESOURCE_CACHE.clear()
+        self.addCleanup(RESOURCE_CACHE.clear)
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.shared_cache = SharedManifestCache(os.path.join(self.directory.name, "manifests.db"))
+
+    def client(self) -> Smarter:
+        return Smarter(api_key=TEST_API_KEY, model=whoami_model(), shared_cache=self.shared_cache)
+
+    def test_described_chatbots_are_shared(self):
+        fake_api = FakeApi(names=["chatbot-1", "chatbot-2"])
+        with mock.patch.object(ApiBase, "post", side_effect=fake_api.post):
+            first = self.client().resources.chatbots.get(name="chatbot-1")
+            # another worker process starts with an empty RESOURCE_CACHE.
+            RESOURCE_CACHE.clear()
+            second = self.client().resources.chatbots.get(name="chatbot-1")
+            result = self.client().resources.chatbots.get_many(["chatbot-1", "chatbot-2"])
+        self.assertEqual(first.chatbot_id, second.chatbot_id)
+        self.assertTrue(result.ok)
+        self.assertEqual(len(fake_api.describe_requests()), 2)
+        self.assertEqual(len(self.shared_cache), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+Test the near-duplicate prompt cache.
+"""
+
+import time
+import unittest
+from unittest import mock
+
+from smarter.cache import PromptCache, SimilarPromptCache
+from smarter.cache.similarity import MinHasher, normalize_prompt, shingles
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterValueError
+
+from .fixtures import chat_json, json_response
+from .test_prompt_cache import deterministic_chatbot
+
+
+QUESTION = "How do I reset my password on the Smarter platform?"
+
+
+class TestSimilarPromptCache(unittest.TestCase):
+    """Test SimilarPromptCache and its use by Chatbot.prompt()."""
+
+    def setUp(self):
+        patcher = mock.patch.object(ApiBase, "post", side_effect=lambda *args, **kwargs: json_response(chat_json()))
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_normalize_prompt(self):
+        self.assertEqual(normalize_prompt("  Hello,\tWORLD!! "), "hello world")
+        self.assertEqual(normalize_prompt("ｆｕｌｌｗｉｄｔｈ"), "fullwidth")
+
+    def test_similarity_estimate(self):
+        hasher = MinHasher()
+
+        def signature(text):
+            return hasher.signature(shingles(normalize_prompt(text)))
+
+        self.assertEqual(hasher.similarity(signature(QUESTION), signature(QUESTION.upper())), 1.0)
+        self.assertGreater(
+            hasher.similarity(signature(QUESTION), signature("How do I reset my password on the Smarter platform")), 0.9
+        )
+        self.assertLess(hasher.similarity(signature(QUESTION), signature("What is the weather in Paris?")), 0.2)
+
+    def test_near_duplicate_prompts_are_cached(self):
+        cache = SimilarPromptCache()
+        chatbot = deterministic_chatbot(cache)
+        first = chatbot.prompt(QUESTION)
+        second = chatbot.prompt("how do i reset my password on the smarter platform")
+        third = chatbot.prompt("How do i reset my password on the Smarter platform ??")
+        self.assertEqual(first, second)
+        self.assertEqual(first, third)
+        self.assertEqual(self.post.call_count, 1)
+        chatbot.prompt("What is the weather in Paris today?")
+        self.assertEqual(self.post.call_count, 2)
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["exact_hits"], 2)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["min_hit_similarity"], 1.0)
+
+    def test_near_hits_at_the_defaults(self):
+        cache = SimilarPromptCache()
+        chatbot = deterministic_chatbot(cache)
+        chatbot.prompt(QUESTION)
+        chatbot.prompt("How can I reset my password on the Smarter platform?")
+        chatbot.prompt("How do I reset password on Smarter platform?")
+        self.assertEqual(self.post.call_count, 1)
+        self.assertEqual(cache.stats()["near_hits"], 2)
+        chatbot.prompt("How do I delete my account on the Smarter platform?")
+        chatbot.prompt("Where can I reset my password?")
+        self.assertEqual(self.post.call_count, 3)
+
+    def test_chained_with_a_prompt_cache(self):
+        exact = PromptCache()
+        cache = SimilarPromptCache(exact=exact)
+        chatbot = deterministic_chatbot(cache)
+        first = chatbot.prompt(QUESTION)
+        self.assertEqual(exact.lookup(chatbot, QUESTION), first)
+        # a new process, whose exact cache has a shared or disk tier with the response.
+        cache = SimilarPromptCache(exact=exact)
+        chatbot = deterministic_chatbot(cache)
+        self.assertEqual(chatbot.prompt(QUESTION), first)
+        self.assertEqual(chatbot.prompt("How can I reset my password on the Smarter platform?"), first)
+        self.assertEqual(self.post.call_count, 1)
+        self.assertEqual((cache.stats()["exact_hits"], cache.stats()["near_hits"]), (1, 1))
+
+    def test_threshold(self):
+        cache = SimilarPromptCache(threshold=0.6)
+        chatbot = deterministic_chatbot(cache)
+        chatbot.prompt(QUESTION)
+        chatbot.prompt("How can I reset my password on the Smarter platform?")
+        self.assertEqual(self.post.call_count, 1)
+        self.assertEqual(cache.stats()["near_hits"], 1)
+        self.assertLess(cache.stats()["min_hit_similarity"], 1.0)
+
+        cache = SimilarPromptCache(threshold=1.0)
+        chatbot = deterministic_chatbot(cache)
+        chatbot.prompt(QUESTION)
+        chatbot.prompt("How can I reset my password on the Smarter platform?")
+        self.assertEqual(self.post.call_count, 3)
+
+    def test_chatbot_changes_invalidate(self):
+        cache = SimilarPromptCache()
+        deterministic_chatbot(cache).prompt(QUESTION)
+        deterministic_chatbot(cache, version="1.0.1").prompt(QUESTION)
+        self.assertEqual(self.post.call_count, 2)
+
+    def test_non_deterministic_chatbots_are_not_cached(self):
+        cache = SimilarPromptCache()
+        chatbot = deterministic_chatbot(cache, temperature=1.0)
+        chatbot.prompt(QUESTION)
+        chatbot.prompt(QUESTION)
+        self.assertEqual(self.post.call_count, 2)
+        self.assertEqual(cache.stats()["bypassed"], 2)
+
+    def test_eviction(self):
+        cache = SimilarPromptCache(maxsize=2)
+        chatbot = deterministic_chatbot(cache)
+        for i in range(3):
+            cache.store(chatbot, f"question number {i} about passwords", f"answer {i}")
+        self.assertIsNone(cache.lookup(chatbot, "question number 0 about passwords"))
+        self.assertEqual(cache.lookup(chatbot, "question number 2 about passwords"), "answer 2")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_expiry(self):
+        cache = SimilarPromptCache(ttl=60)
+        chatbot = deterministic_chatbot(cache)
+        cache.store(chatbot, QUESTION, "answer")
+        with mock.patch("smarter.cache.similarity.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.lookup(chatbot, QUESTION))
+            cache.store(chatbot, "What is the weather in Paris today?", "sunny")
+        # the expired entry is evicted by the next store.
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_bands_must_divide_num_perm(self):
+        with self.assertRaises(SmarterValueError):
+            SimilarPromptCache(num_perm=100, bands=32)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ top-level test file for the smarter package.
 """
 
 import unittest
+from collections.abc import Mapping
 
 from smarter import Account, Chatbot, Plugin, Smarter
 from smarter.common.classes import DEFAULT_API_ENDPOINT
@@ -39,12 +40,12 @@ class TestApi(unittest.TestCase):
         self.assertEqual(chatbot.name, "netec-demo")
         self.assertIsInstance(chatbot.chatbot_description, str)
         self.assertIsInstance(chatbot.chatbot_version, str)
-        self.assertIsInstance(chatbot.status, dict)
+        self.assertIsInstance(chatbot.status, Mapping)
         self.assertIsInstance(chatbot.chatbot_id, int)
-        self.assertIsInstance(chatbot.chatbot_metadata, dict)
-        self.assertIsInstance(chatbot.spec, dict)
-        self.assertIsInstance(chatbot.status, dict)
-        self.assertIsInstance(chatbot.config, dict)
+        self.assertIsInstance(chatbot.chatbot_metadata, Mapping)
+        self.assertIsInstance(chatbot.spec, Mapping)
+        self.assertIsInstance(chatbot.status, Mapping)
+        self.assertIsInstance(chatbot.config, Mapping)
 
         self.assertEqual(chatbot.config["provider"], "openai")
         self.assertEqual(chatbot.config["defaultModel"], "gpt-4o")
@@ -0,0 +1,67 @@
+"""
+Test ChatbotSnapshot and the snapshot-based resource cache.
+"""
+
+import pickle
+import unittest
+from dataclasses import FrozenInstanceError
+from unittest import mock
+
+from smarter import Chatbot, Smarter
+from smarter.api.client import RESOURCE_CACHE
+from smarter.resources.snapshot import ChatbotSnapshot
+
+from .fixtures import TEST_API_KEY, chatbot_json, chatbot_model, whoami_model
+
+
+class TestChatbotSnapshot(unittest.TestCase):
+    """Test ChatbotSnapshot."""
+
+    def setUp(self):
+        RESOURCE_CACHE.clear()
+
+    def tearDown(self):
+        RESOURCE_CACHE.clear()
+
+    def test_from_model(self):
+        snapshot = ChatbotSnapshot.from_model(chatbot_model("support", 37))
+        self.assertEqual(snapshot.name, "support")
+        self.assertEqual(snapshot.chatbot_id, 37)
+        self.assertEqual(snapshot.version, "1.0.0")
+        self.assertEqual(snapshot.config["provider"], "openai")
+        self.assertFalse(hasattr(snapshot, "__dict__"))
+        with self.assertRaises(FrozenInstanceError):
+            snapshot.name = "other"  # pylint: disable=assigning-non-slot
+        with self.assertRaises(TypeError):
+            snapshot.config["provider"] = "other"  # pylint: disable=unsupported-assignment-operation
+
+    def test_snapshots_share_configs(self):
+        first = ChatbotSnapshot.from_model(chatbot_model("first", 1))
+        second = ChatbotSnapshot.from_dict(ChatbotSnapshot.from_model(chatbot_model("second", 2)).to_dict())
+        self.assertIs(first.config, second.config)
+        self.assertIs(first.api_version, second.api_version)
+        with self.assertRaises(TypeError):
+            first.config["defaultModel"] = "changed"
+
+    def test_round_trip(self):
+        snapshot = ChatbotSnapshot.from_model(chatbot_model())
+        self.assertEqual(ChatbotSnapshot.from_dict(snapshot.to_dict()), snapshot)
+        self.assertEqual(pickle.loads(pickle.dumps(snapshot)), snapshot)
+        self.assertEqual(hash(snapshot), hash(ChatbotSnapshot.from_dict(snapshot.to_dict())))
+
+    def test_cache_stores_snapshots(self):
+        client = Smarter(api_key=TEST_API_KEY, model=whoami_model())
+        response = mock.Mock()
+        response.json.return_value = chatbot_json("support", 37)
+        with mock.patch.object(Chatbot, "post", return_value=response) as post:
+            chatbot = client.resources.chatbots.get(name="support")
+            cached = client.resources.chatbots.get(name="support")
+        self.assertEqual(post.call_count, 1)
+        self.assertIsInstance(RESOURCE_CACHE[client.resources.chatbots.cache_key("support")], ChatbotSnapshot)
+        self.assertEqual(cached.chatbot_id, chatbot.chatbot_id)
+        self.assertEqual(cached.url_chatbot, chatbot.url_chatbot)
+        self.assertEqual(dict(cached.config), dict(chatbot.config))
+
+
+if __name__ == "__main__":
+    unittest.main()
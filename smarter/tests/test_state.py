@@ -0,0 +1,88 @@
+"""
+Test saving and restoring the warm state of a Smarter client.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from smarter import Chatbot, Smarter
+from smarter.api.client import RESOURCE_CACHE
+from smarter.api.state import read_state
+from smarter.common.exceptions import SmarterValueError
+
+from .fixtures import TEST_API_KEY, chatbot_model, whoami_model
+
+
+class TestClientState(unittest.TestCase):
+    """Test Smarter.save_state() and Smarter.from_state() without network access."""
+
+    def setUp(self):
+        RESOURCE_CACHE.clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "smarter-state.json.gz")
+        self.client = Smarter(api_key=TEST_API_KEY, model=whoami_model())
+        chatbots = self.client.resources.chatbots
+        for name, chatbot_id in [("netec-demo", 36), ("support", 37)]:
+            chatbot = Chatbot(api_key=TEST_API_KEY, name=name, model=chatbot_model(name, chatbot_id))
+            chatbots.save_to_cache(chatbots.cache_key(name), chatbot.snapshot)
+
+    def tearDown(self):
+        RESOURCE_CACHE.clear()
+        self.tmpdir.cleanup()
+
+    def test_save_and_restore(self):
+        self.client.save_state(self.path)
+        RESOURCE_CACHE.clear()
+
+        with mock.patch.object(Smarter, "post", side_effect=AssertionError("unexpected api request")):
+            client = Smarter.from_state(self.path, api_key=TEST_API_KEY)
+        self.assertIsNone(client.httpx_response)
+        self.assertEqual(client.model.user.username, "admin")
+        with mock.patch.object(Chatbot, "post", side_effect=AssertionError("unexpected api request")):
+            chatbot = client.resources.chatbots.get(name="support")
+            self.assertEqual(chatbot.chatbot_id, 37)
+            self.assertEqual(chatbot.url_chatbot.path, "/api/v1/chatbots/37/chat/")
+            self.assertEqual(chatbot.config["defaultModel"], "gpt-4o")
+
+    def test_state_does_not_contain_api_key(self):
+        self.client.save_state(self.path)
+        with gzip.open(self.path, "rb") as f:
+            self.assertNotIn(TEST_API_KEY, f.read().decode("utf-8"))
+
+    def test_stale_state(self):
+        self.client.save_state(self.path)
+        with gzip.open(self.path, "rb") as f:
+            state = json.loads(f.read())
+        state["created_at"] = time.time() - 3600
+        with gzip.open(self.path, "wb") as f:
+            f.write(json.dumps(state).encode("utf-8"))
+        with self.assertRaises(SmarterValueError):
+            read_state(self.path, api_key=TEST_API_KEY, max_age=60)
+
+    def test_different_api_key(self):
+        self.client.save_state(self.path)
+        with self.assertRaises(SmarterValueError):
+            read_state(self.path, api_key="some-other-api-key")
+
+    def test_state_is_scoped_to_api_key(self):
+        other = Smarter(api_key="some-other-api-key", model=whoami_model())
+        other.save_state(self.path)
+        state = read_state(self.path, api_key="some-other-api-key")
+        self.assertEqual(state.chatbots, {})
+        # and chatbots described with another api key are not served from the cache.
+        with mock.patch.object(Chatbot, "post", side_effect=AssertionError("describe request")):
+            with self.assertRaisesRegex(AssertionError, "describe request"):
+                other.resources.chatbots.get(name="support")
+
+    def test_missing_state(self):
+        with self.assertRaises(SmarterValueError):
+            read_state(os.path.join(self.tmpdir.name, "missing.json.gz"), api_key=TEST_API_KEY)
+
+
+if __name__ == "__main__":
+    unittest.main()
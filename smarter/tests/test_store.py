@@ -0,0 +1,72 @@
+"""
+Test the ManifestStore string interning and block sharing.
+"""
+
+import unittest
+
+from smarter.resources.store import ManifestStore
+
+from .fixtures import chatbot_json, chatbot_model
+
+
+class TestManifestStore(unittest.TestCase):
+    """Test ManifestStore."""
+
+    def test_shares_identical_blocks(self):
+        store = ManifestStore()
+        first = store.add(chatbot_json("first", 1))
+        second = store.add(chatbot_json("second", 2))
+        self.assertEqual(len(store), 2)
+        self.assertIn("second", store)
+        self.assertIs(first.data.spec.config, second.data.spec.config)
+        self.assertIs(first.data.status.dnsVerificationStatus, second.data.status.dnsVerificationStatus)
+        self.assertIsNot(first.data.status, second.data.status)
+        self.assertEqual(second.data.status.urlChatbot, "https://platform.smarter.sh/api/v1/chatbots/2/chat/")
+
+    def test_models_are_not_modified(self):
+        store = ManifestStore()
+        store.add(chatbot_json("first", 1))
+        model = chatbot_model("second", 2)
+        config = model.data.spec.config
+        stored = store.add(model)
+        self.assertIs(model.data.spec.config, config)
+        self.assertIsNot(stored.data.spec.config, config)
+
+    def test_distinct_configs_are_not_shared(self):
+        store = ManifestStore()
+        other = chatbot_json("other", 2)
+        other["data"]["spec"]["config"]["defaultModel"] = "gpt-4o-mini"
+        first = store.add(chatbot_json("first", 1))
+        second = store.add(other)
+        self.assertIsNot(first.data.spec.config, second.data.spec.config)
+        self.assertEqual(second.data.spec.config.defaultModel, "gpt-4o-mini")
+        self.assertIs(first.data.spec.config.defaultSystemRole, second.data.spec.config.defaultSystemRole)
+
+    def test_stats(self):
+        store = ManifestStore()
+        store.add_many([chatbot_json(f"chatbot-{i}", i) for i in range(20)])
+        stats = store.stats()
+        self.assertEqual(stats["manifests"], 20)
+        self.assertEqual(stats["shared_block_hits"], 19)
+        self.assertGreater(stats["saved_bytes"], 0)
+        self.assertLess(stats["stored_bytes"], stats["raw_bytes"])
+        store.clear()
+        self.assertEqual(store.stats()["manifests"], 0)
+
+    def test_max_size(self):
+        store = ManifestStore(max_size=8)
+        configs = [store.share_config({"index": i, "provider": "openai"}) for i in range(20)]
+        self.assertIs(store.share_config({"index": 19, "provider": "openai"}), configs[19])
+        self.assertIsNot(store.share_config({"index": 0, "provider": "openai"}), configs[0])
+        self.assertIs(configs[0]["provider"], configs[19]["provider"])
+        for i in range(100):
+            store.intern(f"value-{i}")
+        stats = store.stats()
+        self.assertLessEqual(stats["interned_strings"], 8)
+        self.assertLessEqual(stats["shared_blocks"], 16)
+        store.add_many([chatbot_json(f"chatbot-{i}", i) for i in range(3)])
+        self.assertEqual(len(store), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Test thread-safe lazy initialization and caches.
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from smarter.common.classes import ApiBase
+from smarter.common.sync import LockedLRUCache, lazy_property
+from smarter.resources import Chatbot
+from smarter.resources.snapshot import ChatbotSnapshot
+
+from .fixtures import (
+    TEST_API_KEY,
+    chat_json,
+    chatbot_json,
+    chatbot_model,
+    json_response,
+)
+
+
+def run_threads(target, count: int = 8) -> None:
+    """Run target in count threads that start at the same time."""
+    barrier = threading.Barrier(count)
+
+    def run():
+        barrier.wait()
+        target()
+
+    threads = [threading.Thread(target=run, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+
+class Lazy:
+    """Counts the computations of a lazy_property."""
+
+    def __init__(self):
+        self.computed = 0
+
+    @lazy_property
+    def value(self) -> object:
+        """A new object for every computation."""
+        self.computed += 1
+        time.sleep(0.01)
+        return object()
+
+
+class TestLazyProperty(unittest.TestCase):
+    """Test lazy_property."""
+
+    def test_every_thread_sees_the_first_value(self):
+        lazy = Lazy()
+        seen = []
+        run_threads(lambda: seen.append(lazy.value))
+        self.assertEqual(len(seen), 8)
+        self.assertEqual({id(value) for value in seen}, {id(lazy.value)})
+        self.assertGreaterEqual(lazy.computed, 1)
+
+    def test_cached_in_the_instance_dict(self):
+        lazy = Lazy()
+        value = lazy.value
+        self.assertIs(lazy.__dict__["value"], value)
+        self.assertIs(lazy.value, value)
+        self.assertEqual(lazy.computed, 1)
+        self.assertEqual(Lazy.value.__doc__, "A new object for every computation.")
+
+
+class TestLockedLRUCache(unittest.TestCase):
+    """Test LockedLRUCache."""
+
+    def test_concurrent_reads_writes_and_evictions(self):
+        cache = LockedLRUCache(maxsize=16)
+        errors = []
+
+        def hammer():
+            try:
+                for i in range(2000):
+                    cache[i % 32] = i
+                    cache.get((i + 7) % 32)
+                    if (i + 3) % 32 in cache:
+                        cache.pop((i + 3) % 32, None)
+                    list(cache.items())
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                errors.append(e)
+
+        run_threads(hammer)
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(cache), 16)
+
+    def test_mapping(self):
+        cache = LockedLRUCache(maxsize=2)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache["a"], 1)
+        cache["c"] = 3
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.items(), [("a", 1), ("c", 3)])
+        self.assertEqual(cache.pop("a"), 1)
+        with self.assertRaises(KeyError):
+            cache.pop("a")
+
+
+class TestLazyModel(unittest.TestCase):
+    """Test that the lazy describe request of a chatbot is made only once."""
+
+    def test_concurrent_model_access_describes_once(self):
+        def post(url, data=None, headers=None, api_key=None):  # pylint: disable=unused-argument
+            time.sleep(0.05)
+            return json_response(chatbot_json())
+
+        chatbot = Chatbot(api_key=TEST_API_KEY, snapshot=ChatbotSnapshot.from_model(chatbot_model()))
+        models = []
+        with mock.patch.object(ApiBase, "post", side_effect=post) as mock_post:
+            run_threads(lambda: models.append(chatbot.model))
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(len({id(model) for model in models}), 1)
+
+    def test_base_url(self):
+        chatbot = Chatbot(
+            api_key=TEST_API_KEY,
+            snapshot=ChatbotSnapshot.from_model(chatbot_model()),
+            base_url="http://127.0.0.1:8000/api/v1",
+        )
+        with mock.patch.object(ApiBase, "post", return_value=json_response(chat_json())) as mock_post:
+            chatbot.prompt("hello")
+        self.assertTrue(
+            mock_post.call_args.kwargs["url"].startswith("http://127.0.0.1:8000/api/v1/cli/chat/netec-demo/")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
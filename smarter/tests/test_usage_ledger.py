@@ -0,0 +1,156 @@
+"""
+Test the usage ledger.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from smarter.api.client import Resources
+from smarter.common.classes import ApiBase
+from smarter.common.exceptions import SmarterValueError
+from smarter.resources import Chatbot
+from smarter.resources.snapshot import ChatbotSnapshot
+from smarter.traffic import scheduling
+from smarter.usage import LedgerTable, UsageLedger
+
+from .fixtures import TEST_API_KEY, chat_json, chatbot_model, json_response
+
+
+HOUR = 1_700_000_000 - 1_700_000_000 % 3600
+
+
+def usage(prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> dict:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "cached_tokens": cached_tokens,
+    }
+
+
+class TestUsageLedger(unittest.TestCase):
+    """Test recording, flushing, loading and aggregating."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "usage.ledger")
+
+    def ledger(self, **kwargs) -> UsageLedger:
+        ledger = UsageLedger(self.path, **kwargs)
+        ledger.record("faq-bot", "gpt-4o", "acme", usage(100, 10, cached_tokens=50), 0.5, timestamp=HOUR + 10)
+        ledger.record("faq-bot", "gpt-4o", "acme", usage(200, 20), 1.5, timestamp=HOUR + 3700)
+        ledger.record("sales-bot", "gpt-4o-mini", "globex", usage(300, 30), 0.25, timestamp=HOUR + 20)
+        return ledger
+
+    def test_aggregate(self):
+        table = self.ledger().table()
+        by_chatbot = table.aggregate()
+        self.assertEqual(list(by_chatbot), [("faq-bot",), ("sales-bot",)])
+        self.assertEqual(by_chatbot[("faq-bot",)]["calls"], 2)
+        self.assertEqual(by_chatbot[("faq-bot",)]["total_tokens"], 330)
+        self.assertEqual(by_chatbot[("faq-bot",)]["cached_tokens"], 50)
+        self.assertEqual(by_chatbot[("faq-bot",)]["latency_mean"], 1.0)
+        by_hour = table.aggregate(by=["tenant", "hour"])
+        self.assertEqual(list(by_hour), [("acme", HOUR), ("acme", HOUR + 3600), ("globex", HOUR)])
+        self.assertEqual(by_hour[("globex", HOUR)]["prompt_tokens"], 300)
+        self.assertEqual(table.aggregate(by=[]), {(): mock.ANY})
+        self.assertEqual(table.aggregate(by=[])[()]["completion_tokens"], 60)
+        with self.assertRaises(SmarterValueError):
+            table.aggregate(by=["region"])
+
+    def test_flush_appends_segments(self):
+        ledger = self.ledger()
+        self.assertEqual(ledger.flush(), 3)
+        self.assertEqual(len(ledger), 0)
+        self.assertEqual(ledger.flush(), 0)
+        # a second segment, with its own dictionary codes.
+        ledger.record("other-bot", "gpt-4o-mini", "acme", usage(1, 1), 0.1, timestamp=HOUR)
+        ledger.record("faq-bot", "gpt-4o", "acme", usage(1, 1), 0.1, timestamp=HOUR)
+        ledger.flush()
+        table = LedgerTable.load(self.path)
+        self.assertEqual(len(table), 5)
+        self.assertEqual(table.column("chatbot"), ["faq-bot", "faq-bot", "sales-bot", "other-bot", "faq-bot"])
+        self.assertEqual(table.column("model")[3], "gpt-4o-mini")
+        self.assertEqual(table.aggregate()[("faq-bot",)]["calls"], 3)
+        self.assertEqual(next(table.rows())["cached_tokens"], 50)
+        self.assertGreater(os.path.getsize(self.path), 5 * 52)
+
+    def test_flush_every_and_load(self):
+        ledger = self.ledger(flush_every=2)
+        self.assertEqual(len(ledger), 1)
+        self.assertEqual(len(LedgerTable.load(self.path)), 2)
+        self.assertEqual(len(ledger.load()), 3)
+
+    def test_torn_segments_are_skipped(self):
+        ledger = self.ledger()
+        ledger.flush()
+        ledger.record("torn-bot", "gpt-4o", "acme", usage(1, 1), 0.1, timestamp=HOUR)
+        ledger.flush()
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 4)
+        self.assertEqual(len(LedgerTable.load(self.path)), 3)
+        # the next segment is appended after the torn one, which is skipped.
+        ledger.record("other-bot", "gpt-4o", "acme", usage(1, 1), 0.1, timestamp=HOUR)
+        ledger.flush()
+        table = LedgerTable.load(self.path)
+        self.assertEqual(table.column("chatbot"), ["faq-bot", "faq-bot", "sales-bot", "other-bot"])
+        with open(self.path, "wb") as f:
+            f.write(b"not a ledger")
+        with self.assertRaises(SmarterValueError):
+            LedgerTable.load(self.path)
+        with self.assertRaises(SmarterValueError):
+            UsageLedger().flush()
+
+    def test_failed_flush_keeps_the_rows(self):
+        ledger = self.ledger()
+        with mock.patch("smarter.usage.ledger.os.fsync", side_effect=OSError("No space left on device")):
+            with self.assertRaises(OSError):
+                ledger.flush()
+        self.assertEqual(len(ledger), 3)
+        self.assertEqual(os.path.getsize(self.path), 0)
+        ledger.record("other-bot", "gpt-4o", "acme", usage(1, 1), 0.1, timestamp=HOUR)
+        self.assertEqual(ledger.flush(), 4)
+        table = LedgerTable.load(self.path)
+        self.assertEqual(table.column("chatbot"), ["faq-bot", "faq-bot", "sales-bot", "other-bot"])
+        self.assertEqual(table.column("model"), ["gpt-4o", "gpt-4o", "gpt-4o-mini", "gpt-4o"])
+
+    def test_after_fork_starts_empty(self):
+        ledger = self.ledger()
+        ledger._after_fork()  # pylint: disable=protected-access
+        self.assertEqual(len(ledger), 0)
+        ledger.record("faq-bot", None, None, usage(1, 1), 0.1)
+        self.assertEqual(ledger.table().column("model"), [""])
+
+
+class TestChatbotUsage(unittest.TestCase):
+    """Test that Chatbot.prompt() records its usage."""
+
+    def test_prompt_records_usage_with_tenant(self):
+        ledger = UsageLedger()
+        chatbot = Chatbot(
+            api_key=TEST_API_KEY, snapshot=ChatbotSnapshot.from_model(chatbot_model()), usage_ledger=ledger
+        )
+        with mock.patch.object(ApiBase, "post", return_value=json_response(chat_json())):
+            chatbot.prompt("hello")
+            with scheduling(tenant="acme"):
+                chatbot.prompt("hello")
+        (row, tenant_row) = list(ledger.table().rows())
+        self.assertEqual(row["chatbot"], "netec-demo")
+        self.assertEqual(row["model"], "gpt-4o-2024-08-06")
+        self.assertEqual((row["prompt_tokens"], row["completion_tokens"], row["total_tokens"]), (547, 24, 571))
+        self.assertGreater(row["created"], 0)
+        self.assertEqual(row["tenant"], "default")
+        self.assertEqual(tenant_row["tenant"], "acme")
+
+    def test_resources_share_the_ledger(self):
+        ledger = UsageLedger()
+        resources = Resources(api_key=TEST_API_KEY, usage_ledger=ledger)
+        snapshot = ChatbotSnapshot.from_model(chatbot_model())
+        self.assertIs(resources.chatbots.chatbot(snapshot=snapshot).usage_ledger, ledger)
+
+
+if __name__ == "__main__":
+    unittest.main()
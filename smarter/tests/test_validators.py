@@ -0,0 +1,45 @@
+"""
+Test the SmarterValidator single value and batch helpers.
+"""
+
+import unittest
+
+from smarter.common.exceptions import SmarterValueError
+from smarter.common.validators import SmarterValidator
+
+
+class TestValidators(unittest.TestCase):
+    """Test SmarterValidator."""
+
+    def test_single_values(self):
+        SmarterValidator.validate_account_number("3141-5926-5359")
+        SmarterValidator.validate_hostname("platform.smarter.sh")
+        SmarterValidator.validate_domain("localhost:8000")
+        self.assertTrue(SmarterValidator.is_valid_domain("netec-demo.3141-5926-5359.api.smarter.sh"))
+        self.assertFalse(SmarterValidator.is_valid_domain("-bad-.smarter.sh"))
+        self.assertFalse(SmarterValidator.is_valid_hostname(""))
+        self.assertFalse(SmarterValidator.is_valid_hostname("a:b:c"))
+        self.assertFalse(SmarterValidator.is_valid_account_number(None))
+        with self.assertRaises(SmarterValueError):
+            SmarterValidator.validate_hostname("smarter.sh:99999")
+
+    def test_batch_returns_all_failures(self):
+        values = ["3141-5926-5359", "bad", "1234-5678-9012", 42, "0000-0000-00000"]
+        failures = SmarterValidator.batch_validate_account_numbers(values)
+        self.assertEqual(failures, [(1, "bad"), (3, 42), (4, "0000-0000-00000")])
+        self.assertEqual(SmarterValidator.batch_validate_account_numbers(values[:1]), [])
+
+    def test_batch_domains(self):
+        domains = ["platform.smarter.sh", "localhost:8000", "bad_domain!", "platform.smarter.sh"]
+        self.assertEqual(SmarterValidator.batch_validate_domains(domains), [(2, "bad_domain!")])
+
+    def test_list_helpers_report_every_failure(self):
+        with self.assertRaises(SmarterValueError) as context:
+            SmarterValidator.validate_list_of_account_numbers(["bad", "3141-5926-5359", "worse"])
+        self.assertIn("[0] bad", str(context.exception))
+        self.assertIn("[2] worse", str(context.exception))
+        SmarterValidator.validate_list_of_domains(["platform.smarter.sh", "api.smarter.sh"])
+
+
+if __name__ == "__main__":
+    unittest.main()
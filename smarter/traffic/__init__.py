@@ -0,0 +1,21 @@
+# pylint: disable=missing-module-docstring
+from .concurrency import ConcurrencyLimiter
+from .deadlines import deadline
+from .hedging import Hedger
+from .keys import ApiKeyPool
+from .ratelimit import RateLimiter
+from .scheduler import Priority, RequestScheduler, scheduling
+from .timeouts import AdaptiveTimeouts
+
+
+__all__ = [
+    "AdaptiveTimeouts",
+    "ApiKeyPool",
+    "ConcurrencyLimiter",
+    "Hedger",
+    "Priority",
+    "RateLimiter",
+    "RequestScheduler",
+    "deadline",
+    "scheduling",
+]
@@ -0,0 +1,190 @@
+"""
+smarter-api adaptive concurrency limiter.
+
+A fixed number of concurrent prompts is wrong either way: too low wastes
+throughput, and too high triggers 429 responses and latency spikes.
+ConcurrencyLimiter adjusts the number of prompts that may be in flight with
+additive increase, multiplicative decrease (AIMD):
+
+- while responses succeed and latency is healthy the limit grows by about one
+  per round trip, but only while the limit is actually being used,
+- on a 429, a 5xx, a timeout, or a latency spike the limit is multiplied by
+  backoff. Latency spikes are detected from the gradient between a short-term
+  and a long-term average of the observed latency.
+
+Decreases are applied at most once per short-term latency window, so that a
+burst of failures from the same overload only shrinks the limit once.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+import httpx
+
+from smarter.common import forking
+from smarter.common.exceptions import (
+    SmarterDeadlineExceededError,
+    SmarterRateLimitError,
+    SmarterValueError,
+)
+from smarter.traffic.deadlines import remaining
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_overload(error: Optional[BaseException]) -> bool:
+    """Return True if a request error means that the server is overloaded."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code == 429 or status_code >= 500
+    return isinstance(error, (httpx.TimeoutException, SmarterRateLimitError))
+
+
+class ConcurrencyLimiter:
+    """
+    AIMD limit on the number of in-flight requests. Use slot() around each
+    request, or acquire(), release() and record() for finer control.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff: float = 0.5,
+        tolerance: float = 2.0,
+        short_smoothing: float = 0.3,
+        long_smoothing: float = 0.02,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise SmarterValueError("limits must satisfy 1 <= min_limit <= initial_limit <= max_limit")
+        if not 0 < backoff < 1:
+            raise SmarterValueError("backoff must be between 0 and 1")
+        self._limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.short_smoothing = short_smoothing
+        self.long_smoothing = long_smoothing
+        self.clock = clock
+        self.in_flight = 0
+        self.short_latency: Optional[float] = None
+        self.long_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        forking.register(self)
+        self.increases = 0
+        self.decreases = 0
+        self.overloads = 0
+        self.max_in_flight = 0
+
+    @property
+    def limit(self) -> int:
+        """The current limit on the number of in-flight requests."""
+        return int(self._limit)
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Block until the number of in-flight requests is below the limit. Returns False on timeout."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight < self.limit, timeout=timeout):
+                return False
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return True
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def record(self, latency: float, error: Optional[BaseException] = None) -> None:
+        """Adjust the limit for the outcome of a request."""
+        with self._condition:
+            overloaded = is_overload(error)
+            if error is None:
+                self._observe(latency)
+            gradient = self.gradient
+            if overloaded or gradient > self.tolerance:
+                self._decrease("overload" if overloaded else f"latency gradient {gradient:.2f}")
+                self.overloads += 1 if overloaded else 0
+            elif error is None and self.in_flight + 1 >= self.limit:
+                # in_flight does not yet include this request if record() is called after release().
+                self._increase()
+            self._condition.notify_all()
+
+    @property
+    def gradient(self) -> float:
+        """The ratio of the short-term to the long-term average latency."""
+        if not self.short_latency or not self.long_latency:
+            return 1.0
+        return self.short_latency / self.long_latency
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """
+        Hold an in-flight slot for the duration of a request, and record its outcome.
+        Waits for a slot no longer than the current call deadline.
+        """
+        if not self.acquire(timeout=remaining()):
+            raise SmarterDeadlineExceededError("ConcurrencyLimiter.slot() waited past the call deadline")
+        start = self.clock()
+        try:
+            yield
+        except Exception as e:
+            self.record(self.clock() - start, e)
+            raise
+        else:
+            self.record(self.clock() - start)
+        finally:
+            self.release()
+
+    def _observe(self, latency: float) -> None:
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+            return
+        self.short_latency += self.short_smoothing * (latency - self.short_latency)
+        self.long_latency += self.long_smoothing * (latency - self.long_latency)
+
+    def _increase(self) -> None:
+        limit = min(self.max_limit, self._limit + 1 / self._limit)
+        if int(limit) > self.limit:
+            logger.debug("ConcurrencyLimiter() limit increased to %s", int(limit))
+        self._limit = limit
+        self.increases += 1
+
+    def _decrease(self, reason: str) -> None:
+        now = self.clock()
+        if now - self._last_decrease < (self.short_latency or 0.0):
+            return
+        self._last_decrease = now
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        self.decreases += 1
+        # start a new latency window, so that one spike is not counted again.
+        if self.long_latency is not None:
+            self.short_latency = self.long_latency
+        logger.debug("ConcurrencyLimiter() limit decreased to %s: %s", self.limit, reason)
+
+    def _after_fork(self) -> None:
+        # the parent's in-flight requests belong to threads that don't exist in the child.
+        self._condition = threading.Condition()
+        self.in_flight = 0
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "overloads": self.overloads,
+                "short_latency": self.short_latency,
+                "long_latency": self.long_latency,
+                "gradient": round(self.gradient, 3),
+            }
@@ -0,0 +1,80 @@
+"""
+smarter-api call deadlines.
+
+httpx timeouts apply to each phase of each request, so a prompt that is
+queued, throttled, retried with another key or hedged can take many times
+its timeout. A deadline bounds the whole call. It is set for a block of code
+with deadline(), and every wait on the way to the server, the rate limiter,
+the scheduler queue, the concurrency limiter, key cooldowns, hedges and the
+http request itself, is cut short to the time that remains:
+
+    with deadline(10):
+        chatbot.prompt("...")
+
+SmarterDeadlineExceededError is raised once the deadline has passed. Nested
+deadlines can only shorten the deadline of the enclosing block.
+"""
+
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from smarter.common.exceptions import SmarterDeadlineExceededError
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """A point in time, on the time.monotonic() clock, by which a call must complete."""
+
+    expires: float = math.inf
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def check(self, what: str, wait: float = 0.0) -> None:
+        """Raise SmarterDeadlineExceededError if the deadline passes within wait seconds."""
+        if time.monotonic() + wait >= self.expires:
+            raise SmarterDeadlineExceededError(f"{what} would exceed the call deadline")
+
+
+NO_DEADLINE = Deadline()
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar("smarter_deadline", default=NO_DEADLINE)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[Deadline]:
+    """
+    Bound every request made within the block to complete within seconds. With
+    seconds=None the enclosing deadline, if any, is kept.
+    """
+    current = _deadline.get()
+    expires = current.expires if seconds is None else min(current.expires, time.monotonic() + seconds)
+    token = _deadline.set(Deadline(expires=expires))
+    try:
+        yield _deadline.get()
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Deadline:
+    return _deadline.get()
+
+
+def remaining(timeout: Optional[float] = None) -> Optional[float]:
+    """
+    The lesser of timeout and the time remaining until the current deadline.
+    None if there is neither a timeout nor a deadline.
+    """
+    expires = _deadline.get().expires
+    if math.isinf(expires):
+        return timeout
+    left = max(0.0, expires - time.monotonic())
+    return left if timeout is None else min(timeout, left)
@@ -0,0 +1,185 @@
+"""
+smarter-api request hedging.
+
+The tail latency of idempotent metadata requests, such as cli/whoami/ and
+cli/describe/chatbot/, is dominated by occasional slow responses. A Hedger
+sends a second, identical request when the first has not completed within an
+adaptive delay, the observed p95 latency of the endpoint, and uses whichever
+response arrives first. The losing request is left to complete in the
+background and its response is discarded.
+
+Hedges add load, so they are capped by a budget: the number of hedges may not
+exceed budget times the number of requests, plus a small burst allowance.
+Only idempotent requests may be hedged. Hedges are not sent, and results are
+not waited for, past the current call deadline. The delay is timed from when
+the first request starts to run, so that a request that waits for one of the
+hedger's max_workers threads is not hedged for waiting.
+"""
+
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+from smarter.common import forking
+from smarter.common.exceptions import SmarterDeadlineExceededError, SmarterValueError
+from smarter.traffic.deadlines import current_deadline, remaining
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def percentile(samples, q: float) -> float:
+    """Return the q-th percentile (0-1) of samples, by the nearest rank method."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(q * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Hedger:
+    """
+    Hedges idempotent calls after the q-th percentile of their endpoint's
+    observed latency, clamped to [min_delay, max_delay]. Until min_samples
+    latencies have been observed for an endpoint, initial_delay is used.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.01,
+        max_delay: float = 5.0,
+        budget: float = 0.05,
+        burst: int = 2,
+        window: int = 200,
+        min_samples: int = 20,
+        max_workers: int = 16,
+    ):
+        if not 0 < quantile < 1:
+            raise SmarterValueError("quantile must be between 0 and 1")
+        self.quantile = quantile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.burst = burst
+        self.window = window
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._executor: ThreadPoolExecutor = None
+        self._lock = threading.Lock()
+        forking.register(self)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="smarter-hedge")
+            return self._executor
+
+    def delay(self, endpoint: str) -> float:
+        """The time to wait for a response before sending a hedge."""
+        with self._lock:
+            samples = list(self._latencies.get(endpoint, ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        return min(self.max_delay, max(self.min_delay, percentile(samples, self.quantile)))
+
+    def observe(self, endpoint: str, latency: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(endpoint, deque(maxlen=self.window)).append(latency)
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges < self.budget * self.requests + self.burst:
+                self.hedges += 1
+                return True
+            self.over_budget += 1
+            return False
+
+    def _timed(self, endpoint: str, call: Callable[[], T], started: Optional[threading.Event]) -> T:
+        if started is not None:
+            started.set()
+        start = time.monotonic()
+        result = call()
+        self.observe(endpoint, time.monotonic() - start)
+        return result
+
+    def _submit(self, endpoint: str, call: Callable[[], T], started: threading.Event = None) -> Future:
+        # each attempt runs in a copy of the caller's context, so that it sees the call deadline.
+        return self.executor.submit(contextvars.copy_context().run, self._timed, endpoint, call, started)
+
+    def _result(self, future: Future) -> T:
+        try:
+            return future.result(timeout=remaining())
+        except FutureTimeoutError as e:
+            raise SmarterDeadlineExceededError("Hedger.call() waited past the call deadline") from e
+
+    def call(self, endpoint: str, call: Callable[[], T]) -> T:
+        """
+        Call an idempotent function, hedging it if it is slow. Returns the first
+        successful result. If every attempt fails, the first attempt's error is raised.
+        """
+        with self._lock:
+            self.requests += 1
+        started = threading.Event()
+        primary: Future = self._submit(endpoint, call, started)
+        # time spent queued for a worker thread doesn't count toward the hedge delay.
+        if not started.wait(timeout=remaining()):
+            return self._result(primary)
+        done, _ = wait([primary], timeout=remaining(self.delay(endpoint)))
+        if done or current_deadline().expired or not self._take_hedge():
+            return self._result(primary)
+        logger.debug("Hedger.call() hedging %s", endpoint)
+        hedge: Future = self._submit(endpoint, call)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise SmarterDeadlineExceededError("Hedger.call() waited past the call deadline")
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+        return self._result(primary)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _after_fork(self) -> None:
+        # the executor's worker threads were not copied into the child, so a new executor is created on first use.
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {endpoint: list(samples) for endpoint, samples in self._latencies.items()}
+            stats = {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "over_budget": self.over_budget,
+                "hedge_ratio": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            }
+        stats["delays"] = {
+            endpoint: round(self.delay(endpoint), 4) for endpoint, samples in endpoints.items() if samples
+        }
+        return stats
@@ -0,0 +1,169 @@
+"""
+smarter-api api key pool.
+
+Rate limits are enforced per api key, so a gateway that sends all of its
+prompts with one key is limited to that key's throughput. ApiKeyPool spreads
+prompts across several api keys of the same account, selecting keys either in
+round-robin order or by the fewest in-flight requests. A key that receives a
+429 response is put into cooldown, for the duration of the Retry-After header
+if there is one, and is skipped until the cooldown ends.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import httpx
+
+from smarter.common import forking
+from smarter.common.exceptions import SmarterValueError
+from smarter.traffic.deadlines import current_deadline
+
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = "round_robin"
+LEAST_LOADED = "least_loaded"
+STRATEGIES = [ROUND_ROBIN, LEAST_LOADED]
+
+
+def retry_after(error: BaseException, default: float) -> float:
+    """Return the seconds to wait from the Retry-After header of a 429 response, or default."""
+    if isinstance(error, httpx.HTTPStatusError):
+        try:
+            return float(error.response.headers.get("Retry-After", default))
+        except ValueError:
+            return default
+    return default
+
+
+def is_throttled(error: Optional[BaseException]) -> bool:
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429
+
+
+@dataclass
+class KeyStats:
+    """Metrics for one api key of the pool."""
+
+    requests: int = 0
+    in_flight: int = 0
+    errors: int = 0
+    throttled: int = 0
+    latency: float = 0.0
+    cooldown_until: float = 0.0
+
+
+class ApiKeyPool:
+    """
+    A pool of api keys for the same account. Use use() to hold a key for the
+    duration of a request. Keys are never logged or reported, only their last
+    four characters.
+    """
+
+    def __init__(
+        self,
+        api_keys: Iterable[str],
+        strategy: str = ROUND_ROBIN,
+        cooldown: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.api_keys: List[str] = list(dict.fromkeys(api_keys))
+        if not self.api_keys:
+            raise SmarterValueError("at least one api key is required")
+        if strategy not in STRATEGIES:
+            raise SmarterValueError(f"strategy must be one of {STRATEGIES}")
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self._keys: Dict[str, KeyStats] = {key: KeyStats() for key in self.api_keys}
+        self._next = 0
+        self._lock = threading.Lock()
+        forking.register(self)
+
+    def _after_fork(self) -> None:
+        # cooldowns still apply in the child, but the parent's in-flight requests do not.
+        self._lock = threading.Lock()
+        for stats in self._keys.values():
+            stats.in_flight = 0
+
+    def __len__(self) -> int:
+        return len(self.api_keys)
+
+    @property
+    def primary(self) -> str:
+        return self.api_keys[0]
+
+    def select(self) -> str:
+        """
+        Select a key for a request. If every key is in cooldown, wait for the
+        first cooldown to end, unless that is past the current call deadline.
+        """
+        while True:
+            with self._lock:
+                now = self.clock()
+                available = [key for key in self._ordered() if self._keys[key].cooldown_until <= now]
+                if available:
+                    if self.strategy == LEAST_LOADED:
+                        key = min(available, key=lambda k: self._keys[k].in_flight)
+                    else:
+                        key = available[0]
+                    self._next = (self.api_keys.index(key) + 1) % len(self.api_keys)
+                    stats = self._keys[key]
+                    stats.requests += 1
+                    stats.in_flight += 1
+                    return key
+                wait = min(stats.cooldown_until for stats in self._keys.values()) - now
+            current_deadline().check("ApiKeyPool.select()", wait)
+            logger.debug("ApiKeyPool.select() every key is in cooldown, waiting %.2fs", wait)
+            self.sleep(wait)
+
+    def release(self, key: str, latency: float = 0.0, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            stats = self._keys[key]
+            stats.in_flight -= 1
+            stats.latency += latency
+            if error is not None:
+                stats.errors += 1
+            if is_throttled(error):
+                stats.throttled += 1
+                stats.cooldown_until = self.clock() + retry_after(error, self.cooldown)
+                logger.debug("ApiKeyPool.release() key ...%s in cooldown", key[-4:])
+
+    @contextmanager
+    def use(self) -> Iterator[str]:
+        """Select a key and hold it for the duration of a request, recording its outcome."""
+        key = self.select()
+        start = self.clock()
+        try:
+            yield key
+        except Exception as e:
+            self.release(key, self.clock() - start, e)
+            raise
+        else:
+            self.release(key, self.clock() - start)
+
+    def _ordered(self) -> List[str]:
+        """The keys in round-robin order, starting from the next key."""
+        start = self._next
+        return self.api_keys[start:] + self.api_keys[:start]
+
+    def stats(self) -> dict:
+        """Per-key metrics, keyed by the position and the last four characters of each key."""
+        with self._lock:
+            now = self.clock()
+            return {
+                f"{i}:...{key[-4:]}": {
+                    "requests": stats.requests,
+                    "in_flight": stats.in_flight,
+                    "errors": stats.errors,
+                    "throttled": stats.throttled,
+                    "mean_latency": round(stats.latency / stats.requests, 4) if stats.requests else None,
+                    "cooldown_remaining": round(max(0.0, stats.cooldown_until - now), 3),
+                }
+                for i, (key, stats) in enumerate(self._keys.items())
+            }
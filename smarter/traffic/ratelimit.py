@@ -0,0 +1,217 @@
+"""
+smarter-api client-side rate limiter.
+
+The Smarter platform enforces both a request rate limit and a token rate limit.
+RateLimiter meters prompts against both with a pair of token buckets, so that
+callers are smoothed out before they reach the server rather than being turned
+away with 429 responses after the fact.
+
+The number of tokens that a prompt will consume is not known until its response
+arrives, so each prompt reserves a pre-flight estimate: the approximate token
+count of the prompt text plus the average completion size of previous responses.
+Once the response arrives the reservation is settled against the actual
+UsageModel.total_tokens of the response.
+
+A limiter is thread-safe. With path set, the bucket state is kept in a small
+file that is locked with flock(), so that the limits are shared between every
+process on the host that uses the same path.
+"""
+
+import logging
+import math
+import struct
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+from smarter.common import forking
+from smarter.common.exceptions import (
+    SmarterConfigurationError,
+    SmarterRateLimitError,
+    SmarterValueError,
+)
+from smarter.traffic.deadlines import current_deadline
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    # smarter.resources imports the traffic controls, so this import is for type checkers only.
+    from smarter.resources.models.prompt import UsageModel
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# requests bucket level, tokens bucket level, time of the last refill
+STATE_FORMAT = struct.Struct("<ddd")
+CHARS_PER_TOKEN = 4
+DEFAULT_COMPLETION_TOKENS = 256
+# tolerance for the floating point error of refills, so that a wait never rounds down to nothing.
+EPSILON = 1e-9
+
+
+def estimate_prompt_tokens(message: str) -> int:
+    """Approximate the token count of a prompt without a tokenizer."""
+    return len(message) // CHARS_PER_TOKEN + 1
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute and tokens per minute. Either
+    limit may be omitted. Buckets start full and hold burst_seconds worth of
+    their rate, so that short bursts are allowed while the average is held to
+    the limit.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        burst_seconds: float = 60,
+        path: str = None,
+        completion_tokens: int = DEFAULT_COMPLETION_TOKENS,
+        smoothing: float = 0.2,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if not requests_per_minute and not tokens_per_minute:
+            raise SmarterValueError("at least one of requests_per_minute or tokens_per_minute is required")
+        if path and fcntl is None:
+            raise SmarterConfigurationError("a shared rate limiter requires fcntl, which is not available")
+        self.rates = (
+            (requests_per_minute or math.inf) / 60,
+            (tokens_per_minute or math.inf) / 60,
+        )
+        # a bucket must be able to hold at least one request, or the request could never be admitted.
+        self.capacities = tuple(max(1.0, rate * burst_seconds) for rate in self.rates)
+        self.path = path
+        self.completion_tokens = float(completion_tokens)
+        self.smoothing = smoothing
+        self.clock = clock
+        self.sleep = sleep
+        self._state: List[float] = [*self.capacities, clock()]
+        self._lock = threading.Lock()
+        forking.register(self)
+        self.acquired = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self.estimated_tokens = 0
+        self.actual_tokens = 0
+
+    def estimate(self, message: str) -> int:
+        """The pre-flight token estimate for a prompt."""
+        return estimate_prompt_tokens(message) + int(self.completion_tokens)
+
+    def acquire(self, message: str = None, tokens: int = None, timeout: float = None) -> int:
+        """
+        Block until one request and the estimated tokens of the prompt are
+        available, and reserve them. Returns the number of tokens reserved,
+        which must later be passed to settle(). Raises SmarterDeadlineExceededError
+        rather than wait past the current call deadline.
+        """
+        tokens = tokens if tokens is not None else self.estimate(message or "")
+        deadline = None if timeout is None else self.clock() + timeout
+        waited = 0.0
+        while True:
+            wait = self._transact(lambda state: self._reserve(state, tokens))
+            if wait <= 0:
+                break
+            if deadline is not None and self.clock() + wait > deadline:
+                raise SmarterRateLimitError(f"unable to reserve {tokens} tokens within {timeout}s")
+            current_deadline().check("RateLimiter.acquire()", wait)
+            self.sleep(wait)
+            waited += wait
+        with self._lock:
+            self.acquired += 1
+            self.throttled += 1 if waited else 0
+            self.waited += waited
+            self.estimated_tokens += tokens
+        if waited:
+            logger.debug("RateLimiter.acquire() waited %.3fs for %s tokens", waited, tokens)
+        return tokens
+
+    def settle(self, reserved: int, usage: Optional["UsageModel"]) -> None:
+        """
+        Settle a reservation against the actual usage of the response. A missing
+        usage, for example when the request failed, refunds the reserved tokens.
+        """
+        actual = usage.total_tokens if usage is not None else 0
+        self._transact(lambda state: self._adjust(state, actual - reserved))
+        with self._lock:
+            self.actual_tokens += actual
+            if usage is not None:
+                self.completion_tokens += self.smoothing * (usage.completion_tokens - self.completion_tokens)
+
+    def _refill(self, state: List[float]) -> None:
+        now = self.clock()
+        elapsed = max(0.0, now - state[2])
+        for i, (rate, capacity) in enumerate(zip(self.rates, self.capacities)):
+            state[i] = min(capacity, state[i] + elapsed * rate)
+        state[2] = now
+
+    def _reserve(self, state: List[float], tokens: int) -> float:
+        """Take one request and tokens from the buckets, or return the seconds to wait."""
+        self._refill(state)
+        # a prompt that is larger than the bucket can only ever wait for a full bucket.
+        needs = (1, min(tokens, self.capacities[1]))
+        if all(level + EPSILON >= need for level, need in zip(state, needs)):
+            state[0] -= needs[0]
+            state[1] -= tokens
+            return 0.0
+        # unlimited buckets are always full, so they never need a wait.
+        return max(
+            0.0 if math.isinf(rate) else (need - level) / rate for level, need, rate in zip(state, needs, self.rates)
+        )
+
+    def _adjust(self, state: List[float], tokens: int) -> None:
+        """Take tokens from, or refund tokens to, the tokens bucket. The bucket may go into debt."""
+        self._refill(state)
+        state[1] = min(self.capacities[1], state[1] - tokens)
+
+    def _levels(self, state: List[float]) -> List[float]:
+        self._refill(state)
+        return list(state)
+
+    def _transact(self, update: Callable[[List[float]], float]) -> float:
+        with self._lock:
+            if not self.path:
+                return update(self._state)
+            with open(self.path, "a+b") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    data = f.read(STATE_FORMAT.size)
+                    state = list(STATE_FORMAT.unpack(data)) if len(data) == STATE_FORMAT.size else list(self._state)
+                    result = update(state)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(STATE_FORMAT.pack(*state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+            return result
+
+    def levels(self) -> dict:
+        """The current levels of the buckets."""
+        state = self._transact(self._levels)
+        return {"requests": state[0], "tokens": state[1]}
+
+    def _after_fork(self) -> None:
+        # a shared limiter keeps its state in the file, so the child keeps metering against the same buckets.
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "waited_seconds": round(self.waited, 3),
+                "estimated_tokens": self.estimated_tokens,
+                "actual_tokens": self.actual_tokens,
+                "completion_tokens_estimate": round(self.completion_tokens, 1),
+                "shared": bool(self.path),
+            }
+        return stats
@@ -0,0 +1,265 @@
+"""
+smarter-api request scheduler.
+
+Interactive users and batch jobs that share a process also share its
+connections, and a batch flood adds queueing delay to every human-facing
+prompt. RequestScheduler admits prompts to a limited number of in-flight
+slots in order of:
+
+1. priority class: queued interactive prompts are always admitted before
+   queued default and batch prompts, and a number of slots are reserved for
+   interactive prompts so that they don't wait for batch prompts to finish,
+2. tenant: within a priority class, tenants take turns, so that one tenant's
+   backlog cannot starve another's,
+3. arrival: within a tenant, prompts are admitted first in, first out.
+
+Each chatbot can be given a bulkhead, a cap on its own in-flight prompts, so
+that one slow chatbot cannot occupy every slot. Prompts that wait in the queue
+for longer than their queue deadline are shed with SmarterQueueTimeoutError
+rather than being sent late.
+
+The priority, tenant and queue deadline of prompts are set for a block of
+code with scheduling():
+
+    with scheduling(priority=Priority.BATCH, tenant="nightly-report"):
+        chatbot.prompt("...")
+"""
+
+import contextvars
+import enum
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+from smarter.common import forking
+from smarter.common.exceptions import (
+    SmarterDeadlineExceededError,
+    SmarterQueueTimeoutError,
+    SmarterValueError,
+)
+from smarter.traffic.concurrency import ConcurrencyLimiter
+from smarter.traffic.deadlines import current_deadline, remaining
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+
+
+class Priority(enum.IntEnum):
+    """Priority classes, from highest to lowest."""
+
+    INTERACTIVE = 0
+    DEFAULT = 1
+    BATCH = 2
+
+
+@dataclass(frozen=True)
+class SchedulingContext:
+    """The scheduling attributes of the prompts sent from the current context."""
+
+    priority: Priority = Priority.DEFAULT
+    tenant: str = DEFAULT_TENANT
+    max_wait: Optional[float] = None
+
+
+_scheduling_context: contextvars.ContextVar = contextvars.ContextVar(
+    "smarter_scheduling_context", default=SchedulingContext()
+)
+
+
+@contextmanager
+def scheduling(priority: Priority = None, tenant: str = None, max_wait: float = None) -> Iterator[SchedulingContext]:
+    """
+    Set the priority, tenant and queue deadline (max_wait, in seconds) of the
+    prompts that are sent within the block. Unset attributes are inherited.
+    """
+    current = _scheduling_context.get()
+    context = SchedulingContext(
+        priority=Priority(priority) if priority is not None else current.priority,
+        tenant=tenant if tenant is not None else current.tenant,
+        max_wait=max_wait if max_wait is not None else current.max_wait,
+    )
+    token = _scheduling_context.set(context)
+    try:
+        yield context
+    finally:
+        _scheduling_context.reset(token)
+
+
+def current_scheduling() -> SchedulingContext:
+    return _scheduling_context.get()
+
+
+@dataclass(eq=False)
+class _Waiter:
+    chatbot: str
+    tenant: str
+    priority: Priority
+    enqueued: float
+    event: threading.Event = field(default_factory=threading.Event)
+    granted: bool = False
+
+
+class RequestScheduler:
+    """
+    Admits requests to in-flight slots by priority class, tenant and arrival.
+    The number of slots is max_in_flight, or the current limit of limiter if
+    one is given, in which case each admitted request holds one of the
+    limiter's slots too, and its outcome is recorded to it.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        limiter: ConcurrencyLimiter = None,
+        reserved: int = 1,
+        bulkheads: Dict[str, int] = None,
+        default_bulkhead: int = None,
+        max_wait: Dict[Priority, float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_in_flight < 1:
+            raise SmarterValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self.limiter = limiter
+        self.reserved = reserved
+        self.bulkheads = dict(bulkheads or {})
+        self.default_bulkhead = default_bulkhead
+        self.max_wait = dict(max_wait or {})
+        self.clock = clock
+        self.in_flight = 0
+        self._chatbot_in_flight: Dict[str, int] = {}
+        # priority -> tenant -> waiters. tenants are rotated to the end when they are served.
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[_Waiter]]"] = {p: OrderedDict() for p in Priority}
+        self._lock = threading.Lock()
+        forking.register(self)
+        self.admitted = {p.name.lower(): 0 for p in Priority}
+        self.shed = {p.name.lower(): 0 for p in Priority}
+        self.queue_seconds = {p.name.lower(): 0.0 for p in Priority}
+
+    @property
+    def capacity(self) -> int:
+        return self.limiter.limit if self.limiter is not None else self.max_in_flight
+
+    def bulkhead(self, chatbot: str) -> Optional[int]:
+        return self.bulkheads.get(chatbot, self.default_bulkhead)
+
+    @contextmanager
+    def slot(self, chatbot: str, context: SchedulingContext = None) -> Iterator[None]:
+        """Wait for an in-flight slot for a request to a chatbot, and hold it for the duration of the request."""
+        self.acquire(chatbot, context)
+        start = self.clock()
+        try:
+            yield
+        except Exception as e:
+            self.release(chatbot, self.clock() - start, e)
+            raise
+        else:
+            self.release(chatbot, self.clock() - start)
+
+    def acquire(self, chatbot: str, context: SchedulingContext = None) -> None:
+        """
+        Wait for an in-flight slot. Raises SmarterQueueTimeoutError if the request
+        waits in the queue for longer than its queue deadline, or
+        SmarterDeadlineExceededError if it waits past the current call deadline.
+        """
+        context = context or current_scheduling()
+        max_wait = context.max_wait if context.max_wait is not None else self.max_wait.get(context.priority)
+        waiter = _Waiter(chatbot=chatbot, tenant=context.tenant, priority=context.priority, enqueued=self.clock())
+        with self._lock:
+            self._queues[waiter.priority].setdefault(waiter.tenant, deque()).append(waiter)
+            self._dispatch()
+        if not waiter.event.wait(timeout=remaining(max_wait)):
+            with self._lock:
+                if not waiter.granted:
+                    self._dequeue(waiter)
+                    self.shed[waiter.priority.name.lower()] += 1
+                    if max_wait is None or current_deadline().expired:
+                        raise SmarterDeadlineExceededError(
+                            f"{waiter.priority.name.lower()} request to {chatbot} waited past the call deadline"
+                        )
+                    raise SmarterQueueTimeoutError(
+                        f"{waiter.priority.name.lower()} request to {chatbot} waited longer than {max_wait}s"
+                    )
+
+    def release(self, chatbot: str, latency: float = 0.0, error: Optional[BaseException] = None) -> None:
+        if self.limiter is not None:
+            # recorded while the request still counts as in flight, so that a full limit can grow.
+            self.limiter.record(latency, error)
+            self.limiter.release()
+        with self._lock:
+            self.in_flight -= 1
+            self._chatbot_in_flight[chatbot] -= 1
+            self._dispatch()
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        tenants = self._queues[waiter.priority]
+        waiters = tenants[waiter.tenant]
+        waiters.remove(waiter)
+        if not waiters:
+            del tenants[waiter.tenant]
+
+    def _dispatch(self) -> None:
+        """Grant slots to the waiters that are next in line, while there are slots available."""
+        while self.in_flight < self.capacity:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if self.limiter is not None and not self.limiter.acquire(timeout=0):
+                # the limiter is shared, and its other users hold the rest of its slots.
+                return
+            self._dequeue(waiter)
+            # the tenant was served, so it goes to the back of the rotation.
+            tenants = self._queues[waiter.priority]
+            if waiter.tenant in tenants:
+                tenants.move_to_end(waiter.tenant)
+            self.in_flight += 1
+            self._chatbot_in_flight[waiter.chatbot] = self._chatbot_in_flight.get(waiter.chatbot, 0) + 1
+            name = waiter.priority.name.lower()
+            self.admitted[name] += 1
+            self.queue_seconds[name] += self.clock() - waiter.enqueued
+            waiter.granted = True
+            waiter.event.set()
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        # at least one slot is always available to every priority class.
+        reserved = min(self.reserved, self.capacity - 1)
+        for priority in Priority:
+            if priority != Priority.INTERACTIVE and self.in_flight >= self.capacity - reserved:
+                return None
+            for waiters in self._queues[priority].values():
+                for waiter in waiters:
+                    bulkhead = self.bulkhead(waiter.chatbot)
+                    if bulkhead is None or self._chatbot_in_flight.get(waiter.chatbot, 0) < bulkhead:
+                        return waiter
+        return None
+
+    def _after_fork(self) -> None:
+        # in-flight and queued requests belong to the parent's threads, so the child starts empty.
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self._chatbot_in_flight = {}
+        self._queues = {p: OrderedDict() for p in Priority}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "queued": {
+                    priority.name.lower(): sum(len(waiters) for waiters in self._queues[priority].values())
+                    for priority in Priority
+                },
+                "admitted": dict(self.admitted),
+                "shed": dict(self.shed),
+                "mean_queue_seconds": {
+                    name: round(self.queue_seconds[name] / count, 4) if count else 0.0
+                    for name, count in self.admitted.items()
+                },
+                "chatbots_in_flight": {name: count for name, count in self._chatbot_in_flight.items() if count},
+            }
@@ -0,0 +1,69 @@
+"""
+smarter-api adaptive read timeouts.
+
+A single read timeout is either too short for slow endpoints, such as prompts
+to a large model, or far too long for fast ones, such as cli/whoami/, where a
+stalled connection then holds up the caller for the whole timeout. An
+AdaptiveTimeouts learns the read timeout of each endpoint from a high
+percentile of its observed latency, times a safety multiplier, clamped to
+[min_timeout, max_timeout]. Until enough latencies have been observed for an
+endpoint, max_timeout is used.
+"""
+
+import threading
+from collections import deque
+from typing import Deque, Dict
+
+from smarter.common import forking
+from smarter.common.conf import settings as smarter_settings
+from smarter.common.exceptions import SmarterValueError
+from smarter.traffic.hedging import percentile
+
+
+class AdaptiveTimeouts:
+    """Per-endpoint read timeouts learned from observed latency percentiles."""
+
+    def __init__(
+        self,
+        quantile: float = 0.99,
+        multiplier: float = 3.0,
+        min_timeout: float = 1.0,
+        max_timeout: float = None,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        if not 0 < quantile < 1:
+            raise SmarterValueError("quantile must be between 0 and 1")
+        if multiplier < 1:
+            raise SmarterValueError("multiplier must be at least 1")
+        self.quantile = quantile
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout or float(
+            smarter_settings.smarter_read_timeout or smarter_settings.smarter_default_http_timeout
+        )
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        forking.register(self)
+
+    def observe(self, endpoint: str, latency: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(endpoint, deque(maxlen=self.window)).append(latency)
+
+    def read_timeout(self, endpoint: str) -> float:
+        with self._lock:
+            samples = list(self._latencies.get(endpoint, ()))
+        if len(samples) < self.min_samples:
+            return self.max_timeout
+        timeout = percentile(samples, self.quantile) * self.multiplier
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = [endpoint for endpoint, samples in self._latencies.items() if samples]
+        return {endpoint: round(self.read_timeout(endpoint), 3) for endpoint in endpoints}
@@ -0,0 +1,5 @@
+# pylint: disable=missing-module-docstring
+from .ledger import LedgerTable, UsageLedger
+
+
+__all__ = ["LedgerTable", "UsageLedger"]
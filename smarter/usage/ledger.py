@@ -0,0 +1,403 @@
+"""
+smarter-api usage ledger.
+
+An optional, append-only record of the usage and latency of every prompt that
+reaches the platform, for cost reports over millions of calls:
+
+    ledger = UsageLedger("usage.ledger")
+    client = Smarter(api_key=..., usage_ledger=ledger)
+    ...
+    ledger.flush()
+    report = LedgerTable.load("usage.ledger").aggregate(by=["chatbot", "hour"])
+
+Each call is one row of compact, array-backed columns: its timestamp and the
+response's created time, its latency, its prompt, completion, total, cached and
+reasoning tokens, and the chatbot, model and tenant, which are dictionary
+encoded as small integer codes. A row costs 52 bytes, against a kilobyte or
+more for the PromptResponseModel it came from. The tenant is the one set with
+smarter.traffic.scheduling(). Prompt cache hits aren't recorded, since they
+cost nothing.
+
+flush() appends the rows in memory to a columnar file, one segment per flush,
+in which each column is stored contiguously in its native binary form, so that
+loading a column is a single read with no parsing. Each segment ends with a
+checksum, so that a segment torn by a crash is skipped when the file is
+loaded, along with its rows, rather than making the whole file unreadable. If
+writing a segment fails, its rows are kept in memory for the next flush. LedgerTable.aggregate()
+groups rows by any of chatbot, model, tenant and hour and sums their tokens and
+latency. Its sums are vectorized with numpy, if it is installed, and otherwise
+take one tight pass over each column.
+"""
+
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from smarter.common import forking
+from smarter.common.exceptions import SmarterValueError
+
+
+logger = logging.getLogger(__name__)
+
+LEDGER_MAGIC = b"SMLG"
+LEDGER_END = b"SMLE"
+LEDGER_VERSION = 2
+# a segment is the magic and the size of its json header, the header, the columns,
+# and a trailer of the end marker and the crc32 of everything before it.
+SEGMENT_PREFIX = struct.Struct("<4sI")
+SEGMENT_TRAILER = struct.Struct("<4sI")
+# name -> array typecode. Codes index the ledger's dictionary of each string column.
+COLUMNS = {
+    "timestamp": "d",
+    "created": "q",
+    "latency": "f",
+    "prompt_tokens": "I",
+    "completion_tokens": "I",
+    "total_tokens": "I",
+    "cached_tokens": "I",
+    "reasoning_tokens": "I",
+    "chatbot": "I",
+    "model": "I",
+    "tenant": "I",
+}
+STRING_COLUMNS = ["chatbot", "model", "tenant"]
+TOKEN_COLUMNS = ["prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens", "reasoning_tokens"]
+GROUPS = STRING_COLUMNS + ["hour"]
+
+
+def empty_columns() -> Dict[str, array]:
+    return {name: array(typecode) for name, typecode in COLUMNS.items()}
+
+
+def _numpy():
+    """numpy, which is an optional dependency, or None."""
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        return numpy
+    except ImportError:
+        return None
+
+
+class LedgerTable:
+    """Columns of ledger rows, and the dictionaries of their string columns."""
+
+    def __init__(self, columns: Dict[str, array] = None, dictionaries: Dict[str, List[str]] = None):
+        self.columns = columns if columns is not None else empty_columns()
+        self.dictionaries = dictionaries if dictionaries is not None else {name: [] for name in STRING_COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def extend(self, other: "LedgerTable") -> None:
+        """Append the rows of other, re-encoding its string columns into this table's dictionaries."""
+        for name in STRING_COLUMNS:
+            values = self.dictionaries[name]
+            index = {value: code for code, value in enumerate(values)}
+            remap = []
+            for value in other.dictionaries[name]:
+                if value not in index:
+                    index[value] = len(values)
+                    values.append(value)
+                remap.append(index[value])
+            codes = other.columns[name]
+            if remap != list(range(len(remap))):
+                codes = array("I", [remap[code] for code in codes])
+            self.columns[name].extend(codes)
+        for name in COLUMNS:
+            if name not in STRING_COLUMNS:
+                self.columns[name].extend(other.columns[name])
+
+    def column(self, name: str) -> list:
+        """The values of a column, with string columns decoded."""
+        if name in STRING_COLUMNS:
+            values = self.dictionaries[name]
+            return [values[code] for code in self.columns[name]]
+        return self.columns[name].tolist()
+
+    def rows(self) -> Iterable[dict]:
+        names = list(COLUMNS)
+        for row in zip(*(self.column(name) for name in names)):
+            yield dict(zip(names, row))
+
+    @classmethod
+    def load(cls, path: str) -> "LedgerTable":
+        """
+        Read every segment of a ledger file. Torn or corrupt segments are logged
+        and skipped.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        if data and not data.startswith(LEDGER_MAGIC):
+            raise SmarterValueError(f"{path} is not a smarter usage ledger")
+        table = cls()
+        offset = 0
+        while offset < len(data):
+            segment, end = cls.read_segment(path, data, offset)
+            if segment is None:
+                # a torn segment; the next one, if any, starts at the next magic.
+                end = data.find(LEDGER_MAGIC, offset + 1)
+                end = end if end >= 0 else len(data)
+                logger.warning("LedgerTable.load() skipped %s bytes of a torn segment of %s", end - offset, path)
+            else:
+                table.extend(segment)
+            offset = end
+        return table
+
+    @classmethod
+    def read_segment(cls, path: str, data: bytes, offset: int) -> Tuple[Optional["LedgerTable"], int]:
+        """The segment at offset in data and the offset of its end, or None if it is torn."""
+        if offset + SEGMENT_PREFIX.size > len(data):
+            return None, offset
+        magic, header_size = SEGMENT_PREFIX.unpack_from(data, offset)
+        header_start = offset + SEGMENT_PREFIX.size
+        start = header_start + header_size
+        try:
+            header = json.loads(data[header_start:start])
+            rows = header["rows"]
+        except (ValueError, TypeError, KeyError):
+            return None, offset
+        if header.get("version") != LEDGER_VERSION or header.get("columns") != COLUMNS:
+            raise SmarterValueError(f"{path} has a segment of another version or with other columns")
+        end = start + rows * sum(array(typecode).itemsize for typecode in COLUMNS.values())
+        if magic != LEDGER_MAGIC or end + SEGMENT_TRAILER.size > len(data):
+            return None, offset
+        marker, checksum = SEGMENT_TRAILER.unpack_from(data, end)
+        view = memoryview(data)
+        if marker != LEDGER_END or checksum != zlib.crc32(view[offset:end]):
+            return None, offset
+        segment = cls(dictionaries=header["dictionaries"])
+        for name in COLUMNS:
+            column = segment.columns[name]
+            stop = start + rows * column.itemsize
+            column.frombytes(view[start:stop])
+            if sys.byteorder != "little":
+                column.byteswap()
+            start = stop
+        return segment, end + SEGMENT_TRAILER.size
+
+    def keys(self, by: List[str]) -> Tuple[list, list]:
+        """
+        A group code for every row, from the columns by, and the (name, cardinality,
+        base) of each of those columns, with which decode() recovers their values.
+        """
+        codes = [0] * len(self)
+        specs = []
+        for name in by:
+            if name == "hour":
+                column = [int(timestamp // 3600) for timestamp in self.columns["timestamp"]]
+                base = min(column, default=0)
+                column = [value - base for value in column]
+                specs.append((name, max(column, default=0) + 1, base))
+            elif name in STRING_COLUMNS:
+                column = self.columns[name]
+                specs.append((name, max(1, len(self.dictionaries[name])), 0))
+            else:
+                raise SmarterValueError(f"a ledger can be grouped by {', '.join(GROUPS)}, not {name}")
+            cardinality = specs[-1][1]
+            codes = [code * cardinality + value for code, value in zip(codes, column)]
+        return codes, specs
+
+    def decode(self, specs: list, code: int) -> tuple:
+        """The group values of a group code."""
+        values = []
+        for name, cardinality, base in reversed(specs):
+            code, value = divmod(code, cardinality)
+            values.append((base + value) * 3600 if name == "hour" else self.dictionaries[name][value])
+        return tuple(reversed(values))
+
+    def aggregate(self, by: Iterable[str] = ("chatbot",)) -> Dict[tuple, dict]:
+        """
+        Group the rows by the columns by, any of chatbot, model, tenant and hour,
+        and return the calls, the sum of each token column, and the total and mean
+        latency of each group, keyed by a tuple of the group's values. Hours are the
+        unix time of the start of the hour.
+        """
+        codes, specs = self.keys(list(by))
+        # number the groups densely, in order of their codes, so that each sum is a list index.
+        groups = sorted(set(codes))
+        dense = {code: index for index, code in enumerate(groups)}
+        inverse = [dense[code] for code in codes]
+        numpy = _numpy()
+        sums = {}
+        for name in ["calls"] + TOKEN_COLUMNS + ["latency"]:
+            if numpy is not None:
+                weights = (
+                    None if name == "calls" else numpy.frombuffer(self.columns[name], dtype=self.columns[name].typecode)
+                )
+                sums[name] = numpy.bincount(inverse, weights=weights, minlength=len(groups)).tolist()
+                continue
+            total = [0] * len(groups)
+            if name == "calls":
+                for index in inverse:
+                    total[index] += 1
+            else:
+                for index, value in zip(inverse, self.columns[name]):
+                    total[index] += value
+            sums[name] = total
+        report = {}
+        for index, code in enumerate(groups):
+            group = {name: int(sums[name][index]) for name in ["calls"] + TOKEN_COLUMNS}
+            group["latency"] = float(sums["latency"][index])
+            group["latency_mean"] = group["latency"] / group["calls"]
+            report[self.decode(specs, code)] = group
+        return report
+
+
+class UsageLedger:
+    """
+    Records the usage of each prompt into columns in memory, and appends them to
+    path with flush(). With flush_every, the rows are flushed whenever there are
+    that many, so that memory stays bounded.
+    """
+
+    def __init__(self, path: str = None, flush_every: int = None, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.flush_every = flush_every
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._table = LedgerTable()
+        self._codes: Dict[str, Dict[str, int]] = {name: {} for name in STRING_COLUMNS}
+        forking.register(self)
+
+    def _after_fork(self) -> None:
+        # the parent flushes its own rows; a child starts empty, so they aren't counted twice.
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._table = LedgerTable()
+        self._codes = {name: {} for name in STRING_COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def _code(self, name: str, value: Optional[str]) -> int:
+        value = value or ""
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self._table.dictionaries[name].append(value)
+        return code
+
+    def record(
+        self,
+        chatbot: str,
+        model: Optional[str],
+        tenant: Optional[str],
+        usage: dict,
+        latency: float,
+        created: int = 0,
+        timestamp: float = None,
+    ) -> None:
+        """Record one call. usage has the token counts of a UsageModel, flattened as in parse_response()."""
+        full = False
+        with self._lock:
+            columns = self._table.columns
+            columns["timestamp"].append(self.clock() if timestamp is None else timestamp)
+            columns["created"].append(created or 0)
+            columns["latency"].append(latency)
+            for name in TOKEN_COLUMNS:
+                columns[name].append(usage.get(name, 0))
+            columns["chatbot"].append(self._code("chatbot", chatbot))
+            columns["model"].append(self._code("model", model))
+            columns["tenant"].append(self._code("tenant", tenant))
+            full = self.flush_every is not None and len(self._table) >= self.flush_every
+        if full:
+            self.flush()
+
+    def record_response(self, chatbot: str, response, latency: float, tenant: str = None) -> None:
+        """Record the usage of a PromptResponseModel."""
+        body = response.data.response.data.body
+        usage = body.usage
+        self.record(
+            chatbot=chatbot,
+            model=body.model,
+            tenant=tenant,
+            usage={
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+                "cached_tokens": usage.prompt_tokens_details.cached_tokens,
+                "reasoning_tokens": usage.completion_tokens_details.reasoning_tokens,
+            },
+            latency=latency,
+            created=body.created,
+        )
+
+    def table(self) -> LedgerTable:
+        """A copy of the rows in memory, which haven't been flushed."""
+        with self._lock:
+            table = LedgerTable()
+            table.extend(self._table)
+        return table
+
+    def load(self) -> LedgerTable:
+        """The rows of the ledger's file, followed by the rows in memory."""
+        table = LedgerTable.load(self.path) if self.path and os.path.exists(self.path) else LedgerTable()
+        table.extend(self.table())
+        return table
+
+    def flush(self, path: str = None) -> int:
+        """Append the rows in memory to path, or the ledger's path, as one segment. Returns the rows written."""
+        path = path or self.path
+        if path is None:
+            raise SmarterValueError("UsageLedger.flush() needs a path")
+        with self._lock:
+            table, self._table = self._table, LedgerTable()
+            self._codes = {name: {} for name in STRING_COLUMNS}
+        rows = len(table)
+        if not rows:
+            return 0
+        header = json.dumps(
+            {"version": LEDGER_VERSION, "rows": rows, "columns": COLUMNS, "dictionaries": table.dictionaries},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        chunks = [SEGMENT_PREFIX.pack(LEDGER_MAGIC, len(header)), header]
+        for name in COLUMNS:
+            column = table.columns[name]
+            if sys.byteorder != "little":
+                column = array(column.typecode, column)
+                column.byteswap()
+            chunks.append(column.tobytes())
+        segment = b"".join(chunks)
+        segment += SEGMENT_TRAILER.pack(LEDGER_END, zlib.crc32(segment))
+        try:
+            self._append(path, segment)
+        except BaseException:
+            self._restore(table)
+            raise
+        logger.debug("UsageLedger.flush() appended %s rows to %s", rows, path)
+        return rows
+
+    def _append(self, path: str, segment: bytes) -> None:
+        # unbuffered, so that nothing of a failed write is left to be flushed when the file is closed.
+        with self._write_lock, open(path, "ab", buffering=0) as f:
+            start = f.seek(0, os.SEEK_END)
+            try:
+                written = 0
+                while written < len(segment):
+                    written += f.write(segment[written:])
+                os.fsync(f.fileno())
+            except BaseException:
+                # the rows are written again by the next flush, so none of this segment may remain.
+                if os.fstat(f.fileno()).st_size <= start + len(segment):
+                    f.truncate(start)
+                raise
+
+    def _restore(self, table: LedgerTable) -> None:
+        """Put the rows of a failed flush back in front of the rows recorded since."""
+        with self._lock:
+            table.extend(self._table)
+            self._table = table
+            self._codes = {
+                name: {value: code for code, value in enumerate(values)} for name, values in table.dictionaries.items()
+            }
+        logger.warning("UsageLedger.flush() failed, and kept %s rows in memory", len(table))